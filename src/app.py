@@ -1,12 +1,28 @@
 import streamlit as st
 import asyncio
 from fastmcp import Client
+import base64
 import json
+import os
+import time
 import uuid
+from urllib.parse import quote
+from mcp.types import TextContent
 import nest_asyncio
+from tools.chat_history import HistoricoChat
 
 nest_asyncio.apply()
 
+MCP_URL = "http://127.0.0.1:8005/sse"
+
+# Pedidos demorados (gráficos, análises) vão para o modo assíncrono do servidor
+PALAVRAS_MODO_ASSINCRONO = ["gráfico", "grafico", "dashboard", "visualização", "análise", "analise"]
+
+# Quantas mensagens ficam em memória e são renderizadas a cada rerun; as anteriores são carregadas sob demanda
+JANELA_HISTORICO = int(os.getenv("FINANCEBOT_JANELA_HISTORICO", "20"))
+
+inicio_rerun = time.perf_counter()
+
 # Configuração da página (da ideia do app.py)
 st.set_page_config(
     page_title="Assistente Financeiro",
@@ -25,10 +41,52 @@ if "user_id" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Exibir histórico de mensagens
-for message in st.session_state.messages:
+# Mensagens mais antigas que a janela, carregadas do histórico pelo botão
+if "anteriores" not in st.session_state:
+    st.session_state.anteriores = []
+
+if "tempos_render" not in st.session_state:
+    st.session_state.tempos_render = []
+
+
+@st.cache_resource
+def obter_historico() -> HistoricoChat:
+    return HistoricoChat()
+
+historico = obter_historico()
+
+
+def adicionar_mensagem(message: dict):
+    """Grava a mensagem no histórico e mantém em memória só as últimas JANELA_HISTORICO."""
+    historico.adicionar(st.session_state.user_id, message)
+    st.session_state.messages.append(message)
+    mensagens = st.session_state.messages
+    # Mensagens com tarefa pendente continuam na janela até concluir
+    while len(mensagens) > JANELA_HISTORICO and not mensagens[0].get("pendente"):
+        antiga = mensagens.pop(0)
+        if st.session_state.anteriores:
+            st.session_state.anteriores.append(antiga)
+
+
+def renderizar_mensagem(message: dict):
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
+        for imagem in message.get("imagens", []):
+            st.image(imagem)
+
+
+# Exibir histórico de mensagens
+inicio_historico = time.perf_counter()
+exibidas = st.session_state.anteriores + st.session_state.messages
+if exibidas and historico.existe_anterior(st.session_state.user_id, exibidas[0]["id"]):
+    if st.button("⬆️ Carregar mensagens anteriores"):
+        st.session_state.anteriores = historico.anteriores(
+            st.session_state.user_id, exibidas[0]["id"], JANELA_HISTORICO
+        ) + st.session_state.anteriores
+        st.rerun()
+for message in exibidas:
+    renderizar_mensagem(message)
+tempo_historico_ms = (time.perf_counter() - inicio_historico) * 1000
 
 def extract_text_frontend(obj, level=0):
     """
@@ -80,55 +138,171 @@ def extract_text_frontend(obj, level=0):
     return "" # Retorna vazio se nenhum texto for encontrado
 
 
+def texto_resposta(result) -> str:
+    """
+    Caminho rápido para o CallToolResult das tools do servidor (só TextContent): junta os textos
+    direto, sem reflexão. Outros formatos caem no extract_text_frontend.
+    """
+    conteudo = getattr(result, "content", result)
+    if isinstance(conteudo, list) and conteudo and all(isinstance(c, TextContent) for c in conteudo):
+        return "\n".join(c.text for c in conteudo)
+    return extract_text_frontend(result)
+
+
+def cliente_mcp(user_id: str) -> Client:
+    """Cliente MCP com o usuário na URL, usado pelo modo multi-worker para fixar o usuário no mesmo worker."""
+    return Client(f"{MCP_URL}?user_id={quote(user_id)}")
+
+
+def chave_idempotencia(question: str, user_id: str) -> str:
+    """
+    Uma chave nova por prompt enviado, guardada na sessão até o envio dar certo: se o mesmo prompt
+    for reenviado depois de uma falha ou timeout (retry), a chave se repete e o servidor não registra
+    a transação duas vezes; um prompt igual enviado depois é uma nova transação.
+    """
+    pergunta = " ".join(question.lower().split())
+    envio = st.session_state.get("envio_pendente")
+    if envio and envio["user_id"] == user_id and envio["pergunta"] == pergunta:
+        return envio["chave"]
+    chave = uuid.uuid4().hex
+    st.session_state.envio_pendente = {"user_id": user_id, "pergunta": pergunta, "chave": chave}
+    return chave
+
+
+def concluir_envio():
+    """O servidor recebeu o prompt: o próximo envio, mesmo com o mesmo texto, ganha outra chave."""
+    st.session_state.pop("envio_pendente", None)
+
+
 # Chamada assíncrona para o MCP
-async def call_agent(question: str, user_id: str):
+async def call_agent(question: str, user_id: str, idempotency_key: str | None = None):
     """Chama o 'assistente_financeiro_inteligente' tool no servidor MCP."""
-    client = Client("http://127.0.0.1:8005/sse")
+    client = cliente_mcp(user_id)
     async with client:
         result = await client.call_tool(
-            "assistente_financeiro_inteligente", {"question": question, "user_id": user_id}
+            "assistente_financeiro_inteligente",
+            {"question": question, "user_id": user_id, "idempotency_key": idempotency_key}
         )
         return result
 
 
+def usa_modo_assincrono(question: str) -> bool:
+    q = question.lower()
+    return any(p in q for p in PALAVRAS_MODO_ASSINCRONO)
+
+
+async def enviar_tarefa(question: str, user_id: str, idempotency_key: str | None = None) -> dict:
+    """Envia a pergunta para a fila de tarefas do servidor e retorna o status inicial (com o id)."""
+    async with cliente_mcp(user_id) as client:
+        result = await client.call_tool(
+            "enviar_tarefa", {"question": question, "user_id": user_id, "idempotency_key": idempotency_key}
+        )
+        return json.loads(texto_resposta(result))
+
+
+async def atualizar_tarefa(message: dict, user_id: str) -> bool:
+    """Consulta a tarefa da mensagem; se terminou, baixa os PNGs, descarta no servidor e retorna True."""
+    async with cliente_mcp(user_id) as client:
+        result = await client.call_tool("status_tarefa", {"job_id": message["job_id"]})
+        status = json.loads(texto_resposta(result))
+        if status["status"] in ("pendente", "executando"):
+            return False
+
+        imagens = []
+        for uri in status.get("recursos", []):
+            for conteudo in await client.read_resource(uri):
+                if getattr(conteudo, "blob", None):
+                    imagens.append(base64.b64decode(conteudo.blob))
+
+        await client.call_tool("descartar_tarefa", {"job_id": message["job_id"]})
+
+    if status["status"] == "concluido":
+        message["content"] = status["resultado"]
+    else:
+        message["content"] = f"❌ Erro ao processar: {status.get('erro') or 'tarefa não encontrada'}"
+    message["imagens"] = imagens
+    message["pendente"] = False
+    return True
+
+
+@st.fragment(run_every=2)
+def acompanhar_tarefas():
+    """Verifica periodicamente as tarefas em andamento sem bloquear o chat."""
+    concluidas = 0
+    for message in st.session_state.messages:
+        if message.get("pendente"):
+            try:
+                concluiu = asyncio.run(atualizar_tarefa(message, st.session_state.user_id))
+            except Exception as e:
+                message.update(content=f"❌ Erro ao consultar tarefa: {e}", pendente=False)
+                concluiu = True
+            if concluiu:
+                historico.atualizar(message)
+                concluidas += 1
+    if concluidas:
+        st.rerun()
+
+
 # Lógica do chat
 if prompt := st.chat_input("Digite sua pergunta aqui..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    adicionar_mensagem({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    with st.chat_message("assistant"):
-        with st.spinner("🤖 Processando..."):
-            try:
-                response = asyncio.run(call_agent(prompt, st.session_state.user_id))
-                clean_response = extract_text_frontend(response)
+    idempotency_key = chave_idempotencia(prompt, st.session_state.user_id)
+
+    if usa_modo_assincrono(prompt):
+        try:
+            tarefa = asyncio.run(enviar_tarefa(prompt, st.session_state.user_id, idempotency_key))
+            if tarefa["status"] == "erro":
+                raise RuntimeError(tarefa["erro"])
+            concluir_envio()
+            mensagem = {"role": "assistant", "content": "⏳ Estou preparando isso em segundo plano, "
+                        "o resultado aparece aqui assim que ficar pronto.", "job_id": tarefa["id"], "pendente": True}
+        except Exception as e:
+            mensagem = {"role": "assistant", "content": f"❌ Erro ao enviar tarefa: {e}"}
+        with st.chat_message("assistant"):
+            st.markdown(mensagem["content"])
+        adicionar_mensagem(mensagem)
+
+    else:
+        with st.chat_message("assistant"):
+            with st.spinner("🤖 Processando..."):
+                try:
+                    response = asyncio.run(call_agent(prompt, st.session_state.user_id, idempotency_key))
+                    concluir_envio()
+                    clean_response = texto_resposta(response)
                 
-                if not clean_response:
-                    # Fallback para exibir o JSON se nenhum texto claro for extraído
-                    # Converte CallToolResult para dict antes de serializar
-                    if hasattr(response, '__dict__'):
-                        response_dict = response.__dict__
-                    elif hasattr(response, 'model_dump'):
-                        response_dict = response.model_dump()
-                    else:
-                        response_dict = str(response)
+                    if not clean_response:
+                        # Fallback para exibir o JSON se nenhum texto claro for extraído
+                        # Converte CallToolResult para dict antes de serializar
+                        if hasattr(response, '__dict__'):
+                            response_dict = response.__dict__
+                        elif hasattr(response, 'model_dump'):
+                            response_dict = response.model_dump()
+                        else:
+                            response_dict = str(response)
                     
-                    try:
-                        pretty_response = json.dumps(response_dict, indent=2, ensure_ascii=False, default=str)
-                        clean_response = f"Não foi possível extrair uma resposta em texto. Resposta completa:\n```json\n{pretty_response}\n```"
-                    except Exception as json_error:
-                        clean_response = f"Não foi possível extrair uma resposta em texto. Resposta (formato string):\n```\n{str(response)}\n```"
+                        try:
+                            pretty_response = json.dumps(response_dict, indent=2, ensure_ascii=False, default=str)
+                            clean_response = f"Não foi possível extrair uma resposta em texto. Resposta completa:\n```json\n{pretty_response}\n```"
+                        except Exception as json_error:
+                            clean_response = f"Não foi possível extrair uma resposta em texto. Resposta (formato string):\n```\n{str(response)}\n```"
                 
-                st.markdown(clean_response)
-            except Exception as e:
-                import traceback
-                tb = traceback.format_exc()
-                clean_response = f"❌ Erro ao processar: {e}\n\nTraceback:\n{tb}"
-                st.markdown(clean_response)
+                    st.markdown(clean_response)
+                except Exception as e:
+                    import traceback
+                    tb = traceback.format_exc()
+                    clean_response = f"❌ Erro ao processar: {e}\n\nTraceback:\n{tb}"
+                    st.markdown(clean_response)
+
+        adicionar_mensagem(
+            {"role": "assistant", "content": clean_response}
+        )
 
-    st.session_state.messages.append(
-        {"role": "assistant", "content": clean_response}
-    )
+# Acompanha tarefas assíncronas enquanto houver alguma em andamento
+if any(m.get("pendente") for m in st.session_state.messages):
+    acompanhar_tarefas()
 
 # Barra lateral com informações (da ideia do app.py)
 with st.sidebar:
@@ -163,6 +337,8 @@ with st.sidebar:
     
     if st.button("🧹 Limpar Histórico"):
         st.session_state.messages = []
+        st.session_state.anteriores = []
+        historico.limpar(st.session_state.user_id)
         # Nota: Isso limpa apenas o histórico da interface.
         # A memória do agente no servidor é mantida pelo user_id.
         st.rerun()
@@ -170,6 +346,9 @@ with st.sidebar:
     st.header("👤 Informações")
     st.markdown(f"**ID do Usuário:** `{st.session_state.user_id[:8]}...`")
 
+    st.header("⏱️ Desempenho")
+    painel_desempenho = st.empty()
+
 # Rodapé (da ideia do app.py)
 st.markdown("---")
 st.markdown("""
@@ -178,3 +357,11 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Tempo deste rerun (preenchido no fim, quando tudo já foi renderizado)
+tempo_rerun_ms = (time.perf_counter() - inicio_rerun) * 1000
+st.session_state.tempos_render = (st.session_state.tempos_render + [tempo_rerun_ms])[-50:]
+media_ms = sum(st.session_state.tempos_render) / len(st.session_state.tempos_render)
+painel_desempenho.caption(
+    f"Rerun: {tempo_rerun_ms:.0f} ms (média {media_ms:.0f} ms)  \n"
+    f"Histórico: {tempo_historico_ms:.0f} ms para {len(exibidas)} mensagens"
+)
@@ -2,16 +2,31 @@
 
 from dotenv import load_dotenv
 import os
+import json
+import asyncio
+import hmac
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 from fastmcp import FastMCP
 
-from langchain_openai import ChatOpenAI
 from crewai import Agent, Task, Crew, Process
 from crewai.memory import EntityMemory
-from crewai.memory.storage.rag_storage import RAGStorage
 from crewai_tools.adapters.mcp_adapter import MCPServerAdapter
 from tools.relative_date_resolver import resolve_relative_date
+from tools.context_budget import ContextBudgeter
+from tools.model_router import ModelRouter
+from tools.chart_renderer import renderizar_graficos
+from tools.jobs import STATUS_ERRO, JobManager
+from tools.dedup import RequestDeduplicator, chave_requisicao
+from tools.shared_cache import criar_backend, RateLimiter
+from tools.tool_wrappers import envolver_com_cache
+from tools.ledger import LivroLocal, SincronizadorSupabase, filtro_sem_duplicatas, validar_transacao
+from tools.cassettes import Cassete, cassete_atual, modo_cassete, usar_cassete, DIRETORIO_CASSETES
+from tools.profiler import Perfilador
+from tools.portfolio import Carteira, PosicaoInsuficiente, validar_operacao, cotar_em_lote, avaliar_carteira
+from tools.trace_sink import ColetorRastros
 
 load_dotenv()
 mcp = FastMCP("assistente_financeiro_inteligente")
@@ -38,27 +53,43 @@ def try_initialize_mcp_adapter(params, name):
 from crewai.memory import EntityMemory
 memoria_nova = EntityMemory()  # isso é uma memória "zerada"
 
-# === PARTE 2: Memória isolada e classificação de conversa ===
-
-def get_session_memory(user_id: str, session_id: str):
-    return EntityMemory(
-        storage=RAGStorage(
-            embedder_config={
-                "provider": "openai",
-                "config": {"model": "text-embedding-3-small"},
-            },
-            type="short_term",
-            path=f"./memory_store/{user_id}/{session_id}/",
-        )
-    )
+# Contexto de conversa com orçamento de tokens por etapa (substitui a memória ilimitada das crews)
+budgeter = ContextBudgeter()
+
+# Modelo, max_tokens e temperatura por papel de agente (ver tools/model_router.py)
+router = ModelRouter()
+
+# Estado compartilhado entre workers (cotações, deduplicação, limite de taxa)
+cache = criar_backend()
+TTL_COTACOES_S = int(os.getenv("FINANCEBOT_TTL_COTACOES_S", "60"))
+limitador = RateLimiter(cache, int(os.getenv("FINANCEBOT_LIMITE_REQ_MIN", "30")))
 
-def is_new_conversation(question: str) -> bool:
-    q = question.strip().lower()
-    if q in {"sim", "não", "confirmar", "cancelar", "ok", "certo"} or q.isdigit():
-        return False
-    if any(p in q for p in ["gastei", "recebi", "investi", "preço", "cotação", "valor", "quanto", "quero", "oi", "olá", "gráfico", "grafico"]):
-        return True
-    return len(q.split()) > 1
+# === PARTE 2: Utilitários de resposta e contexto ===
+
+def extrair_json(texto: str):
+    """Lê o JSON da resposta do LLM, tolerando cercas de código e texto ao redor. Retorna None se inválido."""
+    texto = texto.strip()
+    if texto.startswith("```"):
+        texto = texto.strip("`").removeprefix("json").strip()
+    try:
+        return json.loads(texto)
+    except ValueError:
+        pass
+    inicio, fim = texto.find("{"), texto.rfind("}")
+    if inicio != -1 and fim > inicio:
+        try:
+            return json.loads(texto[inicio:fim + 1])
+        except ValueError:
+            pass
+    return None
+
+def bloco_contexto(contexto: str) -> str:
+    if not contexto:
+        return ""
+    return f"""
+    🧠 CONTEXTO DA CONVERSA (use somente se for relevante para o pedido atual):
+    {contexto}
+    """
 
 # === PARTE 3: Agente Classificador + Orquestrador ===
 
@@ -84,15 +115,105 @@ def criar_agente_orquestrador(tools, llm):
         allow_delegation=True
     )
 
+def crew_classificacao(tools, llm, contexto, question):
+    classificador = criar_agente_classificador(tools, llm)
+
+    classificacao_task = Task(
+        description=f"""
+        📥 Sua missão é analisar a seguinte frase: "{question}" e **obrigatoriamente** gerar um objeto JSON nos seguintes formatos:
+
+        📋 CONTROLE_FINANCEIRO:
+
+        - CASO 1 (INSERÇÃO DE DADOS):
+        {{
+        "classificacao": "CONTROLE_FINANCEIRO" ,
+        "status": "COMPLETO",
+        "dados": {{
+            "valor": 1500.00,
+            "tipo": "receita" | "despesa",
+            "conta_id": 5, // Use sempre conta_id=5 se não informado
+            "categoria": "Alimentação",
+            "data_transacao": "2025-07-20 | hoje | ontem | anteontem | 15/07/2025",
+            "descricao": "Descrição livre da transação"
+            }}
+        }}
+
+        - CASO 1.1 (COMPRA OU VENDA DE ATIVOS): mesmo formato do CASO 1 (categoria "Investimentos", valor = total
+        da operação) com o objeto "ativo" dentro de "dados":
+            "ativo": {{
+                "simbolo": "PETR4",
+                "quantidade": 10,
+                "preco_unitario": 30.50,
+                "operacao": "compra" | "venda"
+            }}
+
+        - CASO 2 (CONSULTA DE DADOS):
+        {{  
+        "classificacao": "CONTROLE_FINANCEIRO",
+        "status": "COMPLETO",
+            "dados": {{
+                "consulta": "descrição do pedido feito pelo usuário"
+            }}
+        }}
+
+        - CASO 3 (CONSULTA DA CARTEIRA: valor, rentabilidade ou composição dos investimentos do usuário):
+        {{
+        "classificacao": "CONTROLE_FINANCEIRO",
+        "status": "COMPLETO",
+            "dados": {{
+                "consulta": "descrição do pedido feito pelo usuário",
+                "carteira": true
+            }}
+        }}
+
+        📋 CONSULTA_ATIVO:
+        {{
+        "classificacao": "CONSULTA_ATIVO",
+        "status": "COMPLETO",
+        "dados": {{
+            "simbolo": "PETR4",
+            "tipo_consulta": "cotacao" | "analise"
+            }}
+        }}
+
+        📋 GERAR_GRAFICO:
+        {{
+        "classificacao": "GERAR_GRAFICO",
+        "status": "COMPLETO",
+        "dados": {{
+            "tipo_grafico": "receitas_despesas_categoria",
+            "periodo": "ultimo_mes" | "ultimos_3_meses" | "ano_atual"
+            }}
+        }}
+
+        ⚠️ Regras obrigatórias:
+        - NÃO SAIA dos 4 possíveis formatos acima.
+        - NÃO inclua observações, explicações ou textos soltos.
+        - SEMPRE inclua status="COMPLETO"
+        - Sempre que possível, preencha a descrição com base na frase original
+        - Use GERAR_GRAFICO quando o usuário pedir gráficos, análise visual, dashboard ou visualização
+        {bloco_contexto(contexto)}""",
+        expected_output="Objeto JSON {dados_json} estruturado como especificado acima",
+        agent=classificador
+    )
+
+    return Crew(
+        agents=[classificador],
+        tasks=[classificacao_task],
+        process=Process.sequential,
+        memory=False,
+        verbose=True,
+    )
+
 # === PARTE 4.1: Crew: Controle Financeiro (INSERÇÃO DE DADOS) ===
 
-def crew_controle_financeiro_insercao(tools, llm, memory, dados_json):
+def crew_controle_financeiro_insercao(tools, router, contexto, dados_json):
     coletor_controle_financeiro = Agent(
         role="Coletor de Dados Financeiros",
         goal="Extrair e organizar os dados da transação financeira.",
         backstory="Especialista em captar detalhes de receitas e despesas em linguagem natural.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("coletor"),
         verbose=True,
         allow_delegation=False
     )
@@ -102,7 +223,7 @@ def crew_controle_financeiro_insercao(tools, llm, memory, dados_json):
         goal="Executar comandos SQL no Supabase conforme os dados coletados.",
         backstory="Especialista em persistência de dados e manipulação de transações.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("gestor_dados"),
         memory=memoria_nova,
         verbose=True,
         allow_delegation=False
@@ -113,7 +234,7 @@ def crew_controle_financeiro_insercao(tools, llm, memory, dados_json):
         goal="Gerar resposta clara e amigável ao usuário.",
         backstory="Responsável por traduzir os dados da transação realizada no banco Supabase para linguagem humana.",
         tools=[],
-        llm=llm,
+        llm=router.llm("redator"),
         verbose=True,
         allow_delegation=False
     )
@@ -161,7 +282,7 @@ def crew_controle_financeiro_insercao(tools, llm, memory, dados_json):
 
     👑 **REGRAS DE OURO**:
     - A data deve vir da tool — nunca invente ou assuma diretamente.
-    """,
+    {bloco_contexto(contexto)}""",
         expected_output="""Objeto JSON {dados_json} estruturado com todos os campos extraídos corretamente e com data_transacao 
         já resolvida pela tool resolve_relative_date""",
         tools=[resolve_relative_date],
@@ -170,7 +291,9 @@ def crew_controle_financeiro_insercao(tools, llm, memory, dados_json):
 
     task_gestor_dados = Task(
         description=f"""Executar a transação no banco Supabase com os dados fornecidos pelo agente coletor_controle_financeiro.
-        Os dados são: {dados_json}. Os dados devem estar alinhado com aqueles coletados pelo agente coletor_controle_financeiro.""",
+        Os dados são: {dados_json}. Os dados devem estar alinhado com aqueles coletados pelo agente coletor_controle_financeiro.
+        Se os dados trouxerem `idempotency_key`, grave-o na coluna idempotency_key e use
+        `ON CONFLICT (idempotency_key) DO NOTHING` no INSERT, para que a mesma transação nunca seja gravada duas vezes.""",
         expected_output="Resultado da queryno banco Supabase",
         agent=gestor_dados
     )
@@ -210,20 +333,19 @@ def crew_controle_financeiro_insercao(tools, llm, memory, dados_json):
         agents=[coletor_controle_financeiro, gestor_dados, redator],
         tasks=[task_coleta_controle_financeiro, task_gestor_dados, task_redator],
         process=Process.sequential,
-        memory=True,
-        entity_memory=memory,
+        memory=False,
         verbose=True,
     )
 
 # === PARTE 4.2: Crew: Controle Financeiro (CONSULTA DE DADOS) ===
 
-def crew_controle_financeiro_consulta(tools, llm, memory, dados_json):
+def crew_controle_financeiro_consulta(tools, router, contexto, dados_json):
     coletor_controle_financeiro_consulta = Agent(
         role="Coletor de Dados Financeiros",
         goal="Extrair e organizar os dados necessários para a chamada (query) no banco Supabase, para consultas de dados.",
         backstory="Especialista em captar detalhes de pedidos de consultas de dados em linguagem natural.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("coletor"),
         verbose=True,
         allow_delegation=False
     )
@@ -233,7 +355,7 @@ def crew_controle_financeiro_consulta(tools, llm, memory, dados_json):
         goal="Executar comandos SQL no Supabase, para consultas de dados, conforme o pedido coletado.",
         backstory="Especialista em consultas (querys) de leitura/consulta no banco Supabase.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("gestor_dados"),
         memory=memoria_nova,
         verbose=True,
         allow_delegation=False
@@ -244,7 +366,7 @@ def crew_controle_financeiro_consulta(tools, llm, memory, dados_json):
         goal="Gerar resposta clara e amigável ao usuário.",
         backstory="Responsável por traduzir os dados da transação realizada no banco Supabase para linguagem humana.",
         tools=[],
-        llm=llm,
+        llm=router.llm("redator"),
         verbose=True,
         allow_delegation=False
     )
@@ -255,7 +377,14 @@ def crew_controle_financeiro_consulta(tools, llm, memory, dados_json):
         repassado pelo agente_classificador.
         2 - Caso o usuário solicite consolidações como total de despesas ou total de receitas ou ainda saldo atualizado da conta, 
         faça a consulta no banco Supabase e em seguida faça os cálculos necessários para a análise do resultado. Em seguida, 
-        encaminhe o resultado para o agente redator.""",
+        encaminhe o resultado para o agente redator.
+        3 - Se os dados trouxerem `transacoes_nao_sincronizadas`, são transações já registradas pelo usuário que podem
+        ainda não ter chegado ao banco Supabase: inclua-as nos totais, saldos e listagens junto com o resultado da query.
+        Para não contar nenhuma duas vezes, acrescente ao WHERE da query, com AND, a condição exata de
+        `filtro_nao_sincronizadas`.
+
+        Pedido do usuário: {dados_json}
+        {bloco_contexto(contexto)}""",
         expected_output="Resultado da chamada (query) no banco Supabase",
         agent=gestor_dados
     )
@@ -278,20 +407,20 @@ def crew_controle_financeiro_consulta(tools, llm, memory, dados_json):
         agents=[gestor_dados, redator],
         tasks=[task_gestor_dados, task_redator],
         process=Process.sequential,
-        memory=True,
-        entity_memory=memory,
+        memory=False,
         verbose=True,
     )
 
 # === PARTE 4.3: Crew: Geração de Gráficos ===
 
-def crew_graficos_financeiros(tools, llm, memory, dados_json):
+def crew_graficos_financeiros(tools, router, contexto, dados_json, gerar_codigo: bool = True):
+    """Coleta os dados por categoria e, se `gerar_codigo`, pede ao LLM o código matplotlib dos gráficos."""
     coletor_dados_grafico = Agent(
         role="Coletor de Dados para Gráficos",
         goal="Buscar dados de receitas e despesas por categoria no banco Supabase.",
         backstory="Especialista em consultas SQL para extração de dados para visualização.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("coletor_grafico"),
         verbose=True,
         allow_delegation=False
     )
@@ -301,7 +430,7 @@ def crew_graficos_financeiros(tools, llm, memory, dados_json):
         goal="Criar gráficos em formato PNG usando matplotlib com base nos dados financeiros coletados.",
         backstory="Especialista em visualização de dados financeiros usando Python e matplotlib para gerar imagens estáticas.",
         tools=[],
-        llm=llm,
+        llm=router.llm("gerador_grafico"),
         verbose=True,
         allow_delegation=False
     )
@@ -319,7 +448,7 @@ def crew_graficos_financeiros(tools, llm, memory, dados_json):
             "receitas": {{"Salário": 3000, "Freelance": 500}},
             "despesas": {{"Alimentação": 800, "Transporte": 300, "Moradia": 1200}}
         }}
-        """,
+        {bloco_contexto(contexto)}""",
         expected_output="Dados de receitas e despesas organizados por categoria em formato JSON",
         agent=coletor_dados_grafico
     )
@@ -391,12 +520,16 @@ def crew_graficos_financeiros(tools, llm, memory, dados_json):
         agent=gerador_grafico
     )
 
+    agentes, tarefas = [coletor_dados_grafico], [task_coleta_dados_grafico]
+    if gerar_codigo:
+        agentes.append(gerador_grafico)
+        tarefas.append(task_gerar_grafico)
+
     return Crew(
-        agents=[coletor_dados_grafico, gerador_grafico],
-        tasks=[task_coleta_dados_grafico, task_gerar_grafico],
+        agents=agentes,
+        tasks=tarefas,
         process=Process.sequential,
-        memory=True,
-        entity_memory=memory,
+        memory=False,
         verbose=True,
     )
 
@@ -404,13 +537,13 @@ def crew_graficos_financeiros(tools, llm, memory, dados_json):
 
 # === PARTE 5: Crew: Consulta de Ativos Financeiros ===
 
-def crew_consulta_ativos(tools, llm, memory, dados_json):
+def crew_consulta_ativos(tools, router, contexto, dados_json):
     coletor_ativos = Agent(
         role="Coletor de Dados de Ativos",
         goal="Extrair informações necessárias para consulta de ativos (ex: símbolo, tipo de dado).",
         backstory="Especialista em finanças e análise de mercado, focado em interpretar pedidos de ativos.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("coletor"),
         verbose=True,
         allow_delegation=False
     )
@@ -420,7 +553,7 @@ def crew_consulta_ativos(tools, llm, memory, dados_json):
         goal="Consultar dados atualizados do ativo usando YFinance.",
         backstory="Profissional de mercado que busca preços, tendências e dados em tempo real.",
         tools=tools,
-        llm=llm,
+        llm=router.llm("analista_ativos"),
         verbose=True,
         allow_delegation=False
     )
@@ -430,7 +563,7 @@ def crew_consulta_ativos(tools, llm, memory, dados_json):
         goal="Responder ao usuário com clareza sobre o ativo solicitado.",
         backstory="Responsável por transformar resultados técnicos de mercado em mensagens claras.",
         tools=[],
-        llm=llm,
+        llm=router.llm("redator"),
         verbose=True,
         allow_delegation=False
     )
@@ -466,7 +599,7 @@ def crew_consulta_ativos(tools, llm, memory, dados_json):
                     "data": "2025-07-25"
                 }}
         }}
-        """,
+        {bloco_contexto(contexto)}""",
         expected_output="Json com informações necessárias para consulta de ativos",
         agent=coletor_ativos
     )
@@ -487,125 +620,249 @@ def crew_consulta_ativos(tools, llm, memory, dados_json):
         agents=[coletor_ativos, analista_ativos, redator],
         tasks=[task_coleta_ativos, task_analise_ativos, task_redator],
         process=Process.sequential,
-        memory=True,
-        entity_memory=memory,
+        memory=False,
         verbose=True
     )
 
 # === PARTE 6: Execução principal ===
 
-async def assist_financ_core(question: str, user_id: str) -> str:
-    llm = ChatOpenAI(model="gpt-4o-mini")
-    
-    is_new = is_new_conversation(question)
-    session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
-    memory = get_session_memory(user_id, session_id)
-
-    if is_new:
-        try:
-            memory.clear()
-        except: pass
-
-    # Inicializa adaptadores
-    tools = []
-    tools.append(resolve_relative_date)
-
-    supabase = try_initialize_mcp_adapter(StdioServerParameters(
+def parametros_supabase():
+    return StdioServerParameters(
         command="npx",
         args=["-y", "@supabase/mcp-server-supabase@latest", "--project-ref=rhtnuzfmshfmreuffqox"],
         env={"SUPABASE_ACCESS_TOKEN": os.getenv("SUPABASE_ACCESS_TOKEN", ""), **os.environ}
-    ), "Supabase")
+    )
 
-    yfinance = try_initialize_mcp_adapter(StdioServerParameters(
+def parametros_yfinance():
+    return StdioServerParameters(
         command="uvx",
         args=["yfmcp@latest"]
-    ), "YFinance")
-
-    for adapter in [supabase, yfinance]:
-        if adapter:
-            tools.extend(adapter.tools)
-            tools.append(resolve_relative_date) # Adiciona a tool de resolução de data relativa
-
-    classificador = criar_agente_classificador(tools, llm)
-
-    classificacao_task = Task(
-        description=f"""
-        📥 Sua missão é analisar a seguinte frase: "{question}" e **obrigatoriamente** gerar um objeto JSON nos seguintes formatos:
-
-        📋 CONTROLE_FINANCEIRO:
-
-        - CASO 1 (INSERÇÃO DE DADOS):
-        {{
-        "classificacao": "CONTROLE_FINANCEIRO" ,
-        "status": "COMPLETO",
-        "dados": {{
-            "valor": 1500.00,
-            "tipo": "receita" | "despesa",
-            "conta_id": 5, // Use sempre conta_id=5 se não informado
-            "categoria": "Alimentação",
-            "data_transacao": "2025-07-20 | hoje | ontem | anteontem | 15/07/2025",
-            "descricao": "Descrição livre da transação"
-            }}
-        }}
-
-        - CASO 2 (CONSULTA DE DADOS):
-        {{  
-        "classificacao": "CONTROLE_FINANCEIRO",
-        "status": "COMPLETO",
-            "dados": {{
-                "consulta": "descrição do pedido feito pelo usuário"
-            }}
-        }}
-
-        📋 CONSULTA_ATIVO:
-        {{
-        "classificacao": "CONSULTA_ATIVO",
-        "status": "COMPLETO",
-        "dados": {{
-            "simbolo": "PETR4",
-            "tipo_consulta": "cotacao" | "analise"
-            }}
-        }}
-
-        📋 GERAR_GRAFICO:
-        {{
-        "classificacao": "GERAR_GRAFICO",
-        "status": "COMPLETO",
-        "dados": {{
-            "tipo_grafico": "receitas_despesas_categoria",
-            "periodo": "ultimo_mes" | "ultimos_3_meses" | "ano_atual"
-            }}
-        }}
-
-        ⚠️ Regras obrigatórias:
-        - NÃO SAIA dos 4 possíveis formatos acima.
-        - NÃO inclua observações, explicações ou textos soltos.
-        - SEMPRE inclua status="COMPLETO"
-        - Sempre que possível, preencha a descrição com base na frase original
-        - Use GERAR_GRAFICO quando o usuário pedir gráficos, análise visual, dashboard ou visualização
-        """,
-        expected_output="Objeto JSON {dados_json} estruturado como especificado acima",
-        agent=classificador
-    )
-
-    crew_classificacao = Crew(
-        agents=[classificador],
-        tasks=[classificacao_task],
-        process=Process.sequential,
-        memory=True,
-        entity_memory=memory,
-        verbose=True,
     )
 
-    import json
+def inicializar_ferramentas():
+    """Tools das crews: adaptadores MCP reais ou, com FINANCEBOT_MCP_FAKE=1, backends falsos offline."""
+    cassete = cassete_atual()
+    if cassete is not None and cassete.reproduzindo:
+        return [resolve_relative_date] + cassete.ferramentas_reproduzidas()
 
-    resultado = await crew_classificacao.kickoff_async()
-    resposta_str = str(resultado)
+    tools = []
+    tools.append(resolve_relative_date)
 
+    if os.getenv("FINANCEBOT_MCP_FAKE") == "1":
+        from tools.fake_backends import criar_ferramentas_falsas
+        ferramentas_supabase, ferramentas_yfinance = criar_ferramentas_falsas()
+        tools.extend(ferramentas_supabase)
+        tools.extend(envolver_com_cache(ferramentas_yfinance, cache, TTL_COTACOES_S))
+        return gravar_ferramentas(tools)
+
+    supabase = try_initialize_mcp_adapter(parametros_supabase(), "Supabase")
+
+    yfinance = try_initialize_mcp_adapter(parametros_yfinance(), "YFinance")
+
+    if supabase:
+        tools.extend(supabase.tools)
+        tools.append(resolve_relative_date) # Adiciona a tool de resolução de data relativa
+    if yfinance:
+        # Cotações são compartilhadas entre usuários e workers por TTL_COTACOES_S
+        tools.extend(envolver_com_cache(yfinance.tools, cache, TTL_COTACOES_S))
+        tools.append(resolve_relative_date)
+
+    return gravar_ferramentas(tools)
+
+def gravar_ferramentas(tools: list) -> list:
+    """No modo de gravação, envolve as tools MCP para registrar cada chamada no cassete da requisição."""
+    cassete = cassete_atual()
+    if cassete is None:
+        return tools
+    return [t if t is resolve_relative_date else cassete.gravar_ferramenta(t) for t in tools]
+
+# === PARTE 6.1: Livro local de transações (confirmação imediata + sincronização assíncrona) ===
+
+LIVRO_LOCAL_ATIVO = os.getenv("FINANCEBOT_LIVRO_LOCAL", "1") == "1"
+# Reproduzindo cassetes, as inserções vão para um livro separado que nunca é sincronizado
+if modo_cassete() == "reproduzir":
+    livro = LivroLocal(os.path.join(DIRETORIO_CASSETES, "livro_reproducao.db"))
+else:
+    livro = LivroLocal()
+_ferramenta_sql = None
+
+def executar_sql_supabase(sql: str) -> str:
+    """Executa SQL pela tool execute_sql do MCP do Supabase, com um adaptador dedicado à sincronização."""
+    global _ferramenta_sql
+    if _ferramenta_sql is None:
+        if os.getenv("FINANCEBOT_MCP_FAKE") == "1":
+            from tools.fake_backends import FakeExecuteSqlTool
+            _ferramenta_sql = FakeExecuteSqlTool()
+        else:
+            adapter = try_initialize_mcp_adapter(parametros_supabase(), "Supabase (sincronização)")
+            if adapter is None:
+                raise RuntimeError("Adaptador MCP do Supabase indisponível")
+            _ferramenta_sql = next(t for t in adapter.tools if t.name == "execute_sql")
+
+    argumentos = {"query": sql}
+    if "project_id" in getattr(_ferramenta_sql.args_schema, "model_fields", {}):
+        argumentos["project_id"] = os.getenv("SUPABASE_PROJECT_REF", "rhtnuzfmshfmreuffqox")
     try:
-        resposta_json = json.loads(resposta_str)
-    except:
-        return "Erro ao interpretar a resposta do classificador."
+        resultado = str(_ferramenta_sql.run(**argumentos))
+    except Exception:
+        _ferramenta_sql = None  # recria o adaptador na próxima tentativa
+        raise
+    if '"error"' in resultado[:300].lower():
+        raise RuntimeError(resultado[:300])
+    return resultado
+
+sincronizador = SincronizadorSupabase(livro, executar_sql_supabase,
+                                      tabela=os.getenv("FINANCEBOT_TABELA_TRANSACOES", "transacoes"))
+
+def formatar_confirmacao(transacao: dict) -> str:
+    """Mesmo formato usado pelo redator da crew de inserção."""
+    valor = f"R$ {transacao['valor']:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    data = datetime.strptime(transacao["data_transacao"], "%Y-%m-%d").strftime("%d/%m/%Y")
+    return (f"💸 Sua transação foi registrada com sucesso:  \n"
+            f"• Valor: {valor}  \n"
+            f"• Categoria: {transacao['categoria']}  \n"
+            f"• Data: {data}  \n"
+            f"• Conta: {transacao['conta_id']}  \n"
+            f"📝 Descrição: {transacao['descricao']}")
+
+# Perfil por amostragem sob demanda (tool perfilador_admin)
+perfilador = Perfilador()
+
+# Saída verbose das crews/agentes fica num rastro por requisição (tool rastros_admin), fora do event loop
+rastros = ColetorRastros(amostragem=float(os.getenv("FINANCEBOT_RASTRO_AMOSTRAGEM", "0.01")))
+if os.getenv("FINANCEBOT_RASTROS", "1") == "1":
+    rastros.instalar()
+
+# === PARTE 6.2: Carteira de investimentos (avaliação em lote) ===
+
+if modo_cassete() == "reproduzir":
+    carteira = Carteira(os.path.join(DIRETORIO_CASSETES, "carteira_reproducao.db"))
+else:
+    carteira = Carteira()
+_adaptador_cotacao = None
+_ferramenta_cotacao = None
+_lock_cotacao = threading.Lock()
+
+def ferramenta_cotacao():
+    """
+    Tool get_ticker_info (yfmcp) com cache compartilhado, criada uma vez e reaproveitada entre requisições.
+    Bloqueante (sobe o processo MCP na primeira chamada): chamar fora do event loop.
+    """
+    global _adaptador_cotacao, _ferramenta_cotacao
+    cassete = cassete_atual()
+    if cassete is not None and cassete.reproduzindo:
+        return next((t for t in cassete.ferramentas_reproduzidas() if t.name == "get_ticker_info"), None)
+
+    with _lock_cotacao:  # requisições simultâneas não sobem dois adaptadores
+        if _ferramenta_cotacao is None:
+            if os.getenv("FINANCEBOT_MCP_FAKE") == "1":
+                from tools.fake_backends import FakeTickerInfoTool
+                ferramenta = FakeTickerInfoTool()
+            else:
+                _adaptador_cotacao = try_initialize_mcp_adapter(parametros_yfinance(), "YFinance (carteira)")
+                if _adaptador_cotacao is None:
+                    return None
+                ferramenta = next(t for t in _adaptador_cotacao.tools if t.name == "get_ticker_info")
+            _ferramenta_cotacao = envolver_com_cache([ferramenta], cache, TTL_COTACOES_S)[0]
+    return cassete.gravar_ferramenta(_ferramenta_cotacao) if cassete is not None else _ferramenta_cotacao
+
+def cotar_posicoes(posicoes: list) -> dict:
+    ferramenta = ferramenta_cotacao()
+    if ferramenta is None:
+        return {}
+    inicio = time.perf_counter()
+    cotacoes = cotar_em_lote([p["simbolo"] for p in posicoes], lambda simbolo: ferramenta.run(symbol=simbolo))
+    logger.info(f"💼 {len(cotacoes)}/{len(posicoes)} cotações da carteira em {time.perf_counter() - inicio:.2f}s")
+    return cotacoes
+
+async def avaliar_carteira_usuario(user_id: str) -> dict:
+    posicoes = carteira.posicoes(user_id)
+    # Inicialização do adaptador e cotações são bloqueantes: rodam juntas fora do event loop
+    cotacoes = await asyncio.to_thread(cotar_posicoes, posicoes) if posicoes else {}
+    return avaliar_carteira(posicoes, cotacoes)
+
+def formatar_carteira(avaliacao: dict) -> str:
+    if not avaliacao["posicoes"]:
+        return ("💼 Você ainda não tem posições registradas. Conte suas compras de ativos, por exemplo: "
+                "\"investi em 10 PETR4 a R$ 30\".")
+
+    def moeda(valor):
+        return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    def pct(valor):
+        return "-" if valor is None else f"{valor * 100:+.2f}%".replace(".", ",")
+
+    totais = avaliacao["totais"]
+    linhas = [f"💼 Sua carteira vale {moeda(totais['valor'])}  ",
+              f"• Resultado: {moeda(totais['resultado'])} ({pct(totais['resultado_pct'])})  ",
+              f"• Hoje: {moeda(totais['variacao_dia'])} ({pct(totais['variacao_dia_pct'])})  ",
+              ""]
+    for p in sorted(avaliacao["posicoes"], key=lambda p: p["valor"] or 0, reverse=True):
+        if p["preco"] is None:
+            continue
+        linhas.append(f"• {p['simbolo']}: {p['quantidade']:g} × {moeda(p['preco'])} = {moeda(p['valor'])} "
+                      f"({pct(p['alocacao']).lstrip('+')} da carteira, resultado {pct(p['resultado_pct'])}, "
+                      f"hoje {pct(p['variacao_dia_pct'])})  ")
+    if avaliacao["sem_cotacao"]:
+        linhas.append(f"⚠️ Sem cotação no momento: {', '.join(avaliacao['sem_cotacao'])}")
+    return "\n".join(linhas)
+
+MENSAGEM_GRAFICOS_PRONTOS = "📊 Seus gráficos de receitas e despesas por categoria estão prontos!"
+MENSAGEM_GRAFICO_VAZIO = "📊 Não encontrei receitas nem despesas no último mês para montar os gráficos."
+MENSAGEM_GRAFICO_SEM_DADOS_VALIDOS = "❌ Não consegui obter os dados para os gráficos agora. Tente novamente em instantes."
+MENSAGEM_ERRO_CLASSIFICADOR = "Erro ao interpretar a resposta do classificador."
+MENSAGEM_CLASSIFICACAO_DESCONHECIDA = "Classificação desconhecida. Não sei o que fazer com isso."
+# Falhas não entram no cache de deduplicação: o retry do usuário deve executar de novo
+RESPOSTAS_DE_FALHA = {MENSAGEM_ERRO_CLASSIFICADOR, MENSAGEM_CLASSIFICACAO_DESCONHECIDA, MENSAGEM_GRAFICO_SEM_DADOS_VALIDOS}
+
+async def executar_etapa(etapa: str, crew):
+    """Executa a crew da etapa registrando os tokens estimados do prompt e os tokens reais consumidos."""
+    budgeter.registrar_prompt(etapa, *(f"{t.description}\n{t.expected_output}" for t in crew.tasks))
+    marcos = []
+    crew.task_callback = lambda saida: marcos.append((saida.agent, time.perf_counter()))
+    inicio = time.perf_counter()
+    resultado = await crew.kickoff_async()
+    router.registrar_crew(crew, marcos, inicio)
+    uso = getattr(resultado, "token_usage", None)
+    if uso is not None:
+        logger.info(f"📊 Uso real de tokens [{etapa}]: prompt={getattr(uso, 'prompt_tokens', '?')} "
+                    f"completion={getattr(uso, 'completion_tokens', '?')} total={getattr(uso, 'total_tokens', '?')}")
+    return resultado
+
+async def assist_financ_core(question: str, user_id: str, anexos: dict | None = None,
+                             idempotency_key: str | None = None) -> str:
+    """
+    Pipeline principal. Se `anexos` for informado, recebe os PNGs gerados ({nome: bytes}).
+    `idempotency_key` é gravada junto das inserções para impedir transações duplicadas no Supabase.
+    Com FINANCEBOT_CASSETE, o tráfego de LLM e das tools MCP é gravado ou reproduzido (tools/cassettes.py).
+    """
+    with perfilador.requisicao(), rastros.rastrear(user_id, question):
+        modo = modo_cassete()
+        if modo is None:
+            return await executar_pipeline(question, user_id, anexos, idempotency_key)
+
+        cassete = Cassete.abrir(modo, question, user_id)
+        with usar_cassete(cassete):
+            resposta = await executar_pipeline(question, user_id, anexos, idempotency_key)
+        cassete.finalizar(resposta)
+        return resposta
+
+async def executar_pipeline(question: str, user_id: str, anexos: dict | None, idempotency_key: str | None) -> str:
+    contexto_classificacao = budgeter.montar_contexto(user_id, "classificacao", question)
+
+    # Sem cache de classificação: o contexto muda a cada turno e a mesma pergunta curta ("e no mês passado?")
+    # pode significar outra coisa; repetições imediatas já são atendidas pela deduplicação
+    crew = crew_classificacao([], router.llm("classificador"), contexto_classificacao, question)
+    resposta_json = extrair_json(str(await executar_etapa("classificacao", crew)))
+
+    if resposta_json is None and router.pode_escalar("classificador"):
+        logger.warning("⚠️ Classificador retornou JSON inválido, escalando para o modelo superior")
+        router.metricas.registrar_escalonamento("classificador")
+        crew = crew_classificacao([], router.llm("classificador", escalado=True), contexto_classificacao, question)
+        resposta_json = extrair_json(str(await executar_etapa("classificacao", crew)))
+
+    if resposta_json is None:
+        return MENSAGEM_ERRO_CLASSIFICADOR
 
     logger.info(f"🔍 Resposta JSON do classificador: {resposta_json}")
 
@@ -614,33 +871,202 @@ async def assist_financ_core(question: str, user_id: str) -> str:
 
 
     # Decide qual crew executar
+    aviso_carteira = ""
     if classificacao == "CONTROLE_FINANCEIRO":
         if "consulta" in dados:
-            crew = crew_controle_financeiro_consulta(tools, llm, memory, dados)
+            etapa, fabrica = "controle_consulta", crew_controle_financeiro_consulta
+            if dados.get("carteira"):
+                # Todas as posições cotadas de uma vez e avaliadas localmente, sem passar pelas crews
+                resposta_final = formatar_carteira(await avaliar_carteira_usuario(user_id))
+                budgeter.registrar_turno(user_id, question, resposta_final)
+                return resposta_final
+            if LIVRO_LOCAL_ATIVO and (pendentes := livro.nao_sincronizadas(user_id)):
+                dados["transacoes_nao_sincronizadas"] = pendentes
+                dados["filtro_nao_sincronizadas"] = filtro_sem_duplicatas(pendentes)
         else:
-            crew = crew_controle_financeiro_insercao(tools, llm, memory, dados)
+            etapa, fabrica = "controle_insercao", crew_controle_financeiro_insercao
+            chave_db = chave_requisicao(user_id, "", idempotency_key) if idempotency_key else None
+            if chave_db:
+                dados["idempotency_key"] = chave_db
+
+            operacao = validar_operacao(dados["ativo"], dados.get("tipo")) if isinstance(dados.get("ativo"), dict) else None
+            if operacao:
+                try:
+                    if carteira.registrar(user_id, operacao, chave_db):
+                        logger.info(f"💼 Posição atualizada: {operacao['simbolo']} {operacao['quantidade']:+g} @ {operacao['preco']}")
+                except PosicaoInsuficiente as e:
+                    # A transação em dinheiro segue normalmente; só a posição fica como estava
+                    logger.warning(f"⚠️ Carteira não atualizada (user={user_id}): {e}")
+                    aviso_carteira = (f"\n\n⚠️ A carteira não foi atualizada: a venda de {e.vendida:g} {e.simbolo} "
+                                      f"é maior que a posição registrada ({e.disponivel:g}).")
+
+            transacao = validar_transacao(dados, resolve_relative_date._run) if LIVRO_LOCAL_ATIVO else None
+            if transacao:
+                # Confirma assim que a transação está no livro local; o Supabase recebe em segundo plano
+                linha, nova = livro.registrar(user_id, transacao, chave_db)
+                logger.info(f"📒 Transação {'registrada' if nova else 'já existente'} no livro local: {linha['idempotency_key']}")
+                sincronizador.acordar()
+                resposta_final = formatar_confirmacao(linha) + aviso_carteira
+                budgeter.registrar_turno(user_id, question, resposta_final)
+                return resposta_final
     elif classificacao == "CONSULTA_ATIVO":
-        crew = crew_consulta_ativos(tools, llm, memory, dados)
+        etapa, fabrica = "consulta_ativos", crew_consulta_ativos
     elif classificacao == "GERAR_GRAFICO":
-        crew = crew_graficos_financeiros(tools, llm, memory, dados)
+        etapa, fabrica = "graficos", crew_graficos_financeiros
     else:
-        return "Classificação desconhecida. Não sei o que fazer com isso."
+        return MENSAGEM_CLASSIFICACAO_DESCONHECIDA
 
+    tools = inicializar_ferramentas()
+    contexto = budgeter.montar_contexto(user_id, etapa, question)
+    # Em modo tarefa (com anexos) os PNGs são renderizados aqui; o código matplotlib do LLM seria descartado
+    opcoes = {"gerar_codigo": anexos is None} if etapa == "graficos" else {}
+    crew = fabrica(tools, router, contexto, dados, **opcoes)
 
     # Executa a próxima etapa
-    resposta_final = await crew.kickoff_async()
-    return str(resposta_final)
+    resultado = await executar_etapa(etapa, crew)
+    resposta_final = str(resultado) + aviso_carteira
+
+    if etapa == "graficos" and anexos is not None:
+        # Renderiza os PNGs a partir dos dados do coletor, sem executar o código gerado pelo LLM;
+        # a saída bruta do coletor (JSON/SQL) nunca é a resposta ao usuário
+        dados_grafico = extrair_json(resultado.tasks_output[0].raw)
+        if dados_grafico is None:
+            logger.warning(f"⚠️ Coletor de gráficos não retornou JSON: {resultado.tasks_output[0].raw[:200]}")
+            resposta_final = MENSAGEM_GRAFICO_SEM_DADOS_VALIDOS
+        else:
+            anexos.update(await asyncio.to_thread(renderizar_graficos, dados_grafico))
+            resposta_final = MENSAGEM_GRAFICOS_PRONTOS if anexos else MENSAGEM_GRAFICO_VAZIO
+    budgeter.registrar_turno(user_id, question, resposta_final)
+    return resposta_final
+
+
+# === PARTE 7: Tools MCP ===
 
+# Junta duplicatas em andamento e guarda resultados recentes por (user_id, pergunta, idempotency_key)
+dedup = RequestDeduplicator(cache=cache)
 
-# === PARTE 7: Tool MCP + função de teste e entrada CLI ===
+MENSAGEM_LIMITE = "⏳ Você enviou muitas solicitações em pouco tempo. Aguarde um minuto e tente novamente."
 
 @mcp.tool(name="assistente_financeiro_inteligente")
-async def assistente_financeiro_tool(question: str, user_id: str) -> str:
-    return await assist_financ_core(question, user_id)
+async def assistente_financeiro_tool(question: str, user_id: str, idempotency_key: str | None = None) -> str:
+    chave = chave_requisicao(user_id, question, idempotency_key)
+    if await dedup.resultado_recente(chave) is None and not await asyncio.to_thread(limitador.permitir, user_id):
+        return MENSAGEM_LIMITE
+    return await dedup.executar(chave, lambda: assist_financ_core(question, user_id, idempotency_key=idempotency_key),
+                                guardar=lambda resposta: resposta not in RESPOSTAS_DE_FALHA)
+
+@mcp.tool(name="metricas_modelos")
+async def metricas_modelos_tool() -> str:
+    """Latência e tokens por papel de agente (janela recente), para calibrar custo x velocidade."""
+    return json.dumps(router.metricas.resumo(), ensure_ascii=False)
+
+def token_admin_valido(token: str) -> bool:
+    esperado = os.getenv("FINANCEBOT_ADMIN_TOKEN", "")
+    return bool(esperado) and hmac.compare_digest(token.encode(), esperado.encode())
+
+@mcp.tool(name="perfilador_admin")
+async def perfilador_admin_tool(token: str, acao: str = "status", requisicoes: int = 0, duracao_s: float = 0,
+                                intervalo_ms: float = 10, incluir_pilhas: bool = True) -> str:
+    """
+    Administração (exige FINANCEBOT_ADMIN_TOKEN). acao="iniciar" liga o perfil por amostragem (parede e CPU)
+    para as próximas `requisicoes` ou por `duracao_s` (máx. 600s); "status" retorna o andamento ou o
+    resultado, com pilhas no formato collapsed do flamegraph e o atraso do event loop; "parar" encerra.
+    """
+    if not token_admin_valido(token):
+        return json.dumps({"erro": "não autorizado"}, ensure_ascii=False)
+    if acao == "iniciar":
+        try:
+            return json.dumps(perfilador.iniciar(requisicoes, duracao_s, max(intervalo_ms, 5)), ensure_ascii=False)
+        except RuntimeError as e:
+            return json.dumps({"erro": str(e)}, ensure_ascii=False)
+    if acao == "parar":
+        perfilador.parar()
+    resultado = perfilador.resultado(incluir_pilhas)
+    return json.dumps(resultado or {"erro": "nenhuma sessão de perfil"}, ensure_ascii=False)
+
+@mcp.tool(name="rastros_admin")
+async def rastros_admin_tool(token: str, rastro_id: str | None = None, limite: int = 20) -> str:
+    """
+    Administração (exige FINANCEBOT_ADMIN_TOKEN). Sem `rastro_id`, lista os rastros recentes (id, usuário,
+    pergunta, duração, erro); com `rastro_id`, retorna a saída verbose completa da requisição.
+    """
+    if not token_admin_valido(token):
+        return json.dumps({"erro": "não autorizado"}, ensure_ascii=False)
+    if rastro_id is None:
+        return json.dumps({"rastros": rastros.listar(limite), "descartados": rastros.descartados}, ensure_ascii=False)
+    texto = await asyncio.to_thread(rastros.obter, rastro_id)
+    return texto if texto is not None else json.dumps({"erro": f"rastro {rastro_id} não encontrado"}, ensure_ascii=False)
+
+# === PARTE 7.1: Modo assíncrono (tarefas longas) ===
+
+async def executar_tarefa(question: str, user_id: str, idempotency_key: str | None = None):
+    anexos = {}
+    texto = await assist_financ_core(question, user_id, anexos, idempotency_key)
+    return texto, anexos
+
+# Resultados ficam até o cliente descartar; FINANCEBOT_TTL_TAREFAS_H > 0 remove os não buscados após esse prazo
+_ttl_tarefas_h = float(os.getenv("FINANCEBOT_TTL_TAREFAS_H", "0"))
+jobs = JobManager(executar_tarefa, workers=int(os.getenv("FINANCEBOT_WORKERS_TAREFAS", "2")),
+                  ttl_resultados_s=_ttl_tarefas_h * 3600 or None)
+
+def _job_publico(job: dict) -> str:
+    publico = {k: job[k] for k in ("id", "status", "resultado", "erro")}
+    publico["recursos"] = [f"tarefa://{job['id']}/{nome}" for nome in job.get("arquivos", [])]
+    return json.dumps(publico, ensure_ascii=False)
+
+def chave_tarefa(user_id: str, question: str, idempotency_key: str | None) -> str:
+    return "tarefa:" + chave_requisicao(user_id, question, idempotency_key)
+
+@mcp.tool(name="enviar_tarefa")
+async def enviar_tarefa_tool(question: str, user_id: str, idempotency_key: str | None = None) -> str:
+    """Enfileira a pergunta para execução em segundo plano e retorna o id da tarefa (o mesmo para envios duplicados)."""
+    chave = chave_tarefa(user_id, question, idempotency_key)
+    if await dedup.resultado_recente(chave) is None and not await asyncio.to_thread(limitador.permitir, user_id):
+        return json.dumps({"id": None, "status": "erro", "resultado": None, "erro": MENSAGEM_LIMITE, "recursos": []},
+                          ensure_ascii=False)
+    job = await dedup.executar(chave, lambda: jobs.enviar(question, user_id, idempotency_key))
+    atual = jobs.store.carregar(job["id"])
+    if atual is None:
+        # A tarefa guardada na deduplicação já foi descartada/expirada (ou é de outro worker): envia de novo
+        await dedup.esquecer(chave)
+        atual = await dedup.executar(chave, lambda: jobs.enviar(question, user_id, idempotency_key))
+    return _job_publico(atual)
+
+@mcp.tool(name="status_tarefa")
+async def status_tarefa_tool(job_id: str, aguardar_s: float = 0) -> str:
+    """Status e resultado da tarefa. Com aguardar_s > 0 (máx. 30s), espera a conclusão antes de responder."""
+    job = await jobs.status(job_id, min(aguardar_s, 30))
+    if job is None:
+        return json.dumps({"id": job_id, "status": "inexistente"})
+    if job["status"] == STATUS_ERRO or job["resultado"] in RESPOSTAS_DE_FALHA:
+        # Tarefa que falhou não é reaproveitada: reenviar a mesma pergunta executa de novo
+        await dedup.esquecer(chave_tarefa(job["user_id"], job["question"], job.get("idempotency_key")))
+    return _job_publico(job)
+
+@mcp.tool(name="descartar_tarefa")
+async def descartar_tarefa_tool(job_id: str) -> str:
+    """Remove do disco o resultado já recuperado pelo cliente."""
+    job = jobs.store.carregar(job_id)
+    descartada = jobs.descartar(job_id)
+    if descartada:
+        # Um reenvio da mesma pergunta depois do descarte vira uma tarefa nova, não o id removido
+        await dedup.esquecer(chave_tarefa(job["user_id"], job["question"], job.get("idempotency_key")))
+    return json.dumps({"id": job_id, "descartada": descartada})
+
+@mcp.resource("tarefa://{job_id}/{arquivo}", mime_type="image/png")
+def arquivo_tarefa(job_id: str, arquivo: str) -> bytes:
+    conteudo = jobs.ler_arquivo(job_id, arquivo)
+    if conteudo is None:
+        raise ValueError(f"Arquivo {arquivo} não encontrado para a tarefa {job_id}")
+    return conteudo
+
+# === PARTE 8: Função de teste e entrada CLI ===
 
 async def test_assistente_financeiro(question: str, user_id: str):
     return await assist_financ_core(question, user_id)
 
 
 if __name__ == "__main__":
-    mcp.run(transport="sse", host="127.0.0.1", port=8005)
\ No newline at end of file
+    if LIVRO_LOCAL_ATIVO and modo_cassete() != "reproduzir":
+        sincronizador.iniciar()
+    mcp.run(transport="sse", host="127.0.0.1", port=int(os.getenv("FINANCEBOT_PORTA", "8005")))
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- Chave de idempotência das transações: impede que retries e envios duplicados
+-- gravem a mesma transação duas vezes (INSERT ... ON CONFLICT (idempotency_key) DO NOTHING).
+-- Linhas antigas ficam com NULL, que não conflita com o índice único.
+
+ALTER TABLE transacoes ADD COLUMN IF NOT EXISTS idempotency_key text;
+
+CREATE UNIQUE INDEX IF NOT EXISTS transacoes_idempotency_key_key
+    ON transacoes (idempotency_key);
@@ -0,0 +1,62 @@
+# tests/test_context_budget.py
+
+import json
+import tempfile
+import unittest
+
+from tools.context_budget import ContextBudgeter, contar_tokens
+
+
+class ResumoTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.budgeter = ContextBudgeter(base_path=self.diretorio.name)
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def conversar(self, turnos: int):
+        for i in range(turnos):
+            self.budgeter.registrar_turno("u1", f"pergunta {i} sobre mercado",
+                                          f"resposta {i} " + "detalhe longamente explicado " * 30)
+
+    def estado(self) -> dict:
+        with open(self.budgeter._caminho("u1"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_resumo_mantem_as_linhas_mais_recentes(self):
+        self.conversar(30)
+        contexto = self.budgeter.montar_contexto("u1", "controle_insercao", "x")
+        resumo = contexto.split("\n\n")[0]
+        ultima_resumida = self.estado()["resumo"][-1]
+        self.assertIn(ultima_resumida, resumo)
+        self.assertNotIn(self.estado()["resumo"][0], resumo)
+        self.assertLessEqual(contar_tokens(resumo), 300 // 2)
+
+    def test_assuntos_vem_do_texto_completo(self):
+        self.conversar(40)
+        assuntos = self.estado()["assuntos"]
+        self.assertIn("longamente", assuntos)
+        self.assertIn("mercado", assuntos)
+        self.assertFalse(any(t.isdigit() for t in assuntos))
+        # A linha resumida é truncada; nenhum pedaço de palavra cortada entra no índice
+        self.assertTrue(set(assuntos) <= {"pergunta", "sobre", "mercado", "resposta", "detalhe", "longamente",
+                                           "explicado"})
+
+    def test_indice_de_assuntos_aparece_no_contexto(self):
+        self.conversar(40)
+        contexto = self.budgeter.montar_contexto("u1", "controle_consulta", "mercado")
+        self.assertIn("Assuntos de conversas mais antigas: ", contexto)
+
+    def test_estado_antigo_sem_termos_do_resumo(self):
+        self.conversar(8)
+        estado = self.estado()
+        del estado["termos_resumo"]
+        with open(self.budgeter._caminho("u1"), "w", encoding="utf-8") as f:
+            json.dump(estado, f)
+        self.conversar(30)
+        self.assertEqual(len(self.estado()["termos_resumo"]), len(self.estado()["resumo"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
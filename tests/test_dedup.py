@@ -0,0 +1,92 @@
+# tests/test_dedup.py
+
+import asyncio
+import unittest
+
+from tools.dedup import RequestDeduplicator, chave_requisicao, normalizar_pergunta
+
+
+class ChaveTest(unittest.TestCase):
+    def test_normaliza_pergunta(self):
+        self.assertEqual(normalizar_pergunta("  Quanto GASTEI   com alimentação?! "), "quanto gastei com alimentacao")
+
+    def test_chave_por_usuario_e_idempotency_key(self):
+        self.assertEqual(chave_requisicao("u1", "Saldo?"), chave_requisicao("u1", "saldo"))
+        self.assertNotEqual(chave_requisicao("u1", "saldo"), chave_requisicao("u2", "saldo"))
+        self.assertNotEqual(chave_requisicao("u1", "saldo", "a"), chave_requisicao("u1", "saldo", "b"))
+
+
+class ExecutarTest(unittest.TestCase):
+    def setUp(self):
+        self.dedup = RequestDeduplicator()
+        self.execucoes = 0
+
+    async def lenta(self, resultado="ok", espera=0.05):
+        self.execucoes += 1
+        await asyncio.sleep(espera)
+        return resultado
+
+    def test_duplicatas_em_andamento_compartilham_a_execucao(self):
+        async def cenario():
+            return await asyncio.gather(*(self.dedup.executar("k", self.lenta) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(cenario()), ["ok", "ok", "ok"])
+        self.assertEqual(self.execucoes, 1)
+        self.assertEqual(self.dedup._em_andamento, {})
+
+    def test_resultado_recente_vem_do_cache(self):
+        async def cenario():
+            await self.dedup.executar("k", self.lenta)
+            return await self.dedup.executar("k", lambda: self.lenta("outro"))
+
+        self.assertEqual(asyncio.run(cenario()), "ok")
+        self.assertEqual(self.execucoes, 1)
+
+    def test_cliente_cancelado_nao_cancela_a_execucao(self):
+        async def cenario():
+            primeiro = asyncio.ensure_future(self.dedup.executar("k", lambda: self.lenta(espera=0.1)))
+            await asyncio.sleep(0.01)
+            primeiro.cancel()
+            retry = await self.dedup.executar("k", self.lenta)
+            return primeiro, retry
+
+        primeiro, retry = asyncio.run(cenario())
+        self.assertTrue(primeiro.cancelled())
+        self.assertEqual(retry, "ok")
+        self.assertEqual(self.execucoes, 1)
+
+    def test_esquecer_remove_do_cache(self):
+        async def cenario():
+            await self.dedup.executar("k", self.lenta)
+            await self.dedup.esquecer("k")
+            antes = await self.dedup.resultado_recente("k")
+            return antes, await self.dedup.executar("k", lambda: self.lenta("novo"))
+
+        self.assertEqual(asyncio.run(cenario()), (None, "novo"))
+        self.assertEqual(self.execucoes, 2)
+
+    def test_resultado_recusado_por_guardar_nao_vai_para_o_cache(self):
+        def guardar(resultado):
+            return resultado != "falha"
+
+        async def cenario():
+            primeiro = await self.dedup.executar("k", lambda: self.lenta("falha"), guardar)
+            return primeiro, await self.dedup.executar("k", self.lenta, guardar)
+
+        self.assertEqual(asyncio.run(cenario()), ("falha", "ok"))
+        self.assertEqual(self.execucoes, 2)
+
+    def test_excecao_nao_vai_para_o_cache(self):
+        async def falhar():
+            raise RuntimeError("LLM indisponível")
+
+        async def cenario():
+            with self.assertRaises(RuntimeError):
+                await self.dedup.executar("k", falhar)
+            return await self.dedup.executar("k", self.lenta)
+
+        self.assertEqual(asyncio.run(cenario()), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# tests/test_jobs.py
+
+import asyncio
+import tempfile
+import time
+import unittest
+
+from tools.jobs import STATUS_CONCLUIDO, STATUS_ERRO, STATUS_EXECUTANDO, STATUS_PENDENTE, JobManager, JobStore
+
+
+async def executor(question, user_id, idempotency_key):
+    return f"ok: {question}", {"grafico.png": b"png"}
+
+
+class JobManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.store = JobStore(self.diretorio.name)
+
+    def tearDown(self):
+        self.diretorio.cleanup()
+
+    def job(self, job_id: str, status: str, atualizado_em: float | None = None) -> dict:
+        job = {"id": job_id, "user_id": "u1", "question": job_id, "idempotency_key": None, "status": status,
+               "criado_em": time.time(), "atualizado_em": atualizado_em or time.time(), "resultado": None,
+               "erro": None, "arquivos": []}
+        self.store.salvar(job)
+        return job
+
+    def test_executa_e_guarda_arquivos(self):
+        async def cenario():
+            manager = JobManager(executor, store=self.store)
+            job = await manager.enviar("pergunta", "u1")
+            return await manager.status(job["id"], aguardar_s=2), manager
+
+        job, manager = asyncio.run(cenario())
+        self.assertEqual(job["status"], STATUS_CONCLUIDO)
+        self.assertEqual(job["resultado"], "ok: pergunta")
+        self.assertEqual(manager.ler_arquivo(job["id"], "grafico.png"), b"png")
+        self.assertTrue(manager.descartar(job["id"]))
+        self.assertIsNone(self.store.carregar(job["id"]))
+
+    def test_consulta_retoma_pendentes_apos_reinicio(self):
+        self.job("pendente1", STATUS_PENDENTE)
+        self.job("interrompida", STATUS_EXECUTANDO)
+
+        async def cenario():
+            manager = JobManager(executor, store=self.store)
+            return await manager.status("pendente1", aguardar_s=2)
+
+        self.assertEqual(asyncio.run(cenario())["status"], STATUS_CONCLUIDO)
+        self.assertEqual(self.store.carregar("interrompida")["status"], STATUS_ERRO)
+
+    def test_resultados_nao_buscados_ficam_sem_ttl(self):
+        self.job("antiga", STATUS_CONCLUIDO, atualizado_em=time.time() - 30 * 24 * 3600)
+
+        async def cenario():
+            manager = JobManager(executor, store=self.store)
+            await manager.enviar("nova", "u1")
+            return manager
+
+        manager = asyncio.run(cenario())
+        self.assertIsNone(manager.ttl_resultados_s)
+        self.assertIsNotNone(self.store.carregar("antiga"))
+
+    def test_limpar_expirados_so_remove_finalizadas_antigas(self):
+        self.job("antiga", STATUS_CONCLUIDO, atualizado_em=time.time() - 7200)
+        self.job("recente", STATUS_CONCLUIDO)
+        self.job("pendente_antiga", STATUS_PENDENTE, atualizado_em=time.time() - 7200)
+        manager = JobManager(executor, store=self.store, ttl_resultados_s=3600)
+        self.assertEqual(manager.limpar_expirados(3600), ["antiga"])
+        self.assertEqual(sorted(j["id"] for j in self.store.listar()), ["pendente_antiga", "recente"])
+
+
+if __name__ == "__main__":
+    unittest.main()
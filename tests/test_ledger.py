@@ -0,0 +1,176 @@
+# tests/test_ledger.py
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from tools.ledger import (ESPERA_MAX_RETENTATIVA_S, LivroLocal, SincronizadorSupabase, filtro_sem_duplicatas,
+                          montar_insert_lote, validar_transacao)
+
+
+def transacao(**campos) -> dict:
+    base = {"valor": "50", "tipo": "despesa", "categoria": "Alimentação", "data_transacao": "2025-06-10",
+            "descricao": "mercado"}
+    base.update(campos)
+    return validar_transacao(base)
+
+
+class ValidarTransacaoTest(unittest.TestCase):
+    def test_normaliza_campos(self):
+        dados = {"valor": "1234,5", "tipo": " Receita ", "categoria": " Salário ",
+                 "data_transacao": "2025-06-01", "conta_id": "3", "descricao": " freela "}
+        self.assertEqual(validar_transacao(dados), {
+            "valor": 1234.5, "tipo": "receita", "categoria": "Salário", "conta_id": 3,
+            "data_transacao": "2025-06-01", "descricao": "freela"})
+
+    def test_rejeita_dados_essenciais_invalidos(self):
+        for campos in ({"valor": "abc"}, {"valor": "0"}, {"valor": None}, {"tipo": "transferencia"},
+                       {"categoria": ""}):
+            with self.subTest(campos=campos):
+                self.assertIsNone(transacao(**campos))
+
+    def test_data_relativa_usa_resolvedor(self):
+        dados = {"valor": 10, "tipo": "despesa", "categoria": "Transporte", "data_transacao": "ontem"}
+        self.assertIsNone(validar_transacao(dados))
+        self.assertEqual(validar_transacao(dados, lambda d: "2025-06-09")["data_transacao"], "2025-06-09")
+        self.assertIsNone(validar_transacao(dados, lambda d: "não sei"))
+
+    def test_conta_padrao(self):
+        self.assertEqual(transacao()["conta_id"], 5)
+        self.assertEqual(transacao(conta_id="x")["conta_id"], 5)
+
+
+class LivroLocalTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.livro = LivroLocal(os.path.join(self.diretorio.name, "transacoes.db"))
+
+    def tearDown(self):
+        self.livro._conexao().close()
+        self.diretorio.cleanup()
+
+    def test_registrar_e_idempotente_pela_chave(self):
+        linha, nova = self.livro.registrar("u1", transacao(), "chave-1")
+        repetida, nova_repetida = self.livro.registrar("u1", transacao(valor="99"), "chave-1")
+        self.assertTrue(nova)
+        self.assertFalse(nova_repetida)
+        self.assertEqual(repetida["id"], linha["id"])
+        self.assertEqual(repetida["valor"], 50.0)
+        self.assertEqual(len(self.livro.nao_sincronizadas("u1")), 1)
+
+    def test_registrar_sem_chave_gera_uma(self):
+        primeira, _ = self.livro.registrar("u1", transacao())
+        segunda, _ = self.livro.registrar("u1", transacao())
+        self.assertNotEqual(primeira["idempotency_key"], segunda["idempotency_key"])
+
+    def test_nao_sincronizadas_filtra_usuario(self):
+        self.livro.registrar("u1", transacao(categoria="Mercado"), "a")
+        self.livro.registrar("u2", transacao(categoria="Aluguel"), "b")
+        self.assertEqual([l["categoria"] for l in self.livro.nao_sincronizadas("u1")], ["Mercado"])
+        self.livro.marcar_sincronizadas([l["id"] for l in self.livro.pendentes()])
+        self.assertEqual(self.livro.nao_sincronizadas("u1"), [])
+
+    def test_nao_sincronizadas_inclui_reservadas_com_a_chave(self):
+        self.livro.registrar("u1", transacao(), "k")
+        self.livro.pendentes()  # lote em envio: ainda conta, o filtro da consulta evita a soma dupla
+        self.assertEqual([l["idempotency_key"] for l in self.livro.nao_sincronizadas("u1")], ["k"])
+
+    def test_pendentes_reserva_o_lote(self):
+        for i in range(3):
+            self.livro.registrar("u1", transacao(), f"k{i}")
+        lote = self.livro.pendentes(limite=2)
+        self.assertEqual([l["idempotency_key"] for l in lote], ["k0", "k1"])
+        self.assertEqual([l["idempotency_key"] for l in self.livro.pendentes()], ["k2"])
+        self.assertEqual(self.livro.pendentes(), [])
+
+    def test_reserva_expira_se_o_envio_nao_termina(self):
+        self.livro.registrar("u1", transacao(), "k")
+        self.assertEqual(len(self.livro.pendentes(reserva_s=0.05)), 1)
+        self.assertEqual(self.livro.pendentes(), [])
+        time.sleep(0.1)
+        self.assertEqual(len(self.livro.pendentes()), 1)
+
+    def test_falha_agenda_retentativa_com_espera_exponencial(self):
+        linha, _ = self.livro.registrar("u1", transacao(), "k")
+        conn = self.livro._conexao()
+        for tentativa in (1, 2, 3):
+            antes = time.time()
+            self.livro.registrar_falha([linha["id"]], "timeout")
+            atual = conn.execute("SELECT tentativas, proxima_tentativa_em, ultimo_erro FROM transacoes").fetchone()
+            self.assertEqual(atual["tentativas"], tentativa)
+            self.assertEqual(atual["ultimo_erro"], "timeout")
+            self.assertAlmostEqual(atual["proxima_tentativa_em"] - antes, 2 ** tentativa, delta=1)
+
+        conn.execute("UPDATE transacoes SET tentativas = 20")
+        antes = time.time()
+        self.livro.registrar_falha([linha["id"]], "timeout")
+        proxima = conn.execute("SELECT proxima_tentativa_em FROM transacoes").fetchone()[0]
+        self.assertAlmostEqual(proxima - antes, ESPERA_MAX_RETENTATIVA_S, delta=1)
+
+
+class MontarInsertLoteTest(unittest.TestCase):
+    def test_escapa_literais(self):
+        linha = {"valor": 12.5, "tipo": "despesa", "categoria": "Bar do Zé's", "conta_id": 5,
+                 "data_transacao": "2025-06-10", "descricao": "'); DROP TABLE transacoes; --",
+                 "idempotency_key": None}
+        sql = montar_insert_lote([linha], "transacoes")
+        self.assertIn("(12.5, 'despesa', 'Bar do Zé''s', 5, '2025-06-10', "
+                      "'''); DROP TABLE transacoes; --', NULL)", sql)
+        self.assertTrue(sql.startswith("INSERT INTO transacoes (valor, tipo, categoria, conta_id, "))
+        self.assertTrue(sql.endswith("ON CONFLICT (idempotency_key) DO NOTHING;"))
+
+    def test_filtro_sem_duplicatas(self):
+        linhas = [{"idempotency_key": "k1"}, {"idempotency_key": "k'2"}]
+        self.assertEqual(filtro_sem_duplicatas(linhas),
+                         "(idempotency_key IS NULL OR idempotency_key NOT IN ('k1', 'k''2'))")
+
+    def test_filtro_nao_conta_duas_vezes_a_transacao_ja_enviada(self):
+        banco = sqlite3.connect(":memory:")
+        banco.execute("CREATE TABLE transacoes (valor REAL, idempotency_key TEXT)")
+        banco.executemany("INSERT INTO transacoes VALUES (?, ?)", [(10, None), (20, "antiga"), (50, "k1")])
+        locais = [{"valor": 50, "idempotency_key": "k1"}, {"valor": 5, "idempotency_key": "k2"}]
+        total_banco = banco.execute(
+            f"SELECT SUM(valor) FROM transacoes WHERE valor > 0 AND {filtro_sem_duplicatas(locais)}").fetchone()[0]
+        self.assertEqual(total_banco + sum(l["valor"] for l in locais), 85)
+
+    def test_uma_tupla_por_linha(self):
+        linhas = [dict(transacao(), idempotency_key=f"k{i}") for i in range(3)]
+        sql = montar_insert_lote(linhas, "transacoes")
+        self.assertEqual(sql.count("'k"), 3)
+        self.assertEqual(sql.count("),\n("), 2)
+
+
+class SincronizadorTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.livro = LivroLocal(os.path.join(self.diretorio.name, "transacoes.db"))
+        for i in range(5):
+            self.livro.registrar("u1", transacao(), f"k{i}")
+
+    def tearDown(self):
+        self.livro._conexao().close()
+        self.diretorio.cleanup()
+
+    def test_envia_em_lotes_e_marca_sincronizadas(self):
+        enviados = []
+        sincronizador = SincronizadorSupabase(self.livro, enviados.append, lote=2)
+        self.assertEqual(asyncio.run(sincronizador.sincronizar_uma_vez()), 5)
+        self.assertEqual(len(enviados), 3)
+        self.assertEqual(self.livro.nao_sincronizadas("u1"), [])
+
+    def test_falha_mantem_pendentes(self):
+        def falhar(sql):
+            raise RuntimeError("Supabase indisponível")
+
+        sincronizador = SincronizadorSupabase(self.livro, falhar, lote=2)
+        self.assertEqual(asyncio.run(sincronizador.sincronizar_uma_vez()), 0)
+        self.assertEqual(len(self.livro.nao_sincronizadas("u1")), 5)
+        tentativas = self.livro._conexao().execute("SELECT SUM(tentativas) FROM transacoes").fetchone()[0]
+        self.assertEqual(tentativas, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
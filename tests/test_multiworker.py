@@ -0,0 +1,107 @@
+# tests/test_multiworker.py
+
+import asyncio
+import unittest
+import uuid
+
+from tools.multiworker import StickyProxy
+
+
+class WorkerFalso:
+    """Responde GET /sse com o evento "endpoint" do MCP e POSTs com o próprio índice."""
+
+    def __init__(self, indice: int):
+        self.indice = indice
+        self.sessoes = set()
+        self.posts = []
+
+    async def atender(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        cabecalho = await reader.readuntil(b"\r\n\r\n")
+        linha = cabecalho.split(b"\r\n", 1)[0].decode()
+        if linha.startswith("GET"):
+            session_id = uuid.uuid4().hex
+            self.sessoes.add(session_id)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n\r\n"
+                         b"event: endpoint\r\ndata: /messages/?session_id=%s\r\n\r\n" % session_id.encode())
+            await writer.drain()
+            await reader.read()  # mantém o stream aberto até o cliente sair
+        else:
+            self.posts.append(linha)
+            corpo = str(self.indice).encode()
+            writer.write(b"HTTP/1.1 202 Accepted\r\nContent-Length: %d\r\n\r\n%s" % (len(corpo), corpo))
+            await writer.drain()
+        writer.close()
+
+
+async def requisitar(porta: int, linha: str) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+    writer.write(f"{linha}\r\nHost: teste\r\nContent-Length: 0\r\n\r\n".encode())
+    await writer.drain()
+    resposta = await asyncio.wait_for(reader.read(), 2)
+    writer.close()
+    return resposta
+
+
+class StickyProxyTest(unittest.TestCase):
+    def test_usuario_fixo_no_mesmo_worker(self):
+        proxy = StickyProxy([1, 2, 3])
+        indices = {proxy.worker_para_usuario("maria") for _ in range(10)}
+        self.assertEqual(len(indices), 1)
+        self.assertEqual(StickyProxy([1, 2, 3]).worker_para_usuario("maria"), indices.pop())
+
+    def test_sem_usuario_vai_para_o_worker_menos_ocupado(self):
+        proxy = StickyProxy([1, 2, 3])
+        proxy.abertas = [2, 0, 1]
+        self.assertEqual(proxy.worker_para_usuario(None), 1)
+
+    def test_session_id_anunciado_em_blocos(self):
+        proxy = StickyProxy([1, 2])
+        sessao = {"id": None}
+        observar = proxy._observador_sse(1, sessao)
+        observar(b"event: endpoint\r\ndata: /messages/?sess")
+        observar(b"ion_id=abc123\r\n\r\n")
+        self.assertEqual(sessao["id"], "abc123")
+        self.assertEqual(proxy.sessoes, {"abc123": 1})
+
+    def test_posts_seguem_o_worker_da_sessao(self):
+        asyncio.run(self._posts_seguem_o_worker_da_sessao())
+
+    async def _posts_seguem_o_worker_da_sessao(self):
+        workers = [WorkerFalso(i) for i in range(3)]
+        servidores = [await asyncio.start_server(w.atender, "127.0.0.1", 0) for w in workers]
+        proxy = StickyProxy([s.sockets[0].getsockname()[1] for s in servidores])
+        servidor_proxy = await asyncio.start_server(proxy.atender, "127.0.0.1", 0)
+        porta = servidor_proxy.sockets[0].getsockname()[1]
+        try:
+            for usuario in ("maria", "joao", "ana"):
+                esperado = proxy.worker_para_usuario(usuario)
+                reader, writer = await asyncio.open_connection("127.0.0.1", porta)
+                writer.write(f"GET /sse?user_id={usuario} HTTP/1.1\r\nHost: teste\r\n\r\n".encode())
+                await writer.drain()
+                stream = b""
+                while b"session_id=" not in stream or not stream.endswith(b"\r\n\r\n"):
+                    stream += await asyncio.wait_for(reader.read(1024), 2)
+                session_id = stream.split(b"session_id=")[1].split(b"\r\n")[0].decode()
+                self.assertIn(session_id, workers[esperado].sessoes)
+
+                for _ in range(2):
+                    resposta = await requisitar(porta, f"POST /messages/?session_id={session_id} HTTP/1.1")
+                    self.assertTrue(resposta.endswith(str(esperado).encode()), resposta)
+
+                writer.close()
+                for _ in range(50):
+                    if session_id not in proxy.sessoes:
+                        break
+                    await asyncio.sleep(0.02)
+                self.assertNotIn(session_id, proxy.sessoes)
+
+            resposta = await requisitar(porta, "POST /messages/?session_id=desconhecida HTTP/1.1")
+            self.assertTrue(resposta.startswith(b"HTTP/1.1 404"))
+        finally:
+            servidor_proxy.close()
+            for servidor in servidores:
+                servidor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
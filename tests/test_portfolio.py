@@ -0,0 +1,177 @@
+# tests/test_portfolio.py
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+try:
+    from tools.portfolio import (Carteira, PosicaoInsuficiente, avaliar_carteira, cotar_em_lote, extrair_cotacao,
+                                 simbolo_yahoo, validar_operacao)
+except ImportError as e:  # numpy ausente
+    raise unittest.SkipTest(f"tools.portfolio indisponível: {e}")
+
+
+def compra(simbolo: str, quantidade: float, preco: float) -> dict:
+    return {"simbolo": simbolo, "quantidade": quantidade, "preco": preco}
+
+
+class ValidarOperacaoTest(unittest.TestCase):
+    def test_normaliza_compra_e_venda(self):
+        self.assertEqual(validar_operacao({"simbolo": " petr4 ", "quantidade": "100", "preco_unitario": "38,5"}),
+                         compra("PETR4", 100.0, 38.5))
+        venda = validar_operacao({"simbolo": "VALE3", "quantidade": 10, "preco_unitario": 60, "operacao": "venda"})
+        self.assertEqual(venda["quantidade"], -10.0)
+
+    def test_operacao_padrao_pelo_tipo(self):
+        ativo = {"simbolo": "BTC-USD", "quantidade": 0.5, "preco_unitario": 300000}
+        self.assertEqual(validar_operacao(ativo, "receita")["quantidade"], -0.5)
+        self.assertEqual(validar_operacao(ativo, "despesa")["quantidade"], 0.5)
+
+    def test_rejeita_incompletas(self):
+        for ativo in ({"quantidade": 1, "preco_unitario": 1}, {"simbolo": "X", "preco_unitario": 1},
+                      {"simbolo": "X", "quantidade": 0, "preco_unitario": 1},
+                      {"simbolo": "X", "quantidade": 1, "preco_unitario": "abc"}):
+            with self.subTest(ativo=ativo):
+                self.assertIsNone(validar_operacao(ativo))
+
+
+class CarteiraTest(unittest.TestCase):
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.carteira = Carteira(os.path.join(self.diretorio.name, "posicoes.db"))
+
+    def tearDown(self):
+        self.carteira._conexao().close()
+        self.diretorio.cleanup()
+
+    def posicao(self, simbolo: str = "PETR4"):
+        return next((p for p in self.carteira.posicoes("u1") if p["simbolo"] == simbolo), None)
+
+    def test_preco_medio_ponderado_nas_compras(self):
+        self.carteira.registrar("u1", compra("PETR4", 10, 20))
+        self.carteira.registrar("u1", compra("PETR4", 30, 40))
+        self.assertEqual(self.posicao(), {"simbolo": "PETR4", "quantidade": 40, "preco_medio": 35})
+
+    def test_venda_reduz_posicao_sem_mudar_preco_medio(self):
+        self.carteira.registrar("u1", compra("PETR4", 10, 20))
+        self.carteira.registrar("u1", compra("PETR4", -4, 50))
+        self.assertEqual(self.posicao(), {"simbolo": "PETR4", "quantidade": 6, "preco_medio": 20})
+        self.carteira.registrar("u1", compra("PETR4", -6, 50))
+        self.assertIsNone(self.posicao())
+
+    def test_recompra_depois_de_zerar_usa_so_o_novo_preco(self):
+        self.carteira.registrar("u1", compra("PETR4", 10, 20))
+        self.carteira.registrar("u1", compra("PETR4", -10, 25))
+        self.carteira.registrar("u1", compra("PETR4", 5, 30))
+        self.assertEqual(self.posicao()["preco_medio"], 30)
+
+    def test_chave_repetida_nao_reaplica(self):
+        self.assertTrue(self.carteira.registrar("u1", compra("PETR4", 10, 20), "k"))
+        self.assertFalse(self.carteira.registrar("u1", compra("PETR4", 10, 20), "k"))
+        self.assertEqual(self.posicao()["quantidade"], 10)
+
+    def test_venda_acima_da_posicao_e_rejeitada(self):
+        self.carteira.registrar("u1", compra("PETR4", 10, 20))
+        with self.assertRaises(PosicaoInsuficiente) as erro:
+            self.carteira.registrar("u1", compra("PETR4", -15, 30), "venda")
+        self.assertEqual((erro.exception.disponivel, erro.exception.vendida), (10, 15))
+        self.assertEqual(self.posicao()["quantidade"], 10)
+        # Nada foi gravado: a mesma chave ainda pode ser usada depois
+        self.assertTrue(self.carteira.registrar("u1", compra("PETR4", -10, 30), "venda"))
+
+    def test_venda_sem_posicao_e_rejeitada(self):
+        with self.assertRaises(PosicaoInsuficiente):
+            self.carteira.registrar("u1", compra("VALE3", -1, 60))
+        self.assertEqual(self.carteira.posicoes("u1"), [])
+
+    def test_posicoes_separadas_por_usuario(self):
+        self.carteira.registrar("u1", compra("PETR4", 10, 20))
+        self.carteira.registrar("u2", compra("VALE3", 5, 60))
+        self.assertEqual([p["simbolo"] for p in self.carteira.posicoes("u1")], ["PETR4"])
+
+
+class CotacoesTest(unittest.TestCase):
+    def test_simbolo_yahoo(self):
+        self.assertEqual(simbolo_yahoo("PETR4"), "PETR4.SA")
+        self.assertEqual(simbolo_yahoo("TAEE11"), "TAEE11.SA")
+        self.assertEqual(simbolo_yahoo("AAPL"), "AAPL")
+        self.assertEqual(simbolo_yahoo("BTC-USD"), "BTC-USD")
+
+    def test_extrair_cotacao(self):
+        self.assertEqual(extrair_cotacao(json.dumps({"regularMarketPrice": 10, "previousClose": 9})),
+                         {"preco": 10.0, "fechamento_anterior": 9.0})
+        self.assertEqual(extrair_cotacao({"currentPrice": 10}), {"preco": 10.0, "fechamento_anterior": 10.0})
+        self.assertIsNone(extrair_cotacao("erro"))
+        self.assertIsNone(extrair_cotacao({"previousClose": 9}))
+
+    def test_cotar_em_lote_ignora_repetidos_e_falhas(self):
+        chamadas = []
+
+        def cotar_um(simbolo):
+            chamadas.append(simbolo)
+            if simbolo == "VALE3.SA":
+                raise RuntimeError("timeout")
+            return {"regularMarketPrice": 10}
+
+        cotacoes = cotar_em_lote(["PETR4", "PETR4", "VALE3", "AAPL"], cotar_um)
+        self.assertEqual(sorted(chamadas), ["AAPL", "PETR4.SA", "VALE3.SA"])
+        self.assertEqual(sorted(cotacoes), ["AAPL", "PETR4"])
+        self.assertEqual(cotar_em_lote([], cotar_um), {})
+
+    def test_50_ativos_levam_perto_do_tempo_de_uma_cotacao(self):
+        latencia = 0.2
+
+        def cotar_um(simbolo):
+            time.sleep(latencia)
+            return {"regularMarketPrice": 10}
+
+        inicio = time.perf_counter()
+        cotacoes = cotar_em_lote([f"ATIV{i}" for i in range(50)], cotar_um)
+        decorrido = time.perf_counter() - inicio
+        self.assertEqual(len(cotacoes), 50)
+        self.assertLess(decorrido, 2 * latencia)  # em série seriam 50 * latencia = 10s
+
+
+class AvaliarCarteiraTest(unittest.TestCase):
+    def test_valores_resultado_e_alocacao(self):
+        posicoes = [{"simbolo": "PETR4", "quantidade": 100, "preco_medio": 30},
+                    {"simbolo": "VALE3", "quantidade": 10, "preco_medio": 70}]
+        cotacoes = {"PETR4": {"preco": 36, "fechamento_anterior": 40},
+                    "VALE3": {"preco": 60, "fechamento_anterior": 50}}
+        avaliacao = avaliar_carteira(posicoes, cotacoes)
+
+        petr4, vale3 = avaliacao["posicoes"]
+        self.assertEqual(petr4, {"simbolo": "PETR4", "quantidade": 100, "preco_medio": 30, "preco": 36,
+                                 "valor": 3600, "resultado": 600, "resultado_pct": 0.2, "alocacao": 0.8571,
+                                 "variacao_dia": -400, "variacao_dia_pct": -0.1})
+        self.assertEqual((vale3["resultado"], vale3["resultado_pct"], vale3["alocacao"]), (-100, -0.1429, 0.1429))
+        self.assertEqual(avaliacao["totais"], {"valor": 4200, "custo": 3700, "resultado": 500, "resultado_pct": 0.1351,
+                                               "variacao_dia": -300, "variacao_dia_pct": -0.0667})
+        self.assertEqual(avaliacao["sem_cotacao"], [])
+
+    def test_posicao_sem_cotacao_fica_fora_dos_totais(self):
+        posicoes = [{"simbolo": "PETR4", "quantidade": 10, "preco_medio": 30},
+                    {"simbolo": "XPTO3", "quantidade": 5, "preco_medio": 10}]
+        avaliacao = avaliar_carteira(posicoes, {"PETR4": {"preco": 40, "fechamento_anterior": 40}})
+
+        self.assertEqual(avaliacao["sem_cotacao"], ["XPTO3"])
+        xpto = avaliacao["posicoes"][1]
+        self.assertIsNone(xpto["preco"])
+        self.assertIsNone(xpto["valor"])
+        self.assertIsNone(xpto["alocacao"])
+        self.assertEqual(avaliacao["posicoes"][0]["alocacao"], 1.0)
+        self.assertEqual(avaliacao["totais"]["custo"], 300)
+        self.assertEqual(avaliacao["totais"]["valor"], 400)
+
+    def test_carteira_vazia(self):
+        avaliacao = avaliar_carteira([], {})
+        self.assertEqual(avaliacao["posicoes"], [])
+        self.assertEqual(avaliacao["totais"]["valor"], 0)
+        self.assertIsNone(avaliacao["totais"]["resultado_pct"])
+        self.assertIsNone(avaliacao["totais"]["variacao_dia_pct"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+# tests/test_shared_cache.py
+
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from tools.resp_server import RespStore, servir
+from tools.shared_cache import MemoryBackend, RateLimiter, RedisBackend, SQLiteBackend, criar_backend
+
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServidorRespLocal:
+    """tools/resp_server.py rodando em uma thread com event loop próprio."""
+
+    def __init__(self):
+        self.porta = porta_livre()
+        self.loop = asyncio.new_event_loop()
+        self._tarefa = None
+        self._thread = threading.Thread(target=self._rodar, daemon=True)
+        self._thread.start()
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", self.porta), timeout=0.1).close()
+                return
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("servidor RESP não subiu")
+
+    def _rodar(self):
+        asyncio.set_event_loop(self.loop)
+        self._tarefa = self.loop.create_task(servir("127.0.0.1", self.porta))
+        try:
+            self.loop.run_until_complete(self._tarefa)
+        except asyncio.CancelledError:
+            pass
+
+    def parar(self):
+        self.loop.call_soon_threadsafe(self._tarefa.cancel)
+        self._thread.join(timeout=5)
+        self.loop.close()
+
+
+class ContratoBackend:
+    """Comportamento comum aos três backends; as subclasses definem `criar()`."""
+
+    def setUp(self):
+        self.backend = self.criar()
+
+    def test_set_get_delete(self):
+        self.backend.set("a", {"preco": 10.5, "nome": "ação"})
+        self.assertEqual(self.backend.get("a"), {"preco": 10.5, "nome": "ação"})
+        self.backend.delete("a")
+        self.assertIsNone(self.backend.get("a"))
+        self.assertIsNone(self.backend.get("inexistente"))
+
+    def test_set_com_ttl_expira(self):
+        self.backend.set("a", 1, ttl_s=0.05)
+        self.assertEqual(self.backend.get("a"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(self.backend.get("a"))
+
+    def test_incr_conta_e_reinicia_depois_do_ttl(self):
+        self.assertEqual([self.backend.incr("c", ttl_s=0.2) for _ in range(3)], [1, 2, 3])
+        time.sleep(0.3)
+        self.assertEqual(self.backend.incr("c", ttl_s=0.2), 1)
+
+    def test_incr_nao_renova_o_ttl(self):
+        self.backend.incr("c", ttl_s=0.2)
+        time.sleep(0.12)
+        self.assertEqual(self.backend.incr("c", ttl_s=0.2), 2)
+        time.sleep(0.12)
+        self.assertEqual(self.backend.incr("c", ttl_s=0.2), 1)
+
+    def test_incr_sem_ttl(self):
+        self.assertEqual(self.backend.incr("c"), 1)
+        self.assertEqual(self.backend.incr("c"), 2)
+
+    def test_limitador_de_taxa(self):
+        limitador = RateLimiter(self.backend, 2)
+        self.assertEqual([limitador.permitir("u1") for _ in range(3)], [True, True, False])
+        self.assertTrue(limitador.permitir("u2"))
+
+
+class MemoryBackendTest(ContratoBackend, unittest.TestCase):
+    def criar(self):
+        return MemoryBackend()
+
+    def test_descarta_os_mais_antigos_acima_do_limite(self):
+        backend = MemoryBackend(max_itens=2)
+        for chave in ("a", "b", "c"):
+            backend.set(chave, chave)
+        self.assertEqual([backend.get(c) for c in ("a", "b", "c")], [None, "b", "c"])
+
+
+class SQLiteBackendTest(ContratoBackend, unittest.TestCase):
+    def criar(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+        return SQLiteBackend(os.path.join(self.diretorio.name, "cache.db"))
+
+    def test_compartilhado_entre_instancias(self):
+        outra = SQLiteBackend(self.backend.caminho)
+        self.backend.incr("c", ttl_s=60)
+        self.assertEqual(outra.incr("c", ttl_s=60), 2)
+
+
+class RedisBackendTest(ContratoBackend, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.servidor = ServidorRespLocal()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.servidor.parar()
+
+    def criar(self):
+        backend = RedisBackend("127.0.0.1", self.servidor.porta)
+        self.addCleanup(backend._fechar)
+        backend.comando("DEL", "a", "c", "limite:u1:" + str(int(time.time() // 60)),
+                        "limite:u2:" + str(int(time.time() // 60)))
+        return backend
+
+    def test_criar_backend_pela_url(self):
+        backend = criar_backend(f"redis://127.0.0.1:{self.servidor.porta}/0")
+        self.assertEqual(backend.comando("PING"), "PONG")
+        backend._fechar()
+
+
+class RedisBackendRetentativaTest(unittest.TestCase):
+    """Servidor que recebe o comando e não responde: a leitura estoura o timeout depois da entrega."""
+
+    def setUp(self):
+        self.servidor = socket.socket()
+        self.servidor.bind(("127.0.0.1", 0))
+        self.servidor.listen()
+        self.recebidos = []
+        self.conexoes = []
+        threading.Thread(target=self._aceitar, daemon=True).start()
+
+    def tearDown(self):
+        self.servidor.close()
+        for conexao in self.conexoes:
+            conexao.close()
+
+    def _aceitar(self):
+        while True:
+            try:
+                conexao, _ = self.servidor.accept()
+            except OSError:
+                return
+            self.conexoes.append(conexao)
+            threading.Thread(target=self._ler, args=(conexao,), daemon=True).start()
+
+    def _ler(self, conexao):
+        while dados := conexao.recv(4096):
+            self.recebidos.append(dados)
+
+    def test_timeout_na_leitura_nao_reenvia(self):
+        backend = RedisBackend("127.0.0.1", self.servidor.getsockname()[1], timeout_s=0.2)
+        with self.assertRaises(OSError):
+            backend.comando("INCR", "c")
+        time.sleep(0.1)
+        self.assertEqual(b"".join(self.recebidos).count(b"INCR"), 1)
+        self.assertIsNone(backend._sock)
+
+    def test_reconecta_quando_o_servidor_fechou_a_conexao(self):
+        servidor = ServidorRespLocal()
+        self.addCleanup(servidor.parar)
+        backend = RedisBackend("127.0.0.1", servidor.porta)
+        self.addCleanup(backend._fechar)
+        self.assertEqual(backend.comando("PING"), "PONG")
+        backend._sock.shutdown(socket.SHUT_RD)  # simula o servidor encerrando a conexão ociosa
+        self.assertEqual(backend.incr("c"), 1)
+
+
+class RespStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = RespStore()
+
+    def test_set_nx_nao_sobrescreve(self):
+        self.assertEqual(self.store.executar([b"SET", b"k", b"1", b"NX"]), "+OK")
+        self.assertIsNone(self.store.executar([b"SET", b"k", b"2", b"NX"]))
+        self.assertEqual(self.store.executar([b"GET", b"k"]), b"1")
+
+    def test_set_nx_px_depois_de_expirar(self):
+        self.store.executar([b"SET", b"k", b"0", b"PX", b"50", b"NX"])
+        self.assertEqual(self.store.executar([b"INCR", b"k"]), 1)
+        time.sleep(0.08)
+        self.assertEqual(self.store.executar([b"SET", b"k", b"0", b"PX", b"50", b"NX"]), "+OK")
+        self.assertEqual(self.store.executar([b"INCR", b"k"]), 1)
+
+    def test_incr_preserva_o_ttl(self):
+        self.store.executar([b"SET", b"k", b"0", b"EX", b"100"])
+        self.store.executar([b"INCR", b"k"])
+        self.assertGreater(self.store.executar([b"TTL", b"k"]), 90)
+        self.assertEqual(self.store.executar([b"TTL", b"sem"]), -2)
+
+    def test_incr_em_valor_nao_inteiro(self):
+        self.store.executar([b"SET", b"k", b"abc"])
+        self.assertIsInstance(self.store.executar([b"INCR", b"k"]), Exception)
+
+    def test_expirar_vencidas_remove_chaves_nao_lidas(self):
+        for i in range(5):
+            self.store.executar([b"SET", b"k%d" % i, b"v", b"PX", b"20"])
+        self.store.executar([b"SET", b"fica", b"v"])
+        time.sleep(0.05)
+        self.assertEqual(self.store.expirar_vencidas(), 5)
+        self.assertEqual(list(self.store._dados), [b"fica"])
+
+    def test_ttl_substituido_nao_expira_a_chave(self):
+        self.store.executar([b"SET", b"k", b"v", b"PX", b"20"])
+        self.store.executar([b"PEXPIRE", b"k", b"100000"])
+        time.sleep(0.05)
+        self.assertEqual(self.store.expirar_vencidas(), 0)
+        self.assertEqual(self.store.executar([b"GET", b"k"]), b"v")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+# tools/cassettes.py
+"""
+Gravação e reprodução ("cassetes") do tráfego de LLM e das tools MCP de cada requisição.
+
+    FINANCEBOT_CASSETE=gravar       grava cada requisição em cassetes/<chave>.json.gz
+    FINANCEBOT_CASSETE=reproduzir   responde a partir das gravações, sem OpenAI/Supabase/yfmcp
+    FINANCEBOT_CASSETE_LATENCIA=zero  reproduz sem esperar (padrão: "original", com os tempos gravados)
+
+A chave do cassete é a mesma da deduplicação (usuário + pergunta normalizada). Na reprodução, cada
+chamada é casada pela entrada exata; se o prompt mudou (ex.: alteração de prompt ou contexto), usa a
+próxima gravação não consumida do mesmo papel/tool, na ordem em que foi gravada.
+"""
+
+import contextvars
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any
+
+from crewai.llms.base_llm import BaseLLM
+from crewai.tools import BaseTool
+from pydantic import Field, create_model
+
+from tools.context_budget import contar_tokens
+from tools.dedup import chave_requisicao
+from tools.tool_wrappers import FerramentaEnvolvida
+
+logger = logging.getLogger(__name__)
+
+DIRETORIO_CASSETES = os.getenv("FINANCEBOT_CASSETE_DIR", "./cassetes")
+VERSAO = 1
+_TIPOS_JSON = {"string": str, "integer": int, "number": float, "boolean": bool, "array": list, "object": dict}
+
+_cassete_atual = contextvars.ContextVar("cassete_atual", default=None)
+
+
+class GravacaoAusente(RuntimeError):
+    """Na reprodução, não há cassete para a requisição ou gravação para a chamada."""
+
+
+def modo_cassete() -> str | None:
+    modo = os.getenv("FINANCEBOT_CASSETE", "").strip().lower()
+    return modo if modo in ("gravar", "reproduzir") else None
+
+
+def cassete_atual():
+    return _cassete_atual.get()
+
+
+@contextmanager
+def usar_cassete(cassete):
+    """Torna o cassete visível ao router e às tools da requisição (propaga para as threads da crew)."""
+    token = _cassete_atual.set(cassete)
+    try:
+        yield cassete
+    finally:
+        _cassete_atual.reset(token)
+
+
+def _hash(entrada) -> str:
+    return hashlib.sha256(json.dumps(entrada, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()[:16]
+
+
+def _serializavel(valor):
+    return valor if isinstance(valor, (str, int, float, bool, list, dict, type(None))) else str(valor)
+
+
+class Cassete:
+    def __init__(self, modo: str, caminho: str, dados: dict, latencia: str = "original"):
+        self.modo = modo
+        self.caminho = caminho
+        self.dados = dados
+        self.latencia = latencia
+        self._inicio = time.perf_counter()
+        self._lock = threading.Lock()
+        self._consumidas = set()
+
+    @property
+    def reproduzindo(self) -> bool:
+        return self.modo == "reproduzir"
+
+    @classmethod
+    def abrir(cls, modo: str, question: str, user_id: str, diretorio: str = DIRETORIO_CASSETES):
+        chave = chave_requisicao(user_id, question)
+        caminho = os.path.join(diretorio, f"{chave}.json.gz")
+        if modo == "gravar":
+            dados = {"versao": VERSAO, "chave": chave, "question": question, "user_id": user_id,
+                     "gravado_em": time.time(), "ferramentas": [], "interacoes": []}
+            return cls(modo, caminho, dados)
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            raise GravacaoAusente(f"Nenhum cassete gravado para a requisição ({caminho})")
+        return cls(modo, caminho, dados, os.getenv("FINANCEBOT_CASSETE_LATENCIA", "original"))
+
+    # --- gravação ---
+
+    def registrar(self, tipo: str, nome: str, entrada, inicio: float, saida=None, erro: str | None = None):
+        interacao = {"tipo": tipo, "nome": nome, "hash": _hash(entrada), "entrada": entrada,
+                     "inicio_s": round(inicio - self._inicio, 4),
+                     "duracao_s": round(time.perf_counter() - inicio, 4)}
+        if erro is not None:
+            interacao["erro"] = erro
+        else:
+            interacao["saida"] = _serializavel(saida)
+        with self._lock:
+            self.dados["interacoes"].append(interacao)
+
+    def envolver_llm(self, llm, papel: str):
+        return LLMCassete(llm, papel, self)
+
+    def gravar_ferramenta(self, ferramenta: BaseTool) -> BaseTool:
+        esquema = ferramenta.args_schema.model_json_schema() if ferramenta.args_schema else {}
+        with self._lock:
+            if all(f["nome"] != ferramenta.name for f in self.dados["ferramentas"]):
+                self.dados["ferramentas"].append(
+                    {"nome": ferramenta.name, "descricao": ferramenta.description, "esquema": esquema})
+        return FerramentaGravada(ferramenta, cassete=self)
+
+    # --- reprodução ---
+
+    def proxima(self, tipo: str, nome: str, entrada):
+        """Gravação da chamada: primeiro pela entrada exata, senão a próxima não consumida do mesmo papel/tool."""
+        alvo = _hash(entrada)
+        with self._lock:
+            candidatas = [(i, it) for i, it in enumerate(self.dados["interacoes"])
+                          if i not in self._consumidas and it["tipo"] == tipo and it["nome"] == nome]
+            escolhida = next(((i, it) for i, it in candidatas if it["hash"] == alvo), None)
+            if escolhida is None and candidatas:
+                escolhida = candidatas[0]
+                logger.warning(f"📼 Entrada de {tipo} '{nome}' difere da gravada; usando a próxima na ordem")
+            if escolhida is None:
+                raise GravacaoAusente(f"Sem gravação restante para {tipo} '{nome}' no cassete {self.caminho}")
+            self._consumidas.add(escolhida[0])
+        interacao = escolhida[1]
+        if self.latencia == "original":
+            time.sleep(interacao["duracao_s"])
+        if "erro" in interacao:
+            raise RuntimeError(interacao["erro"])
+        return interacao
+
+    def ferramentas_reproduzidas(self) -> list:
+        return [FerramentaReproduzida(
+                    name=spec["nome"], description=spec["descricao"],
+                    args_schema=_modelo_argumentos(spec["nome"], spec["esquema"]), cassete=self)
+                for spec in self.dados["ferramentas"]]
+
+    # --- fim da requisição ---
+
+    def finalizar(self, resposta: str):
+        duracao = time.perf_counter() - self._inicio
+        if not self.reproduzindo:
+            self.dados.update(resposta=resposta, duracao_s=round(duracao, 4))
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+            temporario = f"{self.caminho}.tmp"
+            with gzip.open(temporario, "wt", encoding="utf-8") as f:
+                json.dump(self.dados, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(temporario, self.caminho)
+            logger.info(f"📼 Cassete gravado: {self.caminho} ({len(self.dados['interacoes'])} interações)")
+            return
+
+        restantes = len(self.dados["interacoes"]) - len(self._consumidas)
+        igual = resposta == self.dados.get("resposta")
+        logger.info(f"📼 Cassete reproduzido: {duracao:.2f}s (gravado: {self.dados.get('duracao_s', 0):.2f}s), "
+                    f"resposta {'idêntica' if igual else 'DIFERENTE'} da gravada, {restantes} interações não usadas")
+
+
+class LLMCassete(BaseLLM):
+    """Envolve o LLM de um papel: grava cada chamada ou a reproduz do cassete."""
+
+    def __init__(self, interno, papel: str, cassete: Cassete):
+        super().__init__(model=getattr(interno, "model", "?"), temperature=getattr(interno, "temperature", None))
+        self.interno = interno
+        self.papel = papel
+        self.cassete = cassete
+        self._uso = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "successful_requests": 0}
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs) -> str:
+        if self.cassete.reproduzindo:
+            saida = self.cassete.proxima("llm", self.papel, messages)["saida"]
+        else:
+            # As stop words são definidas pelo executor do agente neste objeto, não no interno
+            self.interno.stop = self.stop
+            inicio = time.perf_counter()
+            try:
+                saida = self.interno.call(messages, tools=tools, callbacks=callbacks,
+                                          available_functions=available_functions, **kwargs)
+            except Exception as e:
+                self.cassete.registrar("llm", self.papel, messages, inicio, erro=str(e))
+                raise
+            self.cassete.registrar("llm", self.papel, messages, inicio, saida=saida)
+
+        tokens_prompt = contar_tokens(json.dumps(messages, ensure_ascii=False, default=str))
+        tokens_saida = contar_tokens(str(saida))
+        self._uso["prompt_tokens"] += tokens_prompt
+        self._uso["completion_tokens"] += tokens_saida
+        self._uso["total_tokens"] += tokens_prompt + tokens_saida
+        self._uso["successful_requests"] += 1
+        return saida
+
+    def supports_function_calling(self) -> bool:
+        return self.interno.supports_function_calling()
+
+    def supports_stop_words(self) -> bool:
+        return self.interno.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self.interno.get_context_window_size()
+
+    def get_token_usage_summary(self):
+        return SimpleNamespace(**self._uso)
+
+
+class FerramentaGravada(FerramentaEnvolvida):
+    cassete: Any = None
+
+    def _run(self, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resultado = self._chamar_original(kwargs)
+        except Exception as e:
+            self.cassete.registrar("ferramenta", self.name, kwargs, inicio, erro=str(e))
+            raise
+        self.cassete.registrar("ferramenta", self.name, kwargs, inicio, saida=resultado)
+        return resultado
+
+
+class FerramentaReproduzida(BaseTool):
+    """Tool com nome, descrição e argumentos da gravada; responde com os resultados do cassete."""
+
+    cassete: Any = None
+
+    def _run(self, **kwargs):
+        return self.cassete.proxima("ferramenta", self.name, kwargs)["saida"]
+
+
+def _modelo_argumentos(nome: str, esquema: dict):
+    obrigatorios = set(esquema.get("required", []))
+    campos = {}
+    for campo, spec in esquema.get("properties", {}).items():
+        tipo = _TIPOS_JSON.get(spec.get("type"), Any)
+        padrao = ... if campo in obrigatorios else spec.get("default")
+        campos[campo] = (tipo if campo in obrigatorios else tipo | None, Field(padrao, description=spec.get("description")))
+    return create_model(f"{nome}_argumentos", **campos)
@@ -0,0 +1,52 @@
+# tools/chart_renderer.py
+
+import io
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CORES_RECEITAS = ["#2E8B57", "#32CD32", "#98FB98", "#3CB371", "#66CDAA", "#8FBC8F"]
+CORES_DESPESAS = ["#DC143C", "#FF6347", "#FFA07A", "#CD5C5C", "#F08080", "#FA8072"]
+
+# O pyplot mantém estado global; a renderização é serializada entre threads
+_lock_pyplot = threading.Lock()
+
+
+def _pizza(plt, valores_por_categoria: dict, titulo: str, cores: list) -> bytes:
+    categorias = list(valores_por_categoria)
+    valores = [float(v) for v in valores_por_categoria.values()]
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    ax.pie(valores, labels=categorias, colors=[cores[i % len(cores)] for i in range(len(valores))],
+           autopct="%1.1f%%", startangle=90, textprops={"fontsize": 12})
+    ax.set_title(titulo, fontsize=16, fontweight="bold", pad=20)
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=120, bbox_inches="tight", facecolor="white", edgecolor="none")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def renderizar_graficos(dados: dict) -> dict:
+    """
+    Gera os gráficos de pizza de receitas e despesas por categoria a partir do JSON do
+    coletor_dados_grafico ({"receitas": {...}, "despesas": {...}}). Retorna {nome_arquivo: bytes PNG}.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    arquivos = {}
+    for chave, titulo, cores in [("receitas", "💰 Receitas por Categoria", CORES_RECEITAS),
+                                 ("despesas", "💸 Despesas por Categoria", CORES_DESPESAS)]:
+        valores = {k: v for k, v in (dados.get(chave) or {}).items() if isinstance(v, (int, float)) and v > 0}
+        if not valores:
+            continue
+        try:
+            with _lock_pyplot:
+                arquivos[f"grafico_{chave}.png"] = _pizza(plt, valores, titulo, cores)
+        except Exception as e:
+            logger.error(f"Erro ao renderizar gráfico de {chave}: {e}")
+    return arquivos
@@ -0,0 +1,85 @@
+# tools/chat_history.py
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class HistoricoChat:
+    """
+    Histórico completo do chat (SQLite), por usuário. A interface mantém em memória e renderiza
+    só as últimas mensagens; as anteriores são carregadas daqui sob demanda, em páginas.
+    """
+
+    def __init__(self, caminho: str = "./historico_chat/historico.db"):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._local = threading.local()
+        self._conexao().executescript("""
+            CREATE TABLE IF NOT EXISTS mensagens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                imagens TEXT,
+                criado_em REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS mensagens_usuario_idx ON mensagens (user_id, id);
+        """)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def adicionar(self, user_id: str, message: dict) -> int:
+        """Grava a mensagem e retorna o id atribuído (guardado em message["id"])."""
+        cursor = self._conexao().execute(
+            "INSERT INTO mensagens (user_id, role, content, imagens, criado_em) VALUES (?, ?, ?, ?, ?)",
+            (user_id, message["role"], message["content"], _codificar_imagens(message.get("imagens")), time.time()),
+        )
+        message["id"] = cursor.lastrowid
+        return cursor.lastrowid
+
+    def atualizar(self, message: dict):
+        """Regrava conteúdo e imagens de uma mensagem já gravada (ex.: tarefa assíncrona concluída)."""
+        self._conexao().execute(
+            "UPDATE mensagens SET content = ?, imagens = ? WHERE id = ?",
+            (message["content"], _codificar_imagens(message.get("imagens")), message["id"]),
+        )
+
+    def anteriores(self, user_id: str, antes_de: int | None, limite: int) -> list:
+        """Até `limite` mensagens anteriores ao id `antes_de`, em ordem cronológica."""
+        linhas = self._conexao().execute(
+            "SELECT * FROM mensagens WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (user_id, antes_de if antes_de is not None else 2 ** 63 - 1, limite),
+        ).fetchall()
+        return [_mensagem(l) for l in reversed(linhas)]
+
+    def existe_anterior(self, user_id: str, antes_de: int) -> bool:
+        return self._conexao().execute(
+            "SELECT 1 FROM mensagens WHERE user_id = ? AND id < ? LIMIT 1", (user_id, antes_de)
+        ).fetchone() is not None
+
+    def limpar(self, user_id: str):
+        self._conexao().execute("DELETE FROM mensagens WHERE user_id = ?", (user_id,))
+
+
+def _codificar_imagens(imagens: list | None) -> str | None:
+    if not imagens:
+        return None
+    return json.dumps([base64.b64encode(i).decode("ascii") for i in imagens])
+
+
+def _mensagem(linha: sqlite3.Row) -> dict:
+    message = {"id": linha["id"], "role": linha["role"], "content": linha["content"]}
+    if linha["imagens"]:
+        message["imagens"] = [base64.b64decode(i) for i in json.loads(linha["imagens"])]
+    return message
@@ -0,0 +1,254 @@
+# tools/context_budget.py
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Limite de tokens de contexto (memória + resumo) injetado em cada etapa
+ORCAMENTO_PADRAO = {
+    "classificacao": 600,
+    "controle_insercao": 300,
+    "controle_consulta": 800,
+    "graficos": 400,
+    "consulta_ativos": 500,
+}
+
+MAX_TURNOS_BRUTOS = 6       # turnos mantidos na íntegra antes de irem para o resumo
+TOKENS_RESUMO = 400         # teto do resumo acumulado por usuário
+TOKENS_POR_TURNO_RESUMO = 60
+TOKENS_POR_TURNO = 150      # teto de cada turno bruto injetado no prompt
+MAX_ASSUNTOS = 40           # termos guardados das linhas que saíram do resumo
+ASSUNTOS_NO_CONTEXTO = 15
+MAX_TERMOS_POR_TURNO = 20
+DECAIMENTO_ASSUNTOS = 0.9
+MEIA_VIDA_RECENCIA_S = 30 * 60
+
+_STOPWORDS = {
+    "a", "o", "e", "de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas",
+    "um", "uma", "para", "por", "com", "que", "meu", "minha", "eu", "me", "se", "os", "as",
+}
+
+_encoder = None
+_encoder_carregado = False
+
+
+def _obter_encoder():
+    global _encoder, _encoder_carregado
+    if not _encoder_carregado:
+        _encoder_carregado = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoder = None
+    return _encoder
+
+
+def contar_tokens(texto: str) -> int:
+    """Conta tokens com tiktoken; sem ele, usa a aproximação de ~4 caracteres por token."""
+    if not texto:
+        return 0
+    encoder = _obter_encoder()
+    if encoder is not None:
+        return len(encoder.encode(texto))
+    return math.ceil(len(texto) / 4)
+
+
+def truncar_para_tokens(texto: str, limite: int) -> str:
+    if limite <= 0:
+        return ""
+    if contar_tokens(texto) <= limite:
+        return texto
+    encoder = _obter_encoder()
+    if encoder is not None:
+        return encoder.decode(encoder.encode(texto)[:limite]) + "…"
+    return texto[: limite * 4] + "…"
+
+
+def _lista_termos(texto: str) -> list:
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r"\w+", texto) if t not in _STOPWORDS and len(t) > 1]
+
+
+def _termos(texto: str) -> set:
+    return set(_lista_termos(texto))
+
+
+def _termos_do_turno(turno: dict) -> list:
+    """Assuntos de um turno, a partir do texto completo: termos da pergunta e os mais frequentes da resposta."""
+    pergunta = [t for t in dict.fromkeys(_lista_termos(turno["pergunta"])) if not t.isdigit()]
+    resposta = Counter(t for t in _lista_termos(turno["resposta"]) if not t.isdigit() and t not in pergunta)
+    return (pergunta + [t for t, _ in resposta.most_common()])[:MAX_TERMOS_POR_TURNO]
+
+
+def _resumir_turno(turno: dict) -> str:
+    """Resumo extrativo de um turno: pergunta na íntegra e início da resposta."""
+    data = time.strftime("%d/%m %H:%M", time.localtime(turno["ts"]))
+    linha = f"- [{data}] {turno['pergunta']} → {turno['resposta']}"
+    return truncar_para_tokens(" ".join(linha.split()), TOKENS_POR_TURNO_RESUMO)
+
+
+class ContextBudgeter:
+    """
+    Mantém um histórico curto por usuário e monta, para cada etapa das crews, um bloco de
+    contexto limitado em tokens. Turnos antigos viram uma linha curta no resumo acumulado; quando o
+    resumo passa do teto, as linhas mais antigas saem dele e só os seus termos mais frequentes ficam
+    num índice de assuntos. Assim o prompt não cresce com a conversa: os temas antigos continuam
+    visíveis, mas os detalhes (valores, datas) das conversas mais antigas se perdem.
+    """
+
+    def __init__(self, base_path: str = "./memory_store", orcamentos: dict | None = None, resumidor=None):
+        self.base_path = base_path
+        self.orcamentos = dict(ORCAMENTO_PADRAO)
+        config_env = os.getenv("FINANCEBOT_ORCAMENTO_CONTEXTO")
+        if config_env:
+            try:
+                self.orcamentos.update(json.loads(config_env))
+            except ValueError:
+                logger.error(f"FINANCEBOT_ORCAMENTO_CONTEXTO inválido: {config_env}")
+        if orcamentos:
+            self.orcamentos.update(orcamentos)
+        self.resumidor = resumidor or _resumir_turno
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def _caminho(self, user_id: str) -> str:
+        return os.path.join(self.base_path, user_id, "contexto.json")
+
+    def _carregar(self, user_id: str) -> dict:
+        try:
+            with open(self._caminho(user_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"resumo": [], "termos_resumo": [], "turnos": [], "assuntos": {}}
+
+    def _salvar(self, user_id: str, estado: dict):
+        caminho = self._caminho(user_id)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp = f"{caminho}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False)
+        os.replace(tmp, caminho)
+
+    def registrar_turno(self, user_id: str, pergunta: str, resposta: str):
+        """Guarda o turno e move os mais antigos para o resumo acumulado do usuário."""
+        with self._lock(user_id):
+            estado = self._carregar(user_id)
+            estado["turnos"].append({"pergunta": pergunta, "resposta": resposta, "ts": time.time()})
+
+            # Os termos de cada linha do resumo vêm do turno completo (a linha em si é truncada)
+            termos_resumo = estado.setdefault("termos_resumo", [])
+            termos_resumo[:0] = [None] * (len(estado["resumo"]) - len(termos_resumo))  # estado de versões antigas
+            while len(estado["turnos"]) > MAX_TURNOS_BRUTOS:
+                antigo = estado["turnos"].pop(0)
+                estado["resumo"].append(self.resumidor(antigo))
+                termos_resumo.append(_termos_do_turno(antigo))
+
+            # Acima do teto, as linhas mais antigas saem do resumo e deixam só os seus termos no índice
+            assuntos = estado.setdefault("assuntos", {})
+            while estado["resumo"] and contar_tokens("\n".join(estado["resumo"])) > TOKENS_RESUMO:
+                linha = estado["resumo"].pop(0)
+                termos = termos_resumo.pop(0)
+                if termos is None:
+                    termos = [t for t in _termos(linha.split("] ", 1)[-1]) if not t.isdigit()]
+                # Contagens decaem a cada linha incorporada, para assuntos novos poderem entrar no índice
+                assuntos = {termo: peso * DECAIMENTO_ASSUNTOS for termo, peso in assuntos.items()}
+                for termo in termos:
+                    assuntos[termo] = assuntos.get(termo, 0) + 1
+                estado["assuntos"] = assuntos
+            if len(assuntos) > MAX_ASSUNTOS:
+                assuntos = sorted(assuntos.items(), key=lambda a: a[1], reverse=True)[:MAX_ASSUNTOS]
+                estado["assuntos"] = {termo: round(peso, 3) for termo, peso in assuntos}
+
+            self._salvar(user_id, estado)
+
+    def _ranquear(self, turnos: list, consulta: str) -> list:
+        termos_consulta = _termos(consulta)
+        agora = time.time()
+        pontuados = []
+        for turno in turnos:
+            termos_turno = _termos(f"{turno['pergunta']} {turno['resposta']}")
+            uniao = termos_consulta | termos_turno
+            relevancia = len(termos_consulta & termos_turno) / len(uniao) if uniao else 0.0
+            recencia = 0.5 ** ((agora - turno["ts"]) / MEIA_VIDA_RECENCIA_S)
+            pontuados.append((0.6 * relevancia + 0.4 * recencia, turno))
+        pontuados.sort(key=lambda p: p[0], reverse=True)
+        return [turno for _, turno in pontuados]
+
+    def _resumo_no_orcamento(self, estado: dict, limite: int) -> str:
+        """Índice de assuntos (se couber) e as linhas do resumo da mais recente para a mais antiga, até o limite."""
+        restante = limite - contar_tokens("Resumo da conversa anterior:\n")
+        indice = ""
+        assuntos = sorted(estado.get("assuntos", {}).items(), key=lambda a: a[1], reverse=True)
+        if assuntos:
+            indice = "- Assuntos de conversas mais antigas: " + ", ".join(t for t, _ in assuntos[:ASSUNTOS_NO_CONTEXTO])
+            custo = contar_tokens(indice) + 1
+            if custo > restante:
+                indice = ""
+            else:
+                restante -= custo
+
+        linhas = []
+        for linha in reversed(estado["resumo"]):
+            custo = contar_tokens(linha) + 1
+            if custo > restante:
+                if not linhas:
+                    linhas.append(truncar_para_tokens(linha, restante))
+                break
+            linhas.insert(0, linha)
+            restante -= custo
+        return "\n".join(l for l in [indice] + linhas if l)
+
+    def montar_contexto(self, user_id: str, etapa: str, consulta: str) -> str:
+        """Retorna o contexto da etapa: resumo + turnos mais relevantes/recentes, dentro do orçamento."""
+        limite = self.orcamentos.get(etapa, 0)
+        if limite <= 0:
+            return ""
+
+        with self._lock(user_id):
+            estado = self._carregar(user_id)
+
+        partes = []
+        usados = 0
+        resumo = self._resumo_no_orcamento(estado, limite // 2)  # o resumo nunca ocupa mais que metade
+        if resumo:
+            partes.append(f"Resumo da conversa anterior:\n{resumo}")
+            usados += contar_tokens(partes[-1])
+
+        selecionados = []
+        for turno in self._ranquear(estado["turnos"], consulta):
+            resposta = truncar_para_tokens(turno["resposta"], TOKENS_POR_TURNO)
+            linha = f"- Usuário: {turno['pergunta']}\n  Assistente: {resposta}"
+            custo = contar_tokens(linha)
+            if usados + custo > limite:
+                continue
+            selecionados.append((turno["ts"], linha))
+            usados += custo
+
+        if selecionados:
+            selecionados.sort()
+            partes.append("Turnos recentes relevantes:\n" + "\n".join(linha for _, linha in selecionados))
+
+        contexto = "\n\n".join(partes)
+        logger.info(f"🧮 Contexto [{etapa}] user={user_id}: {usados}/{limite} tokens, "
+                    f"{len(selecionados)}/{len(estado['turnos'])} turnos")
+        return contexto
+
+    def registrar_prompt(self, etapa: str, *textos: str) -> int:
+        """Loga a contagem de tokens do prompt montado para a etapa."""
+        total = sum(contar_tokens(t) for t in textos)
+        logger.info(f"📏 Tokens de prompt [{etapa}]: {total}")
+        return total
@@ -0,0 +1,100 @@
+# tools/dedup.py
+
+import asyncio
+import hashlib
+import logging
+import re
+import unicodedata
+
+from tools.shared_cache import CacheBackend, MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+TTL_RESULTADOS_S = 120
+MAX_RESULTADOS = 1000
+
+
+def normalizar_pergunta(question: str) -> str:
+    """Minúsculas, sem acentos, pontuação nas bordas nem espaços repetidos."""
+    q = unicodedata.normalize("NFKD", question.strip().lower())
+    q = "".join(c for c in q if not unicodedata.combining(c))
+    q = re.sub(r"\s+", " ", q)
+    return q.strip(" .!?")
+
+
+def chave_requisicao(user_id: str, question: str, idempotency_key: str | None = None) -> str:
+    base = f"{user_id}\x00{normalizar_pergunta(question)}\x00{idempotency_key or ''}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+class RequestDeduplicator:
+    """
+    Junta requisições duplicadas (reruns do Streamlit, duplo clique, retries após timeout):
+    cópias que chegam com a original em andamento aguardam a mesma execução, e resultados
+    recentes são servidos de um cache curto (compartilhado entre workers quando o backend é).
+    """
+
+    def __init__(self, ttl_s: float = TTL_RESULTADOS_S, cache: CacheBackend | None = None):
+        self.ttl_s = ttl_s
+        self.cache = cache or MemoryBackend(max_itens=MAX_RESULTADOS)
+        self._em_andamento = {}
+
+    async def resultado_recente(self, chave: str):
+        """Resultado ainda em cache para a chave, ou None."""
+        return await asyncio.to_thread(self._obter_cache, chave)
+
+    async def esquecer(self, chave: str):
+        """Remove o resultado guardado da chave (ex.: o recurso que ele referencia deixou de existir)."""
+        await asyncio.to_thread(self._remover_cache, chave)
+
+    # O backend pode ser SQLite ou RESP (E/S bloqueante): as chamadas abaixo rodam fora do event loop
+
+    def _obter_cache(self, chave: str):
+        try:
+            return self.cache.get(f"dedup:{chave}")
+        except Exception as e:
+            logger.error(f"Erro ao ler cache de deduplicação: {e}")
+            return None
+
+    def _guardar_cache(self, chave: str, resultado):
+        try:
+            self.cache.set(f"dedup:{chave}", resultado, self.ttl_s)
+        except Exception as e:
+            logger.error(f"Erro ao gravar cache de deduplicação: {e}")
+
+    def _remover_cache(self, chave: str):
+        try:
+            self.cache.delete(f"dedup:{chave}")
+        except Exception as e:
+            logger.error(f"Erro ao remover do cache de deduplicação: {e}")
+
+    async def executar(self, chave: str, fabrica, guardar=None):
+        """
+        Executa `fabrica()` uma única vez por chave; duplicatas recebem o mesmo resultado. A execução
+        roda em task própria, então um cliente que desiste (timeout) não cancela o trabalho do retry.
+        `guardar(resultado)` decide se o resultado vai para o cache (ex.: respostas de erro não vão,
+        para que o retry execute de novo em vez de receber a mesma falha).
+        """
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            resultado = await self.resultado_recente(chave)
+            if resultado is not None:
+                logger.info(f"♻️ Requisição duplicada servida do cache ({chave[:12]})")
+                return resultado
+            tarefa = self._em_andamento.get(chave)  # outra cópia pode ter começado durante a leitura
+
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(self._executar_e_guardar(chave, fabrica, guardar))
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._em_andamento.pop(chave, None))
+        else:
+            logger.info(f"🔗 Requisição duplicada anexada à execução em andamento ({chave[:12]})")
+        return await asyncio.shield(tarefa)
+
+    async def _executar_e_guardar(self, chave: str, fabrica, guardar):
+        resultado = await fabrica()
+        if guardar is None or guardar(resultado):
+            await asyncio.to_thread(self._guardar_cache, chave, resultado)
+        else:
+            logger.info(f"🚫 Resultado não guardado no cache de deduplicação ({chave[:12]})")
+        return resultado
@@ -0,0 +1,55 @@
+# tools/fake_backends.py
+
+import json
+import os
+import random
+import time
+
+from crewai.tools import BaseTool
+
+# Latência simulada das tools falsas (ms); ajustável para aproximar o Supabase/yfmcp reais
+LATENCIA_MS = int(os.getenv("FINANCEBOT_MCP_FAKE_LATENCIA_MS", "150"))
+
+
+def _simular_latencia():
+    if LATENCIA_MS:
+        time.sleep(random.uniform(0.5, 1.5) * LATENCIA_MS / 1000)
+
+
+class FakeExecuteSqlTool(BaseTool):
+    name: str = "execute_sql"
+    description: str = (
+        "Executa SQL no banco Supabase (backend falso para testes offline). "
+        "Use fornecendo um campo 'query' com o comando SQL."
+    )
+
+    def _run(self, query: str) -> str:
+        _simular_latencia()
+        if query.strip().lower().startswith("select"):
+            return json.dumps([
+                {"categoria": "Alimentação", "tipo": "despesa", "total": 812.5},
+                {"categoria": "Transporte", "tipo": "despesa", "total": 300.0},
+                {"categoria": "Salário", "tipo": "receita", "total": 5000.0},
+            ], ensure_ascii=False)
+        return json.dumps({"linhas_afetadas": 1})
+
+
+class FakeTickerInfoTool(BaseTool):
+    name: str = "get_ticker_info"
+    description: str = (
+        "Retorna a cotação e dados básicos de um ativo (backend falso para testes offline). "
+        "Use fornecendo um campo 'symbol' com o código do ativo."
+    )
+
+    def _run(self, symbol: str) -> str:
+        _simular_latencia()
+        gerador = random.Random(symbol)
+        preco = round(gerador.uniform(5, 150), 2)
+        anterior = round(preco * gerador.uniform(0.97, 1.03), 2)
+        return json.dumps({"symbol": symbol, "regularMarketPrice": preco, "regularMarketPreviousClose": anterior,
+                           "currency": "BRL"})
+
+
+def criar_ferramentas_falsas() -> tuple:
+    """Substitutos offline das tools dos adaptadores MCP (FINANCEBOT_MCP_FAKE=1): (supabase, yfinance)."""
+    return [FakeExecuteSqlTool()], [FakeTickerInfoTool()]
@@ -0,0 +1,194 @@
+# tools/jobs.py
+
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDENTE = "pendente"
+STATUS_EXECUTANDO = "executando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+INTERVALO_LIMPEZA_S = 10 * 60
+_NOME_SEGURO = re.compile(r"^[\w.-]+$")
+
+
+class JobStore:
+    """
+    Persiste cada tarefa em <base_path>/<job_id>/ (job.json + arquivos gerados) até ser descartada.
+    O padrão é FINANCEBOT_JOBS_DIR ou ./jobs_store; cada processo precisa do seu próprio diretório,
+    porque na inicialização o JobManager retoma as pendentes e marca como erro as que estavam executando.
+    """
+
+    def __init__(self, base_path: str | None = None):
+        self.base_path = base_path or os.getenv("FINANCEBOT_JOBS_DIR", "./jobs_store")
+        os.makedirs(self.base_path, exist_ok=True)
+
+    def _dir(self, job_id: str) -> str:
+        if not _NOME_SEGURO.match(job_id):
+            raise ValueError(f"job_id inválido: {job_id}")
+        return os.path.join(self.base_path, job_id)
+
+    def salvar(self, job: dict):
+        pasta = self._dir(job["id"])
+        os.makedirs(pasta, exist_ok=True)
+        tmp = os.path.join(pasta, "job.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(pasta, "job.json"))
+
+    def carregar(self, job_id: str) -> dict | None:
+        try:
+            with open(os.path.join(self._dir(job_id), "job.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def salvar_arquivo(self, job_id: str, nome: str, conteudo: bytes):
+        if not _NOME_SEGURO.match(nome) or nome == "job.json":
+            raise ValueError(f"Nome de arquivo inválido: {nome}")
+        with open(os.path.join(self._dir(job_id), nome), "wb") as f:
+            f.write(conteudo)
+
+    def ler_arquivo(self, job_id: str, nome: str) -> bytes | None:
+        job = self.carregar(job_id)
+        if not job or nome not in job.get("arquivos", []):
+            return None
+        with open(os.path.join(self._dir(job_id), nome), "rb") as f:
+            return f.read()
+
+    def remover(self, job_id: str):
+        shutil.rmtree(self._dir(job_id), ignore_errors=True)
+
+    def listar(self) -> list:
+        jobs = []
+        for job_id in os.listdir(self.base_path):
+            if _NOME_SEGURO.match(job_id) and (job := self.carregar(job_id)):
+                jobs.append(job)
+        return jobs
+
+
+class JobManager:
+    """
+    Fila de tarefas longas (gráficos, análises) executadas por um pool de workers asyncio.
+    `executor(question, user_id, idempotency_key)` deve retornar (texto, {nome_arquivo: bytes}).
+    Resultados ficam no disco até o cliente descartá-los; com `ttl_resultados_s`, os concluídos há
+    mais tempo que isso são removidos por uma varredura periódica mesmo sem terem sido buscados.
+    """
+
+    def __init__(self, executor, workers: int = 2, store: JobStore | None = None,
+                 ttl_resultados_s: float | None = None):
+        self.executor = executor
+        self.num_workers = workers
+        self.store = store or JobStore()
+        self.ttl_resultados_s = ttl_resultados_s
+        self._fila = None
+        self._workers = []
+        self._eventos = {}
+
+    def _garantir_workers(self):
+        """
+        Cria a fila e os workers no loop em execução e retoma as pendentes do disco. Chamada pela primeira
+        consulta ou envio, para que tarefas de antes de um reinício andem mesmo sem um envio novo.
+        """
+        if self._fila is not None:
+            return
+        self._fila = asyncio.Queue()
+        for job in self.store.listar():
+            if job["status"] == STATUS_PENDENTE:
+                self._fila.put_nowait(job["id"])
+            elif job["status"] == STATUS_EXECUTANDO:
+                # Não reexecuta: a tarefa pode ter escrito dados antes da queda do processo
+                self._atualizar(job, status=STATUS_ERRO, erro="Tarefa interrompida pelo reinício do servidor.")
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.num_workers)]
+        if self.ttl_resultados_s:
+            self._workers.append(asyncio.create_task(self._limpar_periodicamente()))
+        logger.info(f"🧵 Pool de tarefas iniciado com {self.num_workers} workers")
+
+    def _atualizar(self, job: dict, **campos):
+        job.update(campos, atualizado_em=time.time())
+        self.store.salvar(job)
+
+    async def enviar(self, question: str, user_id: str, idempotency_key: str | None = None) -> dict:
+        self._garantir_workers()
+        job = {"id": uuid.uuid4().hex, "user_id": user_id, "question": question, "idempotency_key": idempotency_key,
+               "status": STATUS_PENDENTE, "criado_em": time.time(), "resultado": None, "erro": None, "arquivos": []}
+        self._atualizar(job)
+        self._eventos[job["id"]] = asyncio.Event()
+        await self._fila.put(job["id"])
+        logger.info(f"📨 Tarefa {job['id']} enfileirada (user={user_id})")
+        return job
+
+    async def _worker(self, indice: int):
+        while True:
+            job_id = await self._fila.get()
+            job = self.store.carregar(job_id)
+            if job is None:
+                continue
+            self._atualizar(job, status=STATUS_EXECUTANDO)
+            inicio = time.perf_counter()
+            try:
+                texto, arquivos = await self.executor(job["question"], job["user_id"], job.get("idempotency_key"))
+                for nome, conteudo in arquivos.items():
+                    self.store.salvar_arquivo(job_id, nome, conteudo)
+                self._atualizar(job, status=STATUS_CONCLUIDO, resultado=texto, arquivos=list(arquivos))
+            except Exception as e:
+                logger.error(f"Erro na tarefa {job_id}: {e}")
+                self._atualizar(job, status=STATUS_ERRO, erro=str(e))
+            logger.info(f"✅ Tarefa {job_id} finalizada pelo worker {indice} em {time.perf_counter() - inicio:.1f}s")
+            self._eventos.setdefault(job_id, asyncio.Event()).set()
+
+    async def status(self, job_id: str, aguardar_s: float = 0) -> dict | None:
+        """Status atual; com aguardar_s > 0, espera (long-poll) até a tarefa terminar ou o tempo acabar."""
+        self._garantir_workers()
+        job = self.store.carregar(job_id)
+        if job and aguardar_s > 0 and job["status"] in (STATUS_PENDENTE, STATUS_EXECUTANDO):
+            evento = self._eventos.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(evento.wait(), timeout=aguardar_s)
+            except asyncio.TimeoutError:
+                pass
+            job = self.store.carregar(job_id)
+        return job
+
+    def ler_arquivo(self, job_id: str, nome: str) -> bytes | None:
+        return self.store.ler_arquivo(job_id, nome)
+
+    def descartar(self, job_id: str) -> bool:
+        """Remove a tarefa do disco depois que o cliente buscou o resultado."""
+        job = self.store.carregar(job_id)
+        if job is None or job["status"] in (STATUS_PENDENTE, STATUS_EXECUTANDO):
+            return False
+        self.store.remover(job_id)
+        self._eventos.pop(job_id, None)
+        return True
+
+    def limpar_expirados(self, ttl_s: float) -> list:
+        """Remove do disco as tarefas finalizadas há mais de ttl_s (E/S de disco: rodar fora do event loop)."""
+        limite = time.time() - ttl_s
+        removidas = []
+        for job in self.store.listar():
+            if job["status"] in (STATUS_CONCLUIDO, STATUS_ERRO) and job.get("atualizado_em", 0) < limite:
+                self.store.remover(job["id"])
+                removidas.append(job["id"])
+        return removidas
+
+    async def _limpar_periodicamente(self):
+        while True:
+            await asyncio.sleep(INTERVALO_LIMPEZA_S)
+            try:
+                removidas = await asyncio.to_thread(self.limpar_expirados, self.ttl_resultados_s)
+            except Exception as e:
+                logger.error(f"Erro na limpeza de tarefas expiradas: {e}")
+                continue
+            for job_id in removidas:
+                self._eventos.pop(job_id, None)
+            if removidas:
+                logger.info(f"🧹 {len(removidas)} tarefas não buscadas removidas após {self.ttl_resultados_s:.0f}s")
@@ -0,0 +1,253 @@
+# tools/ledger.py
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 50
+INTERVALO_SINCRONIZACAO_S = 5.0
+ESPERA_MAX_RETENTATIVA_S = 300
+RESERVA_LOTE_S = 120        # lote reservado por um sincronizador; volta a ficar pendente se ele cair no meio do envio
+COLUNAS_SUPABASE = ["valor", "tipo", "categoria", "conta_id", "data_transacao", "descricao", "idempotency_key"]
+
+
+def validar_transacao(dados: dict, resolver_data=None) -> dict | None:
+    """
+    Normaliza os dados de inserção vindos do classificador. Retorna None se algo essencial
+    estiver faltando ou inválido (nesse caso a inserção segue pela crew).
+    """
+    try:
+        valor = float(str(dados.get("valor")).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    tipo = str(dados.get("tipo", "")).strip().lower()
+    categoria = str(dados.get("categoria") or "").strip()
+    if valor <= 0 or tipo not in ("receita", "despesa") or not categoria:
+        return None
+
+    data = str(dados.get("data_transacao") or "hoje").strip()
+    try:
+        datetime.strptime(data, "%Y-%m-%d")
+    except ValueError:
+        if resolver_data is None:
+            return None
+        data = resolver_data(data)
+        try:
+            datetime.strptime(data, "%Y-%m-%d")
+        except ValueError:
+            return None
+
+    try:
+        conta_id = int(dados.get("conta_id") or 5)
+    except (TypeError, ValueError):
+        conta_id = 5
+
+    return {"valor": round(valor, 2), "tipo": tipo, "categoria": categoria, "conta_id": conta_id,
+            "data_transacao": data, "descricao": str(dados.get("descricao") or "").strip()}
+
+
+class LivroLocal:
+    """
+    Livro-razão local (SQLite em modo WAL) das transações validadas. A inserção é confirmada
+    ao usuário assim que gravada aqui; o envio ao Supabase é feito depois pelo SincronizadorSupabase.
+    """
+
+    def __init__(self, caminho: str = "./ledger/transacoes.db"):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._local = threading.local()
+        self._conexao().executescript("""
+            CREATE TABLE IF NOT EXISTS transacoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                user_id TEXT,
+                valor REAL NOT NULL,
+                tipo TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                conta_id INTEGER NOT NULL,
+                data_transacao TEXT NOT NULL,
+                descricao TEXT,
+                criado_em REAL NOT NULL,
+                sincronizado_em REAL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa_em REAL NOT NULL DEFAULT 0,
+                ultimo_erro TEXT
+            );
+            CREATE INDEX IF NOT EXISTS transacoes_pendentes_idx
+                ON transacoes (sincronizado_em, proxima_tentativa_em);
+            CREATE INDEX IF NOT EXISTS transacoes_usuario_idx
+                ON transacoes (user_id, sincronizado_em);
+        """)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def registrar(self, user_id: str, transacao: dict, idempotency_key: str | None = None) -> tuple:
+        """Grava a transação validada. Retorna (linha, nova); com chave repetida, devolve a linha existente."""
+        chave = idempotency_key or uuid.uuid4().hex
+        conn = self._conexao()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO transacoes (idempotency_key, user_id, valor, tipo, categoria, conta_id, "
+            "data_transacao, descricao, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (chave, user_id, transacao["valor"], transacao["tipo"], transacao["categoria"], transacao["conta_id"],
+             transacao["data_transacao"], transacao["descricao"], time.time()),
+        )
+        linha = conn.execute("SELECT * FROM transacoes WHERE idempotency_key = ?", (chave,)).fetchone()
+        return dict(linha), cursor.rowcount == 1
+
+    def pendentes(self, limite: int = TAMANHO_LOTE, reserva_s: float = RESERVA_LOTE_S) -> list:
+        """
+        Reserva e retorna o próximo lote a sincronizar (respeitando a espera entre retentativas). A reserva
+        adia `proxima_tentativa_em` no mesmo UPDATE, então workers que compartilham o livro não enviam o
+        mesmo lote; se o envio não terminar (nem com sucesso nem com falha), o lote volta após `reserva_s`.
+        """
+        agora = time.time()
+        linhas = self._conexao().execute(
+            "UPDATE transacoes SET proxima_tentativa_em = ? WHERE id IN ("
+            "SELECT id FROM transacoes WHERE sincronizado_em IS NULL AND proxima_tentativa_em <= ? ORDER BY id LIMIT ?"
+            ") RETURNING *",
+            (agora + reserva_s, agora, limite),
+        ).fetchall()
+        return sorted((dict(l) for l in linhas), key=lambda l: l["id"])
+
+    def nao_sincronizadas(self, user_id: str, limite: int = 100) -> list:
+        """
+        Transações do usuário ainda não confirmadas pelo Supabase, para as consultas somarem aos resultados
+        do banco. Algumas podem já estar lá (lote em envio, ou enviado depois desta leitura): a consulta
+        exclui as mesmas chaves com `filtro_sem_duplicatas`.
+        """
+        linhas = self._conexao().execute(
+            "SELECT valor, tipo, categoria, conta_id, data_transacao, descricao, idempotency_key FROM transacoes "
+            "WHERE sincronizado_em IS NULL AND user_id = ? ORDER BY id LIMIT ?", (user_id, limite)
+        ).fetchall()
+        return [dict(l) for l in linhas]
+
+    def marcar_sincronizadas(self, ids: list):
+        self._conexao().execute(
+            f"UPDATE transacoes SET sincronizado_em = ?, ultimo_erro = NULL WHERE id IN ({','.join('?' * len(ids))})",
+            (time.time(), *ids),
+        )
+
+    def registrar_falha(self, ids: list, erro: str):
+        """Incrementa as tentativas e agenda a próxima com espera exponencial."""
+        conn = self._conexao()
+        agora = time.time()
+        for id_ in ids:
+            tentativas = conn.execute("SELECT tentativas FROM transacoes WHERE id = ?", (id_,)).fetchone()[0] + 1
+            conn.execute(
+                "UPDATE transacoes SET tentativas = ?, ultimo_erro = ?, proxima_tentativa_em = ? WHERE id = ?",
+                (tentativas, erro[:500], agora + min(ESPERA_MAX_RETENTATIVA_S, 2 ** tentativas), id_),
+            )
+
+
+def _literal_sql(valor) -> str:
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, (int, float)):
+        return repr(valor)
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def filtro_sem_duplicatas(linhas: list) -> str:
+    """
+    Condição SQL que tira do resultado do Supabase as transações que já vão somadas a partir do livro
+    local, para nenhuma ser contada duas vezes. Linhas sem chave no banco continuam no resultado.
+    """
+    chaves = ", ".join(_literal_sql(l["idempotency_key"]) for l in linhas)
+    return f"(idempotency_key IS NULL OR idempotency_key NOT IN ({chaves}))"
+
+
+def montar_insert_lote(linhas: list, tabela: str) -> str:
+    valores = ",\n".join("(" + ", ".join(_literal_sql(l[c]) for c in COLUNAS_SUPABASE) + ")" for l in linhas)
+    return (f"INSERT INTO {tabela} ({', '.join(COLUNAS_SUPABASE)}) VALUES\n{valores}\n"
+            f"ON CONFLICT (idempotency_key) DO NOTHING;")
+
+
+class SincronizadorSupabase:
+    """
+    Envia as transações pendentes do livro local ao Supabase em lotes, em segundo plano, com
+    retentativas. O laço roda numa thread com event loop próprio, iniciada junto com o servidor,
+    então transações que ficaram pendentes de uma execução anterior são enviadas sem esperar uma
+    requisição. `executar_sql(sql)` é síncrona (tool execute_sql do MCP) e roda em thread.
+    O ON CONFLICT na idempotency_key torna o reenvio de um lote seguro.
+    """
+
+    def __init__(self, livro: LivroLocal, executar_sql, tabela: str = "transacoes",
+                 lote: int = TAMANHO_LOTE, intervalo_s: float = INTERVALO_SINCRONIZACAO_S):
+        self.livro = livro
+        self.executar_sql = executar_sql
+        self.tabela = tabela
+        self.lote = lote
+        self.intervalo_s = intervalo_s
+        self._thread = None
+        self._loop = None
+        self._acordar = None
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """Inicia o laço de sincronização em segundo plano (idempotente)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            pronto = threading.Event()
+            self._thread = threading.Thread(target=self._executar, args=(pronto,), name="sincronizador", daemon=True)
+            self._thread.start()
+        pronto.wait()
+        logger.info("🔄 Sincronizador do livro local iniciado")
+
+    def _executar(self, pronto: threading.Event):
+        async def principal():
+            self._loop = asyncio.get_running_loop()
+            self._acordar = asyncio.Event()
+            pronto.set()
+            await self._laco()
+
+        asyncio.run(principal())
+
+    def acordar(self):
+        """Antecipa o próximo envio (pode ser chamada de qualquer thread ou event loop)."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._acordar.set)
+
+    async def sincronizar_uma_vez(self) -> int:
+        """Envia lotes até não haver mais pendentes prontos. Retorna quantas linhas foram sincronizadas."""
+        total = 0
+        while linhas := self.livro.pendentes(self.lote):
+            ids = [l["id"] for l in linhas]
+            try:
+                await asyncio.to_thread(self.executar_sql, montar_insert_lote(linhas, self.tabela))
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar {len(ids)} transações com o Supabase: {e}")
+                self.livro.registrar_falha(ids, str(e))
+                break
+            self.livro.marcar_sincronizadas(ids)
+            total += len(ids)
+            logger.info(f"☁️ {len(ids)} transações sincronizadas com o Supabase")
+        return total
+
+    async def _laco(self):
+        while True:
+            try:
+                await self.sincronizar_uma_vez()
+            except Exception as e:
+                logger.error(f"Erro no sincronizador do livro local: {e}")
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=self.intervalo_s)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
@@ -0,0 +1,341 @@
+# tools/load_test.py
+"""
+Teste de carga do endpoint SSE do servidor MCP.
+
+Abre N sessões `fastmcp.Client` (usuários simulados), envia perguntas com chegadas de Poisson
+na taxa configurada e registra vazão, percentis de latência, taxa de erro, RSS do servidor e
+número de processos filhos ao longo do tempo. O relatório JSON de cada execução fica em
+./relatorios_carga/ e pode ser comparado com uma execução anterior (--comparar).
+
+Uso offline (LLM stub + backends MCP falsos, servidor iniciado pelo próprio script):
+    python -m tools.load_test --offline --usuarios 20 --taxa 5 --duracao 60
+
+Contra um servidor já em execução:
+    python -m tools.load_test --url http://127.0.0.1:8005/sse --pid <pid do servidor>
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from fastmcp import Client
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Mistura de perguntas: (tipo, peso, modelos de pergunta)
+MISTURA_PADRAO = [
+    ("insercao", 0.4, ["Gastei {v} reais no mercado hoje", "Recebi {v} de freelance ontem",
+                       "Paguei {v} de conta de luz", "Gastei {v} com uber"]),
+    ("consulta", 0.3, ["Quanto gastei este mês?", "Qual meu saldo atual?",
+                       "Total de despesas com alimentação em julho"]),
+    ("cotacao", 0.2, ["Qual o preço da PETR4?", "Cotação da VALE3", "Como está o dólar?", "Preço da ITUB4 hoje"]),
+    ("grafico", 0.1, ["Gere um gráfico das minhas despesas", "Quero um gráfico de receitas e despesas"]),
+]
+
+
+def percentil(valores: list, p: float) -> float | None:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return round(ordenados[indice], 3)
+
+
+def _texto(result) -> str:
+    for item in getattr(result, "content", None) or []:
+        if getattr(item, "text", None):
+            return item.text
+    return str(result)
+
+
+# === Monitoramento do processo servidor ===
+
+def _ler_proc_status(pid: int) -> dict:
+    campos = {}
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for linha in f:
+                chave, _, valor = linha.partition(":")
+                campos[chave] = valor.strip()
+    except OSError:
+        pass
+    return campos
+
+
+def rss_mb(pid: int) -> float | None:
+    try:
+        import psutil
+        return round(psutil.Process(pid).memory_info().rss / 2**20, 1)
+    except ImportError:
+        valor = _ler_proc_status(pid).get("VmRSS")
+        return round(int(valor.split()[0]) / 1024, 1) if valor else None
+    except Exception:
+        return None
+
+
+def contar_filhos(pid: int) -> int | None:
+    """Número de processos descendentes (adaptadores MCP via npx/uvx e seus filhos)."""
+    try:
+        import psutil
+        return len(psutil.Process(pid).children(recursive=True))
+    except ImportError:
+        pass
+    except Exception:
+        return None
+
+    if not os.path.isdir("/proc"):
+        return None
+    filhos_por_pai = defaultdict(list)
+    for entrada in os.listdir("/proc"):
+        if entrada.isdigit():
+            ppid = _ler_proc_status(int(entrada)).get("PPid")
+            if ppid:
+                filhos_por_pai[int(ppid)].append(int(entrada))
+    total, pendentes = 0, [pid]
+    while pendentes:
+        filhos = filhos_por_pai.get(pendentes.pop(), [])
+        total += len(filhos)
+        pendentes.extend(filhos)
+    return total
+
+
+async def monitorar(pid: int | None, amostras: list, parar: asyncio.Event, inicio: float, intervalo_s: float = 1.0):
+    while not parar.is_set():
+        if pid:
+            rss, filhos = await asyncio.to_thread(lambda: (rss_mb(pid), contar_filhos(pid)))
+            amostras.append({"t": round(time.perf_counter() - inicio, 1), "rss_mb": rss, "filhos": filhos})
+        try:
+            await asyncio.wait_for(parar.wait(), timeout=intervalo_s)
+        except asyncio.TimeoutError:
+            pass
+
+
+# === Servidor offline ===
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor_offline(porta: int, latencia_llm_ms: int, latencia_mcp_ms: int):
+    """Sobe o servidor com LLM stub e backends MCP falsos, em diretório temporário (memória/jobs isolados)."""
+    env = {**os.environ,
+           "FINANCEBOT_LLM_STUB": "1", "FINANCEBOT_LLM_STUB_LATENCIA_MS": str(latencia_llm_ms),
+           "FINANCEBOT_MCP_FAKE": "1", "FINANCEBOT_MCP_FAKE_LATENCIA_MS": str(latencia_mcp_ms),
+           "FINANCEBOT_PORTA": str(porta), "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "offline"),
+           "CREWAI_DISABLE_TELEMETRY": "true", "OTEL_SDK_DISABLED": "true", "FINANCEBOT_LIMITE_REQ_MIN": "0",
+           "PYTHONPATH": os.pathsep.join(filter(None, [RAIZ, os.getenv("PYTHONPATH")]))}
+    processo = subprocess.Popen([sys.executable, os.path.join(RAIZ, "src", "mcp_server.py")], env=env,
+                                cwd=tempfile.mkdtemp(prefix="financebot_carga_"),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"Servidor offline terminou com código {processo.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", porta), timeout=1).close()
+            return processo
+        except OSError:
+            time.sleep(0.5)
+    processo.terminate()
+    raise RuntimeError("Servidor offline não respondeu em 60s")
+
+
+# === Geração de carga ===
+
+def sortear_pergunta(rng: random.Random, mistura: list) -> tuple:
+    tipo, _, modelos = rng.choices(mistura, weights=[m[1] for m in mistura])[0]
+    return tipo, rng.choice(modelos).format(v=rng.randint(10, 900))
+
+
+async def executar_requisicao(client: Client, tipo: str, pergunta: str, user_id: str, timeout_s: float) -> str:
+    argumentos = {"question": pergunta, "user_id": user_id, "idempotency_key": uuid.uuid4().hex}
+    if tipo == "grafico":
+        # Mesmo fluxo da interface web: tarefa assíncrona + long-poll do status
+        job = json.loads(_texto(await client.call_tool("enviar_tarefa", argumentos)))
+        limite = time.monotonic() + timeout_s
+        while time.monotonic() < limite:
+            status = json.loads(_texto(await client.call_tool("status_tarefa", {"job_id": job["id"], "aguardar_s": 10})))
+            if status["status"] not in ("pendente", "executando"):
+                await client.call_tool("descartar_tarefa", {"job_id": job["id"]})
+                if status["status"] != "concluido":
+                    raise RuntimeError(status.get("erro") or status["status"])
+                return status["resultado"]
+        raise TimeoutError("tarefa não concluiu no prazo")
+    return _texto(await asyncio.wait_for(client.call_tool("assistente_financeiro_inteligente", argumentos), timeout_s))
+
+
+async def usuario_simulado(url: str, fila: asyncio.Queue, registros: list, inicio: float, timeout_s: float):
+    user_id = f"carga-{uuid.uuid4().hex[:8]}"
+    async with Client(f"{url}?user_id={user_id}") as client:
+        while True:
+            item = await fila.get()
+            if item is None:
+                return
+            chegada, tipo, pergunta = item
+            erro = None
+            try:
+                await executar_requisicao(client, tipo, pergunta, user_id, timeout_s)
+            except Exception as e:
+                erro = f"{type(e).__name__}: {e}"[:200]
+            fim = time.perf_counter()
+            # A latência inclui a espera na fila: mede o que o usuário perceberia com chegadas abertas
+            registros.append({"tipo": tipo, "chegada": round(chegada - inicio, 3), "fim": round(fim - inicio, 3),
+                              "latencia_s": round(fim - chegada, 3), "erro": erro})
+
+
+async def gerar_carga(args, pid: int | None) -> dict:
+    rng = random.Random(args.semente)
+    fila, registros, amostras = asyncio.Queue(), [], []
+    parar_monitor = asyncio.Event()
+    inicio = time.perf_counter()
+
+    monitor = asyncio.create_task(monitorar(pid, amostras, parar_monitor, inicio))
+    usuarios = [asyncio.create_task(usuario_simulado(args.url, fila, registros, inicio, args.timeout))
+                for _ in range(args.usuarios)]
+
+    enviadas = 0
+    while time.perf_counter() - inicio < args.duracao:
+        await asyncio.sleep(rng.expovariate(args.taxa))
+        tipo, pergunta = sortear_pergunta(rng, MISTURA_PADRAO)
+        await fila.put((time.perf_counter(), tipo, pergunta))
+        enviadas += 1
+
+    for _ in usuarios:
+        await fila.put(None)
+    resultados = await asyncio.gather(*usuarios, return_exceptions=True)
+    parar_monitor.set()
+    await monitor
+    duracao_total = time.perf_counter() - inicio
+
+    falhas_sessao = [str(r) for r in resultados if isinstance(r, Exception)]
+    return montar_relatorio(args, enviadas, registros, amostras, duracao_total, falhas_sessao)
+
+
+def _estatisticas(registros: list) -> dict:
+    ok = [r["latencia_s"] for r in registros if not r["erro"]]
+    return {
+        "requisicoes": len(registros),
+        "erros": len(registros) - len(ok),
+        "taxa_erro": round((len(registros) - len(ok)) / len(registros), 4) if registros else 0.0,
+        "latencia_p50_s": percentil(ok, 50),
+        "latencia_p90_s": percentil(ok, 90),
+        "latencia_p95_s": percentil(ok, 95),
+        "latencia_p99_s": percentil(ok, 99),
+        "latencia_max_s": max(ok) if ok else None,
+    }
+
+
+def montar_relatorio(args, enviadas: int, registros: list, amostras: list, duracao_s: float, falhas_sessao: list) -> dict:
+    por_segundo = defaultdict(lambda: {"concluidas": 0, "erros": 0})
+    for r in registros:
+        segundo = por_segundo[int(r["fim"])]
+        segundo["erros" if r["erro"] else "concluidas"] += 1
+
+    erros_frequentes = defaultdict(int)
+    for r in registros:
+        if r["erro"]:
+            erros_frequentes[r["erro"]] += 1
+
+    return {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "config": {"url": args.url, "usuarios": args.usuarios, "taxa_chegada_rps": args.taxa,
+                   "duracao_s": args.duracao, "offline": args.offline, "semente": args.semente},
+        "enviadas": enviadas,
+        "duracao_real_s": round(duracao_s, 2),
+        "vazao_rps": round(sum(1 for r in registros if not r["erro"]) / duracao_s, 3),
+        "geral": _estatisticas(registros),
+        "por_tipo": {tipo: _estatisticas([r for r in registros if r["tipo"] == tipo])
+                     for tipo in sorted({r["tipo"] for r in registros})},
+        "erros_frequentes": dict(sorted(erros_frequentes.items(), key=lambda e: -e[1])[:10]),
+        "falhas_sessao": falhas_sessao,
+        "servidor": {
+            "rss_max_mb": max((a["rss_mb"] for a in amostras if a["rss_mb"] is not None), default=None),
+            "filhos_max": max((a["filhos"] for a in amostras if a["filhos"] is not None), default=None),
+        },
+        "serie_temporal": {
+            "processo": amostras,
+            "vazao": [{"t": t, **v} for t, v in sorted(por_segundo.items())],
+        },
+    }
+
+
+def imprimir_resumo(relatorio: dict, anterior: dict | None = None):
+    def linha(nome, chave, fonte, fonte_ant):
+        atual = fonte.get(chave)
+        texto = f"  {nome:<22} {atual}"
+        if fonte_ant is not None and isinstance(atual, (int, float)) and isinstance(fonte_ant.get(chave), (int, float)):
+            delta = atual - fonte_ant[chave]
+            texto += f"   (antes {fonte_ant[chave]}, Δ {delta:+.3f})"
+        print(texto)
+
+    geral, geral_ant = relatorio["geral"], anterior["geral"] if anterior else None
+    print("=" * 60)
+    print(f"📈 Teste de carga: {relatorio['config']['usuarios']} usuários, "
+          f"{relatorio['config']['taxa_chegada_rps']} req/s por {relatorio['config']['duracao_s']}s")
+    linha("vazão (req/s)", "vazao_rps", relatorio, anterior)
+    for chave in ["requisicoes", "taxa_erro", "latencia_p50_s", "latencia_p95_s", "latencia_p99_s"]:
+        linha(chave, chave, geral, geral_ant)
+    linha("RSS máx. (MB)", "rss_max_mb", relatorio["servidor"], anterior["servidor"] if anterior else None)
+    linha("processos filhos máx.", "filhos_max", relatorio["servidor"], anterior["servidor"] if anterior else None)
+    for tipo, est in relatorio["por_tipo"].items():
+        print(f"  [{tipo}] n={est['requisicoes']} erros={est['erros']} p50={est['latencia_p50_s']} p95={est['latencia_p95_s']}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor MCP (SSE) do Financebot")
+    parser.add_argument("--url", default="http://127.0.0.1:8005/sse")
+    parser.add_argument("--pid", type=int, help="PID do servidor para medir RSS e processos filhos")
+    parser.add_argument("--usuarios", type=int, default=10, help="sessões fastmcp.Client simultâneas")
+    parser.add_argument("--taxa", type=float, default=2.0, help="taxa média de chegada (requisições/s)")
+    parser.add_argument("--duracao", type=float, default=60.0, help="duração da geração de carga (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout por requisição (s)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--offline", action="store_true", help="sobe um servidor com LLM stub e MCP falsos")
+    parser.add_argument("--latencia-llm-ms", type=int, default=300, help="latência simulada do LLM stub (offline)")
+    parser.add_argument("--latencia-mcp-ms", type=int, default=150, help="latência simulada das tools MCP (offline)")
+    parser.add_argument("--saida", default="relatorios_carga")
+    parser.add_argument("--comparar", help="relatório JSON anterior para comparação")
+    args = parser.parse_args()
+
+    servidor = None
+    if args.offline:
+        porta = _porta_livre()
+        args.url = f"http://127.0.0.1:{porta}/sse"
+        servidor = iniciar_servidor_offline(porta, args.latencia_llm_ms, args.latencia_mcp_ms)
+        args.pid = servidor.pid
+
+    try:
+        relatorio = asyncio.run(gerar_carga(args, args.pid))
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait(timeout=10)
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(args.saida, f"carga_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+    imprimir_resumo(relatorio, anterior)
+    print(f"💾 Relatório salvo em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
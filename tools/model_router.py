@@ -0,0 +1,250 @@
+# tools/model_router.py
+
+import json
+import logging
+import os
+import re
+import statistics
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict, deque
+from types import SimpleNamespace
+
+from crewai import LLM
+from crewai.llms.base_llm import BaseLLM
+
+from tools.cassettes import cassete_atual
+from tools.context_budget import contar_tokens
+
+logger = logging.getLogger(__name__)
+
+# Modelo, teto de tokens e temperatura por papel de agente. Papéis de classificação e
+# redação aceitam modelos mais baratos; "escalar_para" é usado quando a saída não é JSON válido.
+ROTAS_PADRAO = {
+    "padrao":          {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 1500, "temperature": 0.2},
+    "classificador":   {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 400, "temperature": 0.0,
+                        "escalar_para": "gpt-4o"},
+    "coletor":         {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 500, "temperature": 0.0},
+    "gestor_dados":    {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 1500, "temperature": 0.0},
+    "coletor_grafico": {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 1000, "temperature": 0.0},
+    "gerador_grafico": {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 2000, "temperature": 0.1},
+    "analista_ativos": {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 1000, "temperature": 0.2},
+    "redator":         {"provider": "openai", "model": "gpt-4o-mini", "max_tokens": 600, "temperature": 0.3},
+}
+
+JANELA_METRICAS = 500
+MAX_PAPEIS_REGISTRADOS = 4096   # LLMs recentes cujo papel é conhecido (cada requisição cria alguns)
+
+
+def carregar_rotas() -> dict:
+    """
+    Carrega as rotas padrão e aplica o arquivo JSON indicado em FINANCEBOT_MODELOS (se houver).
+    FINANCEBOT_LLM_STUB=1 força o modelo local stub em todos os papéis (uso offline/testes), com
+    latência simulada opcional em FINANCEBOT_LLM_STUB_LATENCIA_MS.
+    """
+    rotas = {papel: dict(cfg) for papel, cfg in ROTAS_PADRAO.items()}
+    caminho = os.getenv("FINANCEBOT_MODELOS")
+    if caminho:
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                for papel, cfg in json.load(f).items():
+                    rotas.setdefault(papel, dict(rotas["padrao"])).update(cfg)
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao carregar rotas de modelos de {caminho}: {e}")
+    if os.getenv("FINANCEBOT_LLM_STUB") == "1":
+        latencia_ms = int(os.getenv("FINANCEBOT_LLM_STUB_LATENCIA_MS", "0"))
+        for cfg in rotas.values():
+            cfg["provider"] = "stub"
+            cfg.setdefault("latencia_ms", latencia_ms)
+    return rotas
+
+
+class StubLLM(BaseLLM):
+    """
+    Modelo local determinístico para testes offline. Responde no formato ReAct esperado pelo
+    crewai; para o classificador, devolve o JSON de classificação a partir de palavras-chave.
+    """
+
+    def __init__(self, model: str = "stub", temperature: float | None = None, latencia_ms: int = 0, **kwargs):
+        super().__init__(model=model, temperature=temperature)
+        self.latencia_ms = latencia_ms
+        self._uso = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "successful_requests": 0}
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs) -> str:
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+
+        frase = re.search(r'analisar a seguinte frase: "(.*?)"', prompt, re.S)
+        if frase:
+            resposta = json.dumps(classificar_por_palavras_chave(frase.group(1)), ensure_ascii=False)
+        else:
+            resposta = "Resposta gerada pelo modelo local de testes."
+        saida = f"Thought: I now know the final answer\nFinal Answer: {resposta}"
+
+        tokens_prompt, tokens_saida = contar_tokens(prompt), contar_tokens(saida)
+        self._uso["prompt_tokens"] += tokens_prompt
+        self._uso["completion_tokens"] += tokens_saida
+        self._uso["total_tokens"] += tokens_prompt + tokens_saida
+        self._uso["successful_requests"] += 1
+        return saida
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 128000
+
+    def get_token_usage_summary(self):
+        return SimpleNamespace(**self._uso)
+
+
+def classificar_por_palavras_chave(frase: str) -> dict:
+    """Classificação heurística usada pelo StubLLM (mesmos formatos do classificador real)."""
+    q = frase.lower()
+    if "gráfico" in q or "grafico" in q:
+        return {"classificacao": "GERAR_GRAFICO", "status": "COMPLETO",
+                "dados": {"tipo_grafico": "receitas_despesas_categoria", "periodo": "ultimo_mes"}}
+    if "carteira" in q or "meus investimentos" in q:
+        return {"classificacao": "CONTROLE_FINANCEIRO", "status": "COMPLETO",
+                "dados": {"consulta": frase, "carteira": True}}
+    simbolo = re.search(r"\b([A-Z]{4}\d{1,2}|\^[A-Z]+|[A-Z]{6})\b", frase)
+    operacao = re.search(r"(\d+)\s+(?:ações\s+(?:de\s+|da\s+|do\s+)?)?([A-Z]{4}\d{1,2})\s+a\s+(?:R\$\s*)?(\d+(?:[.,]\d+)?)", frase)
+    if operacao and any(p in q for p in ["investi", "comprei", "vendi"]):
+        quantidade, preco = int(operacao.group(1)), float(operacao.group(3).replace(",", "."))
+        venda = "vendi" in q
+        return {"classificacao": "CONTROLE_FINANCEIRO", "status": "COMPLETO",
+                "dados": {"valor": round(quantidade * preco, 2), "tipo": "receita" if venda else "despesa",
+                          "conta_id": 5, "categoria": "Investimentos", "data_transacao": "hoje", "descricao": frase,
+                          "ativo": {"simbolo": operacao.group(2), "quantidade": quantidade, "preco_unitario": preco,
+                                    "operacao": "venda" if venda else "compra"}}}
+    if simbolo or any(p in q for p in ["cotação", "cotacao", "preço", "preco", "dólar", "dolar"]):
+        return {"classificacao": "CONSULTA_ATIVO", "status": "COMPLETO",
+                "dados": {"simbolo": simbolo.group(1) if simbolo else "USDBRL", "tipo_consulta": "cotacao"}}
+    valor = re.search(r"(\d+(?:[.,]\d+)?)", q)
+    if valor and any(p in q for p in ["gastei", "paguei", "comprei", "recebi", "ganhei", "vendi", "investi"]):
+        tipo = "receita" if any(p in q for p in ["recebi", "ganhei", "vendi"]) else "despesa"
+        return {"classificacao": "CONTROLE_FINANCEIRO", "status": "COMPLETO",
+                "dados": {"valor": float(valor.group(1).replace(",", ".")), "tipo": tipo, "conta_id": 5,
+                          "categoria": "Outros", "data_transacao": "hoje", "descricao": frase}}
+    return {"classificacao": "CONTROLE_FINANCEIRO", "status": "COMPLETO", "dados": {"consulta": frase}}
+
+
+class MetricasModelos:
+    """Janela deslizante de latência e tokens por papel, para calibrar custo x velocidade."""
+
+    def __init__(self, janela: int = JANELA_METRICAS):
+        self._amostras = defaultdict(lambda: deque(maxlen=janela))
+        self._escalonamentos = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def registrar(self, papel: str, modelo: str, latencia_s: float, tokens_prompt: int, tokens_saida: int):
+        with self._lock:
+            self._amostras[papel].append((latencia_s, tokens_prompt, tokens_saida, modelo))
+        logger.info(f"⏱️ [{papel}] modelo={modelo} latência={latencia_s:.2f}s "
+                    f"tokens_prompt={tokens_prompt} tokens_saida={tokens_saida}")
+
+    def registrar_escalonamento(self, papel: str):
+        with self._lock:
+            self._escalonamentos[papel] += 1
+
+    def resumo(self) -> dict:
+        with self._lock:
+            resumo = {}
+            for papel, amostras in self._amostras.items():
+                latencias = sorted(a[0] for a in amostras)
+                resumo[papel] = {
+                    "chamadas": len(amostras),
+                    "modelos": sorted({a[3] for a in amostras}),
+                    "latencia_p50_s": round(statistics.median(latencias), 3),
+                    "latencia_p95_s": round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 3),
+                    "tokens_prompt_medio": round(statistics.fmean(a[1] for a in amostras), 1),
+                    "tokens_saida_medio": round(statistics.fmean(a[2] for a in amostras), 1),
+                    "escalonamentos": self._escalonamentos.get(papel, 0),
+                }
+            return resumo
+
+
+class ModelRouter:
+    """Cria o LLM de cada papel conforme a configuração e contabiliza uso por papel."""
+
+    def __init__(self, rotas: dict | None = None):
+        self.rotas = rotas or carregar_rotas()
+        self.metricas = MetricasModelos()
+        self._papeis = OrderedDict()  # id(llm) -> (referência ao llm, papel)
+        self._lock = threading.Lock()
+
+    def config(self, papel: str) -> dict:
+        return self.rotas.get(papel, self.rotas["padrao"])
+
+    def llm(self, papel: str, escalado: bool = False):
+        cfg = dict(self.config(papel))
+        if escalado and cfg.get("escalar_para"):
+            cfg["model"] = cfg["escalar_para"]
+
+        if cfg.get("provider") == "stub":
+            llm = StubLLM(model=f"stub:{cfg['model']}", temperature=cfg.get("temperature"),
+                          latencia_ms=cfg.get("latencia_ms", 0))
+        else:
+            llm = LLM(model=cfg["model"], max_tokens=cfg.get("max_tokens"), temperature=cfg.get("temperature"))
+
+        cassete = cassete_atual()
+        if cassete is not None:
+            llm = cassete.envolver_llm(llm, papel)
+
+        self._registrar_papel(llm, papel)
+        return llm
+
+    def _registrar_papel(self, llm, papel: str):
+        """Indexa por id(): classes de LLM podem não ser hasháveis. A referência confirma que o id não foi reusado."""
+        try:
+            referencia = weakref.ref(llm)
+        except TypeError:
+            referencia = lambda: llm  # sem suporte a weakref: mantém o objeto até sair da janela
+        with self._lock:
+            self._papeis[id(llm)] = (referencia, papel)
+            self._papeis.move_to_end(id(llm))
+            while len(self._papeis) > MAX_PAPEIS_REGISTRADOS:
+                self._papeis.popitem(last=False)
+
+    def pode_escalar(self, papel: str) -> bool:
+        return bool(self.config(papel).get("escalar_para"))
+
+    def papel_de(self, llm) -> str:
+        with self._lock:
+            item = self._papeis.get(id(llm))
+        if item is None or item[0]() is not llm:
+            return "desconhecido"
+        return item[1]
+
+    def registrar_crew(self, crew, marcos: list, inicio: float):
+        """
+        Registra latência e tokens por papel após o kickoff. `marcos` são pares
+        (role do agente, instante de término) coletados pelo task_callback da crew.
+        """
+        agentes = {agent.role: agent for agent in crew.agents}
+        anterior = inicio
+        for role, fim in marcos:
+            agent = agentes.get(role)
+            if agent is None:
+                continue
+            uso = _uso_de_tokens(agent)
+            self.metricas.registrar(self.papel_de(agent.llm), getattr(agent.llm, "model", "?"), fim - anterior,
+                                    getattr(uso, "prompt_tokens", 0), getattr(uso, "completion_tokens", 0))
+            anterior = fim
+
+
+def _uso_de_tokens(agent):
+    resumo = getattr(agent.llm, "get_token_usage_summary", None)
+    if callable(resumo):
+        return resumo()
+    processo = getattr(agent, "_token_process", None)
+    if processo is not None:
+        return processo.get_summary()
+    return None
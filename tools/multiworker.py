@@ -0,0 +1,203 @@
+# tools/multiworker.py
+"""
+Modo multi-worker: sobe N processos do servidor MCP (um por núcleo, por padrão) atrás de um
+único endpoint SSE, com roteamento fixo por usuário para manter a memória de cada usuário
+local ao seu worker. O estado compartilhado (cotações, deduplicação e limite
+de taxa) vai para o backend de FINANCEBOT_CACHE_URL, que por padrão é um SQLite compartilhado.
+
+    python -m tools.multiworker --workers 4 --porta 8005
+    python -m tools.multiworker --workers 4 --redis-local      # backend RESP local (tools/resp_server.py)
+
+Os clientes devem abrir a sessão com o usuário na URL: http://127.0.0.1:8005/sse?user_id=<id>.
+Sem user_id, a sessão vai para o worker com menos sessões abertas.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SESSION_ID = re.compile(rb"session_id=([0-9a-fA-F-]+)")
+TAMANHO_MAX_CABECALHO = 64 * 1024
+
+
+class StickyProxy:
+    """
+    Proxy HTTP reverso mínimo para o transporte SSE do MCP. GET /sse é roteado pelo hash do
+    user_id; o session_id anunciado no evento "endpoint" é associado ao worker, e os POSTs em
+    /messages/?session_id=... seguem para o mesmo worker.
+    """
+
+    def __init__(self, portas_workers: list):
+        self.portas = portas_workers
+        self.sessoes = {}
+        self.abertas = [0] * len(portas_workers)
+
+    def worker_para_usuario(self, user_id: str | None) -> int:
+        if user_id:
+            return zlib.crc32(user_id.encode("utf-8")) % len(self.portas)
+        return min(range(len(self.portas)), key=lambda i: self.abertas[i])
+
+    async def atender(self, cliente_r: asyncio.StreamReader, cliente_w: asyncio.StreamWriter):
+        try:
+            cabecalho = await cliente_r.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            cliente_w.close()
+            return
+
+        linha_req = cabecalho.split(b"\r\n", 1)[0].decode("latin-1")
+        try:
+            metodo, alvo, _ = linha_req.split(" ", 2)
+        except ValueError:
+            cliente_w.close()
+            return
+        url = urlsplit(alvo)
+        consulta = parse_qs(url.query)
+
+        eh_sse = metodo == "GET" and url.path.rstrip("/").endswith("/sse")
+        if eh_sse:
+            indice = self.worker_para_usuario((consulta.get("user_id") or [None])[0])
+        else:
+            session_id = (consulta.get("session_id") or [None])[0]
+            indice = self.sessoes.get(session_id)
+            if indice is None:
+                cliente_w.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 18\r\nConnection: close\r\n\r\n"
+                                b"sessao desconhecida")
+                await cliente_w.drain()
+                cliente_w.close()
+                return
+            # Uma requisição por conexão: cada POST é roteado pelo próprio session_id
+            cabecalho = _forcar_connection_close(cabecalho)
+
+        try:
+            worker_r, worker_w = await asyncio.open_connection("127.0.0.1", self.portas[indice])
+        except OSError as e:
+            logger.error(f"Worker {indice} indisponível: {e}")
+            cliente_w.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await cliente_w.drain()
+            cliente_w.close()
+            return
+
+        worker_w.write(cabecalho)
+        sessao = {"id": None}
+        if eh_sse:
+            self.abertas[indice] += 1
+        try:
+            await asyncio.gather(
+                _copiar(cliente_r, worker_w),
+                _copiar(worker_r, cliente_w, self._observador_sse(indice, sessao) if eh_sse else None),
+            )
+        finally:
+            if eh_sse:
+                self.abertas[indice] -= 1
+                self.sessoes.pop(sessao["id"], None)
+
+    def _observador_sse(self, indice: int, sessao: dict):
+        inicio = bytearray()
+
+        def observar(bloco: bytes):
+            # O session_id vem no primeiro evento do stream ("event: endpoint")
+            if sessao["id"] is not None or len(inicio) > TAMANHO_MAX_CABECALHO:
+                return
+            inicio.extend(bloco)
+            achado = _SESSION_ID.search(inicio)
+            if achado:
+                sessao["id"] = achado.group(1).decode()
+                self.sessoes[sessao["id"]] = indice
+                logger.info(f"🔀 Sessão {sessao['id']} fixada no worker {indice}")
+
+        return observar
+
+
+def _forcar_connection_close(cabecalho: bytes) -> bytes:
+    linhas = [l for l in cabecalho[:-4].split(b"\r\n") if not l.lower().startswith(b"connection:")]
+    return b"\r\n".join(linhas + [b"Connection: close"]) + b"\r\n\r\n"
+
+
+async def _copiar(origem: asyncio.StreamReader, destino: asyncio.StreamWriter, observar=None):
+    try:
+        while bloco := await origem.read(65536):
+            if observar:
+                observar(bloco)
+            destino.write(bloco)
+            await destino.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        try:
+            destino.close()
+        except Exception:
+            pass
+
+
+def iniciar_workers(num_workers: int, porta_base: int, env_extra: dict) -> list:
+    processos = []
+    # Cada worker tem a sua fila de tarefas em disco; o usuário fixo no worker sempre consulta a mesma
+    diretorio_tarefas = env_extra.get("FINANCEBOT_JOBS_DIR") or os.getenv("FINANCEBOT_JOBS_DIR", "./jobs_store")
+    for i in range(num_workers):
+        env = {**os.environ, **env_extra, "FINANCEBOT_PORTA": str(porta_base + i),
+               "FINANCEBOT_JOBS_DIR": os.path.join(diretorio_tarefas, f"worker_{i}"),
+               "PYTHONPATH": os.pathsep.join(filter(None, [RAIZ, os.getenv("PYTHONPATH")]))}
+        processos.append(subprocess.Popen([sys.executable, os.path.join(RAIZ, "src", "mcp_server.py")], env=env))
+        logger.info(f"🚀 Worker {i} iniciado na porta {porta_base + i} (pid {processos[-1].pid})")
+    return processos
+
+
+async def executar(args):
+    processos = []
+    env_extra = {}
+    if args.redis_local:
+        processos.append(subprocess.Popen([sys.executable, "-m", "tools.resp_server", "--porta", str(args.porta_resp)],
+                                          cwd=RAIZ))
+        env_extra["FINANCEBOT_CACHE_URL"] = f"redis://127.0.0.1:{args.porta_resp}/0"
+    elif not os.getenv("FINANCEBOT_CACHE_URL"):
+        env_extra["FINANCEBOT_CACHE_URL"] = "sqlite:///cache_compartilhado.db"
+
+    portas = [args.porta_base + i for i in range(args.workers)]
+    processos += iniciar_workers(args.workers, args.porta_base, env_extra)
+
+    proxy = StickyProxy(portas)
+    servidor = await asyncio.start_server(proxy.atender, args.host, args.porta, limit=TAMANHO_MAX_CABECALHO)
+    logger.info(f"🔀 Proxy multi-worker em http://{args.host}:{args.porta}/sse -> portas {portas}")
+
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sinal, parar.set)
+        except NotImplementedError:
+            pass
+    try:
+        async with servidor:
+            await parar.wait()
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            processo.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor MCP multi-worker com roteamento fixo por usuário")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8005, help="porta pública (proxy)")
+    parser.add_argument("--porta-base", type=int, default=8105, help="primeira porta interna dos workers")
+    parser.add_argument("--redis-local", action="store_true", help="usa o servidor RESP local como backend")
+    parser.add_argument("--porta-resp", type=int, default=6380)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(executar(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# tools/portfolio.py
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COTACOES_EM_PARALELO = 50
+TOLERANCIA_QUANTIDADE = 1e-9
+_ACAO_B3 = re.compile(r"^[A-Z]{4}\d{1,2}$")
+
+
+def validar_operacao(ativo: dict, tipo: str | None = None) -> dict | None:
+    """
+    Normaliza o bloco "ativo" do classificador ({simbolo, quantidade, preco_unitario, operacao}).
+    Vendas ficam com quantidade negativa. Retorna None se faltar símbolo, quantidade ou preço.
+    """
+    simbolo = str(ativo.get("simbolo") or "").strip().upper()
+    try:
+        quantidade = float(str(ativo.get("quantidade")).replace(",", "."))
+        preco = float(str(ativo.get("preco_unitario")).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    if not simbolo or quantidade <= 0 or preco <= 0:
+        return None
+    operacao = str(ativo.get("operacao") or ("venda" if tipo == "receita" else "compra")).lower()
+    return {"simbolo": simbolo, "quantidade": -quantidade if operacao == "venda" else quantidade, "preco": preco}
+
+
+class PosicaoInsuficiente(ValueError):
+    """Venda de mais unidades do que a posição registrada na carteira."""
+
+    def __init__(self, simbolo: str, disponivel: float, vendida: float):
+        super().__init__(f"Venda de {vendida:g} {simbolo} acima da posição registrada ({disponivel:g})")
+        self.simbolo = simbolo
+        self.disponivel = disponivel
+        self.vendida = vendida
+
+
+class Carteira:
+    """Posições por usuário (SQLite). Cada operação atualiza a posição e o preço médio na mesma transação."""
+
+    def __init__(self, caminho: str = "./carteira/posicoes.db"):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._local = threading.local()
+        self._conexao().executescript("""
+            CREATE TABLE IF NOT EXISTS operacoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                user_id TEXT NOT NULL,
+                simbolo TEXT NOT NULL,
+                quantidade REAL NOT NULL,
+                preco REAL NOT NULL,
+                criado_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS posicoes (
+                user_id TEXT NOT NULL,
+                simbolo TEXT NOT NULL,
+                quantidade REAL NOT NULL,
+                preco_medio REAL NOT NULL,
+                PRIMARY KEY (user_id, simbolo)
+            );
+        """)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def registrar(self, user_id: str, operacao: dict, idempotency_key: str | None = None) -> bool:
+        """
+        Aplica a operação à posição. Retorna False se a chave já tinha sido registrada.
+        Levanta PosicaoInsuficiente (sem registrar nada) se a venda passar da posição atual.
+        """
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO operacoes (idempotency_key, user_id, simbolo, quantidade, preco, criado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (idempotency_key or uuid.uuid4().hex, user_id, operacao["simbolo"], operacao["quantidade"],
+                 operacao["preco"], time.time()),
+            )
+            if cursor.rowcount == 0:
+                conn.execute("ROLLBACK")
+                return False
+
+            atual = conn.execute("SELECT quantidade, preco_medio FROM posicoes WHERE user_id = ? AND simbolo = ?",
+                                 (user_id, operacao["simbolo"])).fetchone()
+            quantidade, preco_medio = (atual["quantidade"], atual["preco_medio"]) if atual else (0.0, 0.0)
+            delta = operacao["quantidade"]
+            if quantidade + delta < -TOLERANCIA_QUANTIDADE:
+                raise PosicaoInsuficiente(operacao["simbolo"], quantidade, -delta)
+            if delta > 0:
+                preco_medio = (quantidade * preco_medio + delta * operacao["preco"]) / (quantidade + delta)
+            quantidade = max(quantidade + delta, 0.0)  # vendas só reduzem a posição; o preço médio se mantém
+
+            if quantidade > TOLERANCIA_QUANTIDADE:
+                conn.execute("INSERT OR REPLACE INTO posicoes (user_id, simbolo, quantidade, preco_medio) "
+                             "VALUES (?, ?, ?, ?)", (user_id, operacao["simbolo"], quantidade, preco_medio))
+            else:
+                conn.execute("DELETE FROM posicoes WHERE user_id = ? AND simbolo = ?", (user_id, operacao["simbolo"]))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def posicoes(self, user_id: str) -> list:
+        linhas = self._conexao().execute(
+            "SELECT simbolo, quantidade, preco_medio FROM posicoes WHERE user_id = ? ORDER BY simbolo", (user_id,)
+        ).fetchall()
+        return [dict(l) for l in linhas]
+
+
+def simbolo_yahoo(simbolo: str) -> str:
+    """Ações da B3 (PETR4, VALE3...) são cotadas no Yahoo com o sufixo .SA."""
+    return f"{simbolo}.SA" if _ACAO_B3.match(simbolo) else simbolo
+
+
+def extrair_cotacao(resultado) -> dict | None:
+    """Preço atual e fechamento anterior a partir do retorno de get_ticker_info (JSON)."""
+    try:
+        info = json.loads(resultado) if isinstance(resultado, str) else resultado
+    except ValueError:
+        return None
+    if not isinstance(info, dict):
+        return None
+    preco = info.get("regularMarketPrice") or info.get("currentPrice")
+    anterior = info.get("regularMarketPreviousClose") or info.get("previousClose") or preco
+    if preco is None:
+        return None
+    return {"preco": float(preco), "fechamento_anterior": float(anterior)}
+
+
+def cotar_em_lote(simbolos: list, cotar_um, paralelo: int = COTACOES_EM_PARALELO) -> dict:
+    """
+    Busca todas as cotações de uma vez (em paralelo), então o tempo total fica perto do de uma cotação.
+    `cotar_um(simbolo)` retorna o resultado bruto da tool; falhas viram ausência no dicionário.
+    """
+    unicos = sorted(set(simbolos))
+    if not unicos:
+        return {}
+
+    def cotar(simbolo):
+        try:
+            return simbolo, extrair_cotacao(cotar_um(simbolo_yahoo(simbolo)))
+        except Exception as e:
+            logger.error(f"Erro ao cotar {simbolo}: {e}")
+            return simbolo, None
+
+    with ThreadPoolExecutor(max_workers=min(paralelo, len(unicos)), thread_name_prefix="cotacoes") as executor:
+        return {simbolo: cotacao for simbolo, cotacao in executor.map(cotar, unicos) if cotacao}
+
+
+def avaliar_carteira(posicoes: list, cotacoes: dict) -> dict:
+    """Valor, resultado, alocação e variação do dia de todas as posições, em operações vetorizadas."""
+    simbolos = [p["simbolo"] for p in posicoes]
+    quantidade = np.array([p["quantidade"] for p in posicoes], dtype=float)
+    preco_medio = np.array([p["preco_medio"] for p in posicoes], dtype=float)
+    preco = np.array([cotacoes.get(s, {}).get("preco", np.nan) for s in simbolos], dtype=float)
+    anterior = np.array([cotacoes.get(s, {}).get("fechamento_anterior", np.nan) for s in simbolos], dtype=float)
+
+    cotado = ~np.isnan(preco)
+    valor = quantidade * preco
+    custo = quantidade * preco_medio
+    resultado = valor - custo
+    variacao_dia = quantidade * (preco - anterior)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        resultado_pct = np.where(custo > 0, resultado / custo, np.nan)
+        variacao_dia_pct = np.where(anterior > 0, preco / anterior - 1, np.nan)
+        valor_total = valor[cotado].sum()
+        alocacao = np.where(cotado, valor / valor_total, np.nan) if valor_total > 0 else np.full(len(simbolos), np.nan)
+
+    custo_total = custo[cotado].sum()
+    resultado_total = resultado[cotado].sum()
+    variacao_total = variacao_dia[cotado].sum()
+
+    def numero(x):
+        return None if np.isnan(x) else round(float(x), 4)
+
+    return {
+        "posicoes": [
+            {"simbolo": s, "quantidade": numero(quantidade[i]), "preco_medio": numero(preco_medio[i]),
+             "preco": numero(preco[i]), "valor": numero(valor[i]), "resultado": numero(resultado[i]),
+             "resultado_pct": numero(resultado_pct[i]), "alocacao": numero(alocacao[i]),
+             "variacao_dia": numero(variacao_dia[i]), "variacao_dia_pct": numero(variacao_dia_pct[i])}
+            for i, s in enumerate(simbolos)
+        ],
+        "totais": {
+            "valor": round(float(valor_total), 2),
+            "custo": round(float(custo_total), 2),
+            "resultado": round(float(resultado_total), 2),
+            "resultado_pct": round(float(resultado_total / custo_total), 4) if custo_total > 0 else None,
+            "variacao_dia": round(float(variacao_total), 2),
+            "variacao_dia_pct": (round(float(variacao_total / (valor_total - variacao_total)), 4)
+                                 if valor_total - variacao_total > 0 else None),
+        },
+        "sem_cotacao": [s for i, s in enumerate(simbolos) if not cotado[i]],
+    }
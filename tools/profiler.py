@@ -0,0 +1,189 @@
+# tools/profiler.py
+"""
+Perfilador por amostragem ligado sob demanda (tool MCP de administração).
+
+Uma thread daemon lê as pilhas de todas as threads (sys._current_frames) a cada `intervalo_ms`:
+- parede: toda amostra conta, então espera de rede/subprocesso/locks aparece como tempo;
+- CPU: só conta a thread que consumiu CPU desde a amostra anterior (/proc/self/task/<tid>/stat, Linux).
+Em paralelo, uma task no loop mede o atraso do event loop e o número de tasks asyncio.
+A saída é em "collapsed stacks" (`thread;func (arquivo);... contagem`), o formato do flamegraph.pl/speedscope.
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFUNDIDADE_MAX = 64
+DURACAO_MAX_S = 600
+INTERVALO_LAG_S = 0.05
+MAX_LINHAS_PILHAS = 3000
+
+
+def _rotulo(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})"
+
+
+def _pilha(frame) -> list:
+    pilha = []
+    while frame is not None and len(pilha) < PROFUNDIDADE_MAX:
+        pilha.append(_rotulo(frame.f_code))
+        frame = frame.f_back
+    pilha.reverse()
+    return pilha
+
+
+def _ticks_cpu(native_id) -> int | None:
+    """utime + stime da thread em ticks do kernel; None fora do Linux."""
+    try:
+        with open(f"/proc/self/task/{native_id}/stat", "rb") as f:
+            campos = f.read().rsplit(b")", 1)[1].split()
+        return int(campos[11]) + int(campos[12])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+class SessaoPerfil:
+    def __init__(self, requisicoes: int, duracao_s: float, intervalo_ms: float):
+        self.requisicoes = requisicoes
+        self.duracao_s = min(duracao_s or DURACAO_MAX_S, DURACAO_MAX_S)
+        self.intervalo_s = max(intervalo_ms, 1) / 1000
+        self.inicio = time.time()
+        self.fim = None
+        self.parede = Counter()
+        self.cpu = Counter()
+        self.amostras = 0
+        self.custo_amostragem_s = 0.0
+        self.lags_s = []
+        self.tasks = []
+        self.latencias_s = []
+        self.concluidas = 0
+        self.parar = threading.Event()
+        self.cpu_disponivel = _ticks_cpu(threading.main_thread().native_id) is not None
+
+    def resumo(self, incluir_pilhas: bool = True) -> dict:
+        fim = self.fim or time.time()
+        resumo = {
+            "ativa": self.fim is None,
+            "inicio": self.inicio,
+            "duracao_s": round(fim - self.inicio, 3),
+            "requisicoes_alvo": self.requisicoes,
+            "requisicoes_concluidas": self.concluidas,
+            "amostras": self.amostras,
+            "intervalo_ms": round(self.intervalo_s * 1000, 1),
+            "custo_amostragem_ms": round(self.custo_amostragem_s * 1000, 1),
+            "cpu_disponivel": self.cpu_disponivel,
+            "latencia_requisicoes_s": {
+                "p50": round(_percentil(self.latencias_s, 0.5), 3),
+                "p99": round(_percentil(self.latencias_s, 0.99), 3),
+                "max": round(max(self.latencias_s, default=0), 3),
+            },
+            "event_loop": {
+                "lag_p50_ms": round(_percentil(self.lags_s, 0.5) * 1000, 1),
+                "lag_p99_ms": round(_percentil(self.lags_s, 0.99) * 1000, 1),
+                "lag_max_ms": round(max(self.lags_s, default=0) * 1000, 1),
+                "tasks_media": round(statistics.fmean(self.tasks), 1) if self.tasks else 0,
+                "tasks_max": max(self.tasks, default=0),
+            },
+        }
+        if incluir_pilhas:
+            resumo["pilhas_parede"] = _colapsar(self.parede)
+            resumo["pilhas_cpu"] = _colapsar(self.cpu)
+        return resumo
+
+
+def _colapsar(contagens: Counter) -> str:
+    return "\n".join(f"{pilha} {n}" for pilha, n in contagens.most_common(MAX_LINHAS_PILHAS))
+
+
+class Perfilador:
+    """Uma sessão por vez; sem sessão ativa, o custo é só a checagem em `requisicao()`."""
+
+    def __init__(self):
+        self.sessao = None
+        self._lock = threading.Lock()
+
+    def iniciar(self, requisicoes: int = 0, duracao_s: float = 0, intervalo_ms: float = 10) -> dict:
+        with self._lock:
+            if self.sessao is not None and self.sessao.fim is None:
+                raise RuntimeError("Já existe uma sessão de perfil ativa")
+            sessao = SessaoPerfil(requisicoes, duracao_s, intervalo_ms)
+            self.sessao = sessao
+        threading.Thread(target=self._amostrar, args=(sessao,), name="perfilador", daemon=True).start()
+        try:
+            asyncio.get_running_loop().create_task(self._medir_loop(sessao))
+        except RuntimeError:
+            pass  # fora de um event loop: sem estatísticas de asyncio
+        logger.info(f"🔬 Perfil iniciado: requisicoes={requisicoes or '-'} duracao_max={sessao.duracao_s}s "
+                    f"intervalo={intervalo_ms}ms")
+        return sessao.resumo(incluir_pilhas=False)
+
+    def parar(self):
+        sessao = self.sessao
+        if sessao is not None and sessao.fim is None:
+            sessao.fim = time.time()
+            sessao.parar.set()
+            logger.info(f"🔬 Perfil encerrado: {sessao.amostras} amostras, {sessao.concluidas} requisições")
+
+    def resultado(self, incluir_pilhas: bool = True) -> dict | None:
+        return self.sessao.resumo(incluir_pilhas) if self.sessao else None
+
+    @contextmanager
+    def requisicao(self):
+        """Conta a requisição na sessão ativa; encerra a sessão ao atingir o número pedido."""
+        sessao = self.sessao
+        if sessao is None or sessao.fim is not None:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            sessao.latencias_s.append(time.perf_counter() - inicio)
+            sessao.concluidas += 1
+            if sessao.requisicoes and sessao.concluidas >= sessao.requisicoes:
+                self.parar()
+
+    def _amostrar(self, sessao: SessaoPerfil):
+        propria = threading.get_ident()
+        ticks_anteriores = {}
+        while not sessao.parar.wait(sessao.intervalo_s):
+            if time.time() - sessao.inicio > sessao.duracao_s:
+                self.parar()
+                break
+            t0 = time.perf_counter()
+            nomes = {t.ident: (t.name, t.native_id) for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == propria:
+                    continue
+                nome, native_id = nomes.get(ident, (f"thread-{ident}", None))
+                pilha = ";".join([nome] + _pilha(frame))
+                sessao.parede[pilha] += 1
+
+                ticks = _ticks_cpu(native_id) if native_id is not None else None
+                if ticks is not None:
+                    if ticks > ticks_anteriores.get(ident, ticks):
+                        sessao.cpu[pilha] += ticks - ticks_anteriores[ident]
+                    ticks_anteriores[ident] = ticks
+            sessao.amostras += 1
+            sessao.custo_amostragem_s += time.perf_counter() - t0
+
+    async def _medir_loop(self, sessao: SessaoPerfil):
+        loop = asyncio.get_running_loop()
+        while sessao.fim is None:
+            esperado = loop.time() + INTERVALO_LAG_S
+            await asyncio.sleep(INTERVALO_LAG_S)
+            sessao.lags_s.append(max(0.0, loop.time() - esperado))
+            sessao.tasks.append(len(asyncio.all_tasks(loop)))
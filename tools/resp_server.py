@@ -0,0 +1,176 @@
+# tools/resp_server.py
+"""
+Servidor local compatível com o subconjunto do protocolo Redis (RESP) usado pelo RedisBackend:
+PING, SELECT, GET, SET (EX/PX/NX), INCR, INCRBY, EXPIRE, PEXPIRE, TTL, DEL.
+Serve como substituto do Redis em desenvolvimento e no modo multi-worker local.
+
+    python -m tools.resp_server --porta 6380
+"""
+
+import argparse
+import asyncio
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+INTERVALO_EXPIRACAO_S = 0.1
+MAX_EXPIRACOES_POR_VARREDURA = 1000
+
+
+class RespStore:
+    """Chaves com TTL expiram ao serem lidas e também pela varredura periódica de `expirar_vencidas`."""
+
+    def __init__(self):
+        self._dados = {}
+        self._vencimentos = []  # heap de (expira_em, chave); entradas de TTLs substituídos são ignoradas
+
+    def _definir_expiracao(self, chave: bytes, item: list, expira_em: float | None):
+        item[1] = expira_em
+        if expira_em is not None:
+            heapq.heappush(self._vencimentos, (expira_em, chave))
+
+    def expirar_vencidas(self, limite: int = MAX_EXPIRACOES_POR_VARREDURA) -> int:
+        """Remove, em ordem de vencimento, chaves expiradas que ninguém leu. Retorna quantas removeu."""
+        agora = time.monotonic()
+        removidas = 0
+        for _ in range(limite):
+            if not self._vencimentos or self._vencimentos[0][0] >= agora:
+                break
+            expira_em, chave = heapq.heappop(self._vencimentos)
+            item = self._dados.get(chave)
+            if item is not None and item[1] == expira_em:
+                del self._dados[chave]
+                removidas += 1
+        return removidas
+
+    def _vivo(self, chave: bytes):
+        item = self._dados.get(chave)
+        if item is not None and item[1] is not None and item[1] < time.monotonic():
+            del self._dados[chave]
+            return None
+        return item
+
+    def executar(self, partes: list):
+        comando = partes[0].upper()
+        args = partes[1:]
+
+        if comando == b"PING":
+            return "+PONG"
+        if comando == b"SELECT":
+            return "+OK"
+        if comando == b"GET":
+            item = self._vivo(args[0])
+            return None if item is None else item[0]
+        if comando == b"SET":
+            chave, valor, expira_em, nx = args[0], args[1], None, False
+            opcoes = [a.upper() for a in args[2:]]
+            for i, opcao in enumerate(opcoes):
+                if opcao == b"EX":
+                    expira_em = time.monotonic() + float(args[2 + i + 1])
+                elif opcao == b"PX":
+                    expira_em = time.monotonic() + float(args[2 + i + 1]) / 1000
+                elif opcao == b"NX":
+                    nx = True
+            if nx and self._vivo(chave) is not None:
+                return None
+            self._dados[chave] = item = [valor, None]
+            self._definir_expiracao(chave, item, expira_em)
+            return "+OK"
+        if comando in (b"INCR", b"INCRBY"):
+            incremento = int(args[1]) if comando == b"INCRBY" else 1
+            item = self._vivo(args[0])
+            try:
+                valor = (int(item[0]) if item else 0) + incremento
+            except ValueError:
+                return Exception("ERR value is not an integer or out of range")
+            if item:
+                item[0] = str(valor).encode()
+            else:
+                self._dados[args[0]] = [str(valor).encode(), None]
+            return valor
+        if comando in (b"EXPIRE", b"PEXPIRE"):
+            item = self._vivo(args[0])
+            if item is None:
+                return 0
+            divisor = 1000 if comando == b"PEXPIRE" else 1
+            self._definir_expiracao(args[0], item, time.monotonic() + float(args[1]) / divisor)
+            return 1
+        if comando == b"TTL":
+            item = self._vivo(args[0])
+            if item is None:
+                return -2
+            return -1 if item[1] is None else int(item[1] - time.monotonic())
+        if comando == b"DEL":
+            return sum(1 for chave in args if self._dados.pop(chave, None) is not None)
+        return Exception(f"ERR unknown command '{comando.decode(errors='replace')}'")
+
+
+def _codificar(resposta) -> bytes:
+    if resposta is None:
+        return b"$-1\r\n"
+    if isinstance(resposta, Exception):
+        return f"-{resposta}\r\n".encode()
+    if isinstance(resposta, int):
+        return b":%d\r\n" % resposta
+    if isinstance(resposta, str):
+        return resposta.encode() + b"\r\n"
+    return b"$%d\r\n%s\r\n" % (len(resposta), resposta)
+
+
+async def _ler_comando(reader: asyncio.StreamReader):
+    linha = await reader.readline()
+    if not linha:
+        return None
+    if not linha.startswith(b"*"):
+        return linha.split()  # comandos inline (ex.: redis-cli/telnet)
+    partes = []
+    for _ in range(int(linha[1:-2])):
+        tamanho = int((await reader.readline())[1:-2])
+        partes.append((await reader.readexactly(tamanho + 2))[:-2])
+    return partes
+
+
+async def _expirar_periodicamente(store: RespStore):
+    while True:
+        await asyncio.sleep(INTERVALO_EXPIRACAO_S)
+        store.expirar_vencidas()
+
+
+async def servir(host: str = "127.0.0.1", porta: int = 6380):
+    store = RespStore()
+    expiracao = asyncio.create_task(_expirar_periodicamente(store))
+
+    async def atender(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (partes := await _ler_comando(reader)) is not None:
+                if partes:
+                    writer.write(_codificar(store.executar(partes)))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    servidor = await asyncio.start_server(atender, host, porta)
+    logger.info(f"🧰 Servidor RESP local em {host}:{porta}")
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        expiracao.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Substituto local do Redis (subconjunto RESP)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=6380)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(servir(args.host, args.porta))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# tools/shared_cache.py
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+MAX_ITENS_MEMORIA = 10000
+
+
+class CacheBackend:
+    """
+    Interface do estado compartilhado entre processos (cache de cotações, resultados deduplicados,
+    contadores de limite de taxa). Valores precisam ser serializáveis em JSON.
+    """
+
+    def get(self, chave: str):
+        raise NotImplementedError
+
+    def set(self, chave: str, valor, ttl_s: float | None = None):
+        raise NotImplementedError
+
+    def incr(self, chave: str, ttl_s: float | None = None) -> int:
+        """Incrementa o contador; o TTL é definido quando o contador é criado."""
+        raise NotImplementedError
+
+    def delete(self, chave: str):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Backend local ao processo (modo de um único worker). Guarda os valores serializados, com a
+    mesma semântica de cópia dos backends compartilhados.
+    """
+
+    def __init__(self, max_itens: int = MAX_ITENS_MEMORIA):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vivo(self, chave: str):
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em is not None and expira_em < time.monotonic():
+            del self._itens[chave]
+            return None
+        return item
+
+    def _gravar(self, chave: str, valor, ttl_s: float | None):
+        self._itens[chave] = (time.monotonic() + ttl_s if ttl_s else None, valor)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+
+    def get(self, chave: str):
+        with self._lock:
+            item = self._vivo(chave)
+        if item is None:
+            return None
+        return item[1] if isinstance(item[1], int) else json.loads(item[1])
+
+    def set(self, chave: str, valor, ttl_s: float | None = None):
+        serializado = json.dumps(valor, ensure_ascii=False)
+        with self._lock:
+            self._gravar(chave, serializado, ttl_s)
+
+    def incr(self, chave: str, ttl_s: float | None = None) -> int:
+        with self._lock:
+            item = self._vivo(chave)
+            if item is None:
+                self._gravar(chave, 1, ttl_s)
+                return 1
+            self._itens[chave] = (item[0], item[1] + 1)
+            return item[1] + 1
+
+    def delete(self, chave: str):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+
+class SQLiteBackend(CacheBackend):
+    """Backend em arquivo SQLite (modo WAL), compartilhado pelos workers da mesma máquina."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._local = threading.local()
+        with self._conexao() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (chave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira_em REAL)")
+        self._ultima_limpeza = 0.0
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _limpar_expirados(self, conn, agora: float):
+        if agora - self._ultima_limpeza > 60:
+            self._ultima_limpeza = agora
+            conn.execute("DELETE FROM kv WHERE expira_em IS NOT NULL AND expira_em < ?", (agora,))
+
+    def get(self, chave: str):
+        linha = self._conexao().execute(
+            "SELECT valor FROM kv WHERE chave = ? AND (expira_em IS NULL OR expira_em >= ?)", (chave, time.time())
+        ).fetchone()
+        return None if linha is None else json.loads(linha[0])
+
+    def set(self, chave: str, valor, ttl_s: float | None = None):
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute("INSERT OR REPLACE INTO kv (chave, valor, expira_em) VALUES (?, ?, ?)",
+                     (chave, json.dumps(valor, ensure_ascii=False), agora + ttl_s if ttl_s else None))
+        self._limpar_expirados(conn, agora)
+
+    def incr(self, chave: str, ttl_s: float | None = None) -> int:
+        agora = time.time()
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE chave = ? AND expira_em IS NOT NULL AND expira_em < ?", (chave, agora))
+            conn.execute(
+                "INSERT INTO kv (chave, valor, expira_em) VALUES (?, '1', ?) "
+                "ON CONFLICT(chave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1",
+                (chave, agora + ttl_s if ttl_s else None),
+            )
+            valor = conn.execute("SELECT valor FROM kv WHERE chave = ?", (chave,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return int(valor)
+
+    def delete(self, chave: str):
+        self._conexao().execute("DELETE FROM kv WHERE chave = ?", (chave,))
+
+
+class RedisBackend(CacheBackend):
+    """
+    Cliente mínimo do protocolo RESP (Redis ou compatível, como tools/resp_server.py).
+    Conexão única protegida por lock; reconecta automaticamente em caso de falha.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", porta: int = 6379, db: int = 0, timeout_s: float = 2.0):
+        self.host, self.porta, self.db, self.timeout_s = host, porta, db, timeout_s
+        self._sock = None
+        self._arquivo = None
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        self._sock = socket.create_connection((self.host, self.porta), timeout=self.timeout_s)
+        self._arquivo = self._sock.makefile("rb")
+        if self.db:
+            self._enviar("SELECT", str(self.db))
+
+    def _fechar(self):
+        for recurso in (self._arquivo, self._sock):
+            try:
+                if recurso:
+                    recurso.close()
+            except OSError:
+                pass
+        self._sock = self._arquivo = None
+
+    def _ler_resposta(self):
+        linha = self._arquivo.readline()
+        if not linha:
+            raise ConnectionError("Conexão RESP encerrada")
+        tipo, corpo = linha[:1], linha[1:-2]
+        if tipo == b"+":
+            return corpo.decode()
+        if tipo == b"-":
+            raise RuntimeError(corpo.decode())
+        if tipo == b":":
+            return int(corpo)
+        if tipo == b"$":
+            tamanho = int(corpo)
+            if tamanho == -1:
+                return None
+            dados = self._arquivo.read(tamanho + 2)[:-2]
+            return dados.decode("utf-8")
+        if tipo == b"*":
+            tamanho = int(corpo)
+            return None if tamanho == -1 else [self._ler_resposta() for _ in range(tamanho)]
+        raise RuntimeError(f"Resposta RESP inválida: {linha!r}")
+
+    def _conexao_viva(self) -> bool:
+        """Detecta, antes de enviar, a conexão que o servidor já fechou (ex.: reinício do Redis)."""
+        try:
+            self._sock.setblocking(False)
+            try:
+                return self._sock.recv(1, socket.MSG_PEEK) != b""
+            finally:
+                self._sock.settimeout(self.timeout_s)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+
+    def _escrever(self, *partes):
+        comando = [f"*{len(partes)}\r\n".encode()]
+        for parte in partes:
+            dados = parte.encode("utf-8") if isinstance(parte, str) else parte
+            comando.append(b"$%d\r\n%s\r\n" % (len(dados), dados))
+        self._sock.sendall(b"".join(comando))
+
+    def _enviar(self, *partes):
+        self._escrever(*partes)
+        return self._ler_resposta()
+
+    def comando(self, *partes):
+        """
+        Só reenvia se a falha foi ao conectar ou escrever: depois que o comando saiu, um timeout
+        na leitura não diz se o servidor o executou, e repetir um INCR contaria duas vezes.
+        """
+        with self._lock:
+            for tentativa in range(2):
+                try:
+                    if self._sock is not None and not self._conexao_viva():
+                        self._fechar()
+                    if self._sock is None:
+                        self._conectar()
+                    self._escrever(*partes)
+                    break
+                except (OSError, ConnectionError):
+                    self._fechar()
+                    if tentativa:
+                        raise
+            try:
+                return self._ler_resposta()
+            except (OSError, ConnectionError):
+                self._fechar()
+                raise
+
+    def get(self, chave: str):
+        valor = self.comando("GET", chave)
+        return None if valor is None else json.loads(valor)
+
+    def set(self, chave: str, valor, ttl_s: float | None = None):
+        partes = ["SET", chave, json.dumps(valor, ensure_ascii=False)]
+        if ttl_s:
+            partes += ["PX", str(int(ttl_s * 1000))]
+        self.comando(*partes)
+
+    def incr(self, chave: str, ttl_s: float | None = None) -> int:
+        if ttl_s:
+            # Cria o contador já com o TTL: se o processo cair entre os dois comandos, a chave ainda expira
+            self.comando("SET", chave, "0", "PX", str(int(ttl_s * 1000)), "NX")
+        return self.comando("INCR", chave)
+
+    def delete(self, chave: str):
+        self.comando("DEL", chave)
+
+
+def criar_backend(url: str | None = None) -> CacheBackend:
+    """
+    Cria o backend a partir de FINANCEBOT_CACHE_URL:
+    memory:// (padrão), sqlite:///arquivo.db (relativo), sqlite:////caminho/arquivo.db ou redis://host:porta/db.
+    """
+    url = url or os.getenv("FINANCEBOT_CACHE_URL", "memory://")
+    partes = urlparse(url)
+    if partes.scheme == "memory":
+        return MemoryBackend()
+    if partes.scheme == "sqlite":
+        # sqlite:///relativo.db ou sqlite:////caminho/absoluto.db
+        caminho = partes.path[1:] or "cache_compartilhado.db"
+        logger.info(f"🗄️ Cache compartilhado em SQLite: {caminho}")
+        return SQLiteBackend(caminho)
+    if partes.scheme == "redis":
+        db = int(partes.path.lstrip("/") or 0)
+        logger.info(f"🗄️ Cache compartilhado via RESP em {partes.hostname}:{partes.port or 6379}/{db}")
+        return RedisBackend(partes.hostname or "127.0.0.1", partes.port or 6379, db)
+    raise ValueError(f"FINANCEBOT_CACHE_URL não suportada: {url}")
+
+
+class RateLimiter:
+    """Limite de requisições por usuário em janelas fixas de um minuto, contado no backend compartilhado."""
+
+    def __init__(self, backend: CacheBackend, limite_por_minuto: int):
+        self.backend = backend
+        self.limite_por_minuto = limite_por_minuto
+
+    def permitir(self, user_id: str) -> bool:
+        if self.limite_por_minuto <= 0:
+            return True
+        janela = int(time.time() // 60)
+        try:
+            contagem = self.backend.incr(f"limite:{user_id}:{janela}", ttl_s=120)
+        except Exception as e:
+            # Falha no backend não derruba o atendimento
+            logger.error(f"Erro no limitador de taxa: {e}")
+            return True
+        return contagem <= self.limite_por_minuto
@@ -0,0 +1,63 @@
+# tools/tool_wrappers.py
+
+import json
+import logging
+from typing import Any
+
+from crewai.tools import BaseTool
+
+logger = logging.getLogger(__name__)
+
+
+class FerramentaEnvolvida(BaseTool):
+    """
+    Tool que delega para outra tool (ex.: as geradas pelo MCPServerAdapter) mantendo nome,
+    descrição e schema de argumentos, para acrescentar comportamento em volta da chamada.
+    """
+
+    ferramenta: Any = None
+
+    def __init__(self, ferramenta: BaseTool, **kwargs):
+        super().__init__(
+            name=ferramenta.name,
+            description=ferramenta.description,
+            args_schema=ferramenta.args_schema,
+            ferramenta=ferramenta,
+            **kwargs,
+        )
+
+    def _chamar_original(self, kwargs: dict):
+        return self.ferramenta.run(**kwargs)
+
+    def _run(self, **kwargs):
+        return self._chamar_original(kwargs)
+
+
+class FerramentaComCache(FerramentaEnvolvida):
+    """Guarda o resultado por (tool, argumentos) no backend compartilhado durante `ttl_s` segundos."""
+
+    cache: Any = None
+    ttl_s: float = 60.0
+
+    def _run(self, **kwargs):
+        chave = f"ferramenta:{self.name}:{json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)}"
+        try:
+            resultado = self.cache.get(chave)
+        except Exception as e:
+            logger.error(f"Erro ao ler cache da tool {self.name}: {e}")
+            resultado = None
+        if resultado is not None:
+            logger.info(f"♻️ Resultado da tool {self.name} servido do cache")
+            return resultado
+
+        resultado = self._chamar_original(kwargs)
+        if isinstance(resultado, (str, int, float, list, dict)):
+            try:
+                self.cache.set(chave, resultado, self.ttl_s)
+            except Exception as e:
+                logger.error(f"Erro ao gravar cache da tool {self.name}: {e}")
+        return resultado
+
+
+def envolver_com_cache(ferramentas: list, cache, ttl_s: float) -> list:
+    return [FerramentaComCache(f, cache=cache, ttl_s=ttl_s) for f in ferramentas]
@@ -0,0 +1,212 @@
+# tools/trace_sink.py
+"""
+Destino não bloqueante da saída verbose das crews (prompts, tool I/O e raciocínio dos agentes).
+
+O crewai imprime em sys.stdout; `ColetorRastros.instalar()` troca o stdout por um proxy que, durante
+uma requisição (`rastrear`), guarda o texto num buffer circular limitado da própria requisição em vez
+de escrever no terminal. Ao fim da requisição o rastro vai para uma fila, e uma thread em segundo plano
+grava o rastro completo em disco (com limite de espaço) e ecoa no stdout só uma amostra, truncada.
+Requisições com erro são sempre ecoadas. Fora de uma requisição, o stdout funciona normalmente.
+"""
+
+import contextvars
+import gzip
+import io
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LIMITE_BYTES_REQUISICAO = 256 * 1024
+LIMITE_SAIDA_BYTES = 16 * 1024
+MAX_EM_MEMORIA = 200
+MAX_DISCO_MB = 200
+TAMANHO_FILA = 1000
+
+_rastro_atual = contextvars.ContextVar("rastro_atual", default=None)
+
+
+class RastroRequisicao:
+    """Buffer circular da saída verbose de uma requisição: acima do limite, descarta o trecho mais antigo."""
+
+    def __init__(self, user_id: str, pergunta: str, limite_bytes: int = LIMITE_BYTES_REQUISICAO):
+        self.id = uuid.uuid4().hex[:16]
+        self.user_id = user_id
+        self.pergunta = pergunta
+        self.inicio = time.time()
+        self.fim = None
+        self.erro = None
+        self.limite_bytes = limite_bytes
+        self.descartados_bytes = 0
+        self._partes = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def escrever(self, texto: str):
+        with self._lock:
+            self._partes.append(texto)
+            self._bytes += len(texto)
+            while self._bytes > self.limite_bytes and len(self._partes) > 1:
+                antigo = self._partes.popleft()
+                self._bytes -= len(antigo)
+                self.descartados_bytes += len(antigo)
+
+    def resumo(self) -> dict:
+        return {"id": self.id, "user_id": self.user_id, "pergunta": self.pergunta[:120], "inicio": self.inicio,
+                "duracao_s": round((self.fim or time.time()) - self.inicio, 3), "bytes": self._bytes,
+                "descartados_bytes": self.descartados_bytes, "erro": self.erro}
+
+    def texto(self) -> str:
+        with self._lock:
+            corpo = "".join(self._partes)
+        cabecalho = (f"# rastro {self.id} user={self.user_id} duracao={self.resumo()['duracao_s']}s"
+                     f"{' erro=' + self.erro if self.erro else ''}\n# pergunta: {self.pergunta}\n")
+        if self.descartados_bytes:
+            cabecalho += f"# [... {self.descartados_bytes} bytes iniciais descartados ...]\n"
+        return cabecalho + corpo
+
+
+class SaidaRoteada(io.TextIOBase):
+    """Proxy do sys.stdout: dentro de uma requisição rastreada, escreve no rastro; fora dela, no stdout original."""
+
+    def __init__(self, original):
+        self.original = original
+
+    def write(self, texto: str) -> int:
+        rastro = _rastro_atual.get()
+        if rastro is None:
+            return self.original.write(texto)
+        rastro.escrever(texto)
+        return len(texto)
+
+    def flush(self):
+        if _rastro_atual.get() is None:
+            self.original.flush()
+
+    def isatty(self) -> bool:
+        # Sem terminal durante o rastro, o rich não gera códigos de cor no texto guardado
+        return _rastro_atual.get() is None and self.original.isatty()
+
+    def writable(self) -> bool:
+        return True
+
+    def fileno(self) -> int:
+        return self.original.fileno()
+
+    @property
+    def encoding(self):
+        return getattr(self.original, "encoding", "utf-8")
+
+
+class ColetorRastros:
+    def __init__(self, diretorio: str = "./rastros", amostragem: float = 0.0,
+                 limite_bytes_requisicao: int = LIMITE_BYTES_REQUISICAO, limite_saida_bytes: int = LIMITE_SAIDA_BYTES,
+                 max_em_memoria: int = MAX_EM_MEMORIA, max_disco_mb: float = MAX_DISCO_MB):
+        self.diretorio = diretorio
+        self.amostragem = amostragem
+        self.limite_bytes_requisicao = limite_bytes_requisicao
+        self.limite_saida_bytes = limite_saida_bytes
+        self.max_em_memoria = max_em_memoria
+        self.max_disco_bytes = int(max_disco_mb * 1024 * 1024)
+        self.saida_original = sys.stdout
+        self.descartados = 0
+        self._recentes = OrderedDict()
+        self._lock = threading.Lock()
+        self._fila = queue.Queue(maxsize=TAMANHO_FILA)
+        self._instalado = False
+
+    def instalar(self):
+        """Troca o sys.stdout pelo proxy e inicia a thread de escrita (idempotente)."""
+        if self._instalado:
+            return
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.saida_original = sys.stdout
+        sys.stdout = SaidaRoteada(self.saida_original)
+        threading.Thread(target=self._escritor, name="rastros", daemon=True).start()
+        self._instalado = True
+
+    @contextmanager
+    def rastrear(self, user_id: str, pergunta: str):
+        if not self._instalado:
+            yield None
+            return
+        rastro = RastroRequisicao(user_id, pergunta, self.limite_bytes_requisicao)
+        with self._lock:
+            self._recentes[rastro.id] = rastro
+            while len(self._recentes) > self.max_em_memoria:
+                self._recentes.popitem(last=False)
+        logger.info(f"🧵 Rastro {rastro.id} (user={user_id})")
+        token = _rastro_atual.set(rastro)
+        try:
+            yield rastro
+        except BaseException as e:
+            rastro.erro = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _rastro_atual.reset(token)
+            rastro.fim = time.time()
+            try:
+                self._fila.put_nowait(rastro)
+            except queue.Full:
+                self.descartados += 1  # o rastro continua disponível em memória enquanto estiver entre os recentes
+
+    def obter(self, rastro_id: str) -> str | None:
+        with self._lock:
+            rastro = self._recentes.get(rastro_id)
+        if rastro is not None:
+            return rastro.texto()
+        caminho = os.path.join(self.diretorio, f"{os.path.basename(rastro_id)}.log.gz")
+        try:
+            with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def listar(self, limite: int = 20) -> list:
+        with self._lock:
+            recentes = list(self._recentes.values())[-limite:]
+        return [r.resumo() for r in reversed(recentes)]
+
+    def _escritor(self):
+        while True:
+            rastro = self._fila.get()
+            try:
+                texto = rastro.texto()
+                with gzip.open(os.path.join(self.diretorio, f"{rastro.id}.log.gz"), "wt", encoding="utf-8") as f:
+                    f.write(texto)
+                if rastro.erro or random.random() < self.amostragem:
+                    if len(texto) > self.limite_saida_bytes:
+                        texto = texto[:self.limite_saida_bytes] + f"\n# [... truncado, rastro completo: {rastro.id} ...]\n"
+                    self.saida_original.write(texto if texto.endswith("\n") else texto + "\n")
+                    self.saida_original.flush()
+                self._limitar_disco()
+            except Exception as e:
+                logger.error(f"Erro ao gravar rastro {rastro.id}: {e}")
+
+    def _limitar_disco(self):
+        """Remove os rastros mais antigos quando o diretório passa de max_disco_mb (compartilhado entre workers)."""
+        arquivos = []
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.endswith(".log.gz"):
+                try:
+                    estado = entrada.stat()
+                except OSError:
+                    continue
+                arquivos.append((estado.st_mtime, estado.st_size, entrada.path))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.max_disco_bytes:
+                break
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+            total -= tamanho